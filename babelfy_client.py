@@ -0,0 +1,213 @@
+import os
+import json
+import asyncio
+import argparse
+from collections import defaultdict
+
+import aiohttp
+
+from response_cache import MISSING, TTL, ResponseCache
+from wikidata_client import RETRY_STATUSES, TokenBucket, get_retry_delay
+
+
+# Babelfy client for `babelfy.ipynb`: a play text is split at utterance
+# boundaries (newlines) into chunks of at most MAX_CHUNK_CHARS,
+# chunks are sent concurrently with a rate limit and retries,
+# and `charFragment` offsets of the annotations are mapped back to the play text.
+# Responses are cached per chunk (see `response_cache.py`; the key is not stored),
+# so only changed chunks are sent again.
+# Parameters: http://babelfy.org/guide
+
+
+SERVICE_URL = 'https://babelfy.io/v1/disambiguate'
+LOCATION_IDXS_FILENAME = os.path.join('intermediate_data_files', 'plays_with_location_indices.json')
+OUTPUT_FILENAME = os.path.join('intermediate_data_files', 'babelfy_outputs.json')
+
+LANGS = {'span': 'ES', 'rus': 'RU'}
+ANNOTATION_TYPE = 'NAMED_ENTITIES'
+MATCHING = 'EXACT_MATCHING'
+
+MAX_CHUNK_CHARS = 3000
+MAX_CONCURRENCY = 4
+RATE = 2  # requests per second
+TIMEOUT = 120  # seconds
+MAX_RETRIES = 5
+
+
+class BabelfyError(Exception):
+    pass
+
+
+def split_text(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Split text into chunks of at most `max_chars` at newlines
+    (at spaces inside longer utterances).
+    Return [(offset of the chunk in the text, chunk), ...].
+    """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = len(text)
+        if end - start > max_chars:
+            end = text.rfind('\n', start, start + max_chars + 1)
+            if end <= start:
+                end = text.rfind(' ', start, start + max_chars + 1)
+            if end <= start:
+                end = start + max_chars
+        if text[start:end].strip():
+            chunks.append((start, text[start:end]))
+        start = end + 1 if end < len(text) and text[end] in '\n ' else end
+    return chunks
+
+
+def shift_annotation(annotation, offset):
+    """Map `charFragment` of the annotation from chunk to text offsets."""
+    annotation = dict(annotation)
+    annotation['charFragment'] = {
+        'start': annotation['charFragment']['start'] + offset,
+        'end': annotation['charFragment']['end'] + offset
+    }
+    return annotation
+
+
+class BabelfyClient:
+    """
+    Usage:
+        async with BabelfyClient(key) as client:
+            annotations = await client.link_text(text, 'RU')
+    """
+    def __init__(
+            self,
+            key,
+            url=SERVICE_URL,
+            concurrency=MAX_CONCURRENCY,
+            rate=RATE,
+            timeout=TIMEOUT,
+            max_retries=MAX_RETRIES,
+            max_chunk_chars=MAX_CHUNK_CHARS,
+            cache=None
+    ):
+        self.key = key
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.max_chunk_chars = max_chunk_chars
+        self.cache = cache
+        self.bucket = TokenBucket(rate, max(1, concurrency))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def request(self, params):
+        """POST the request with rate limit and retries."""
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            await self.bucket.acquire()
+            async with self.semaphore:
+                try:
+                    async with self.session.post(self.url, data=params, timeout=self.timeout) as r:
+                        if r.status in RETRY_STATUSES and not is_last:
+                            delay = get_retry_delay(attempt, r)
+                        else:
+                            r.raise_for_status()
+                            return await r.json(content_type=None)
+                except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                    if is_last:
+                        raise
+                    delay = get_retry_delay(attempt)
+
+            await asyncio.sleep(delay)
+
+    async def disambiguate(self, text, lang):
+        """Annotations of one chunk (or cached ones)."""
+        params = {
+            'text': text,
+            'lang': lang,
+            'key': self.key,
+            'annType': ANNOTATION_TYPE,
+            'match': MATCHING
+        }
+        if self.cache is not None:
+            response = self.cache.get(self.url, params, MISSING)
+            if response is not MISSING:
+                return response
+
+        response = await self.request(params)
+        # errors (e.g. invalid key or exceeded limit) come as {"message": ...}
+        if not isinstance(response, list):
+            raise BabelfyError(response.get('message', response))
+
+        if self.cache is not None:
+            self.cache.set(self.url, params, response)
+        return response
+
+    async def link_text(self, text, lang):
+        """Annotations of the whole text with offsets in the text."""
+        chunks = split_text(text, self.max_chunk_chars)
+        responses = await asyncio.gather(*[
+            self.disambiguate(chunk, lang) for _, chunk in chunks
+        ])
+        return [
+            shift_annotation(annotation, offset)
+            for (offset, _), annotations in zip(chunks, responses)
+            for annotation in annotations
+        ]
+
+
+async def link_plays(texts, key, url=SERVICE_URL, concurrency=MAX_CONCURRENCY, rate=RATE, cache=None):
+    """
+    Annotate texts of all plays ({lang: {playname: [text, locations]}},
+    see `create_plays_with_location_indices.py`) concurrently.
+    Return {lang: {playname: annotations}}.
+    """
+    async with BabelfyClient(key, url, concurrency, rate, cache=cache) as client:
+        plays = [
+            (lang, playname, text)
+            for lang, lang_plays in texts.items()
+            for playname, (text, _) in lang_plays.items()
+        ]
+        outputs = await asyncio.gather(*[
+            client.link_text(text, LANGS[lang]) for lang, _, text in plays
+        ])
+
+    babelfy_outputs = defaultdict(dict)
+    for (lang, playname, _), output in zip(plays, outputs):
+        babelfy_outputs[lang][playname] = output
+    return dict(babelfy_outputs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=SERVICE_URL, help='Babelfy endpoint (e.g. a local stand-in)')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help='max simultaneous requests')
+    parser.add_argument('--rate', type=float, default=RATE, help='max requests per second')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the response cache')
+    parser.add_argument('--cache-ttl', type=float, default=TTL, help='max age of cached responses, in seconds')
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='only replay cached responses; fail on cache misses'
+    )
+    args = parser.parse_args(argv)
+
+    from secrets import babelfy_key
+
+    with open(LOCATION_IDXS_FILENAME) as f:
+        texts = json.load(f)
+
+    cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl, offline=args.offline)
+    babelfy_outputs = asyncio.run(link_plays(texts, babelfy_key, args.url, args.concurrency, args.rate, cache))
+
+    with open(OUTPUT_FILENAME, 'w') as f:
+        json.dump(babelfy_outputs, f, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
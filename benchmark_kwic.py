@@ -0,0 +1,75 @@
+import re
+import os
+from time import perf_counter
+
+from lxml import etree
+
+from corpus_index import (
+    CORPUS_FOLDER,
+    LANGS,
+    NAMESPACE,
+    SPACE_REGEX,
+    TEXT_XPATH,
+    UTTERANCE_XPATH,
+    get_playnames,
+    get_utterance_markup
+)
+
+
+# Compare per-utterance cost of KWIC extraction on the whole corpus:
+# serializing <p> tags and searching locations with regexes (old approach)
+# vs walking the tree (`corpus_index.get_utterance_markup`).
+
+P_REGEX = re.compile(r'<p.*?>(.+?)</p>')
+LOC_REGEX = re.compile(r'(<loc(.*?)>(.+?)</loc>)')
+N_RUNS = 5
+
+
+def get_utterance_markup_regex(p_tags):
+    """Old KWIC extraction: serialize <p> tags and parse them with regexes."""
+    curr_utterance = ''
+    for p in p_tags:
+        xml_str = etree.tostring(p, encoding='utf-8').decode('utf-8')
+        curr_utterance += ' ' + P_REGEX.sub(r'\1', xml_str)
+    curr_utterance = SPACE_REGEX.sub(' ', curr_utterance)
+
+    locs = [
+        [loc.start(), loc.end(), loc.group(3), 'from="manual"' in loc.group(2)]
+        for loc in LOC_REGEX.finditer(curr_utterance)
+    ]
+    return curr_utterance, locs
+
+
+def get_corpus_p_tags():
+    """Parse the corpus and collect <p> tags of every utterance."""
+    utterances = []
+    for lang in LANGS:
+        for filename in get_playnames(lang):
+            tree = etree.parse(os.path.join(CORPUS_FOLDER, lang, filename))
+            for utterance in tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE):
+                utterances.append(utterance.xpath(TEXT_XPATH, namespaces=NAMESPACE))
+    return utterances
+
+
+def time_extraction(extract, utterances):
+    """Best time over N_RUNS runs of extraction over all utterances."""
+    times = []
+    for _ in range(N_RUNS):
+        start = perf_counter()
+        for p_tags in utterances:
+            extract(p_tags)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    utterances = get_corpus_p_tags()
+    n = len(utterances)
+    print(f'{n} utterances')
+
+    for name, extract in [
+        ('serialize + regex', get_utterance_markup_regex),
+        ('tree walk', get_utterance_markup)
+    ]:
+        total = time_extraction(extract, utterances)
+        print(f'{name}: {total:.3f} s, {total / n * 1e6:.1f} us per utterance')
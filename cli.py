@@ -0,0 +1,46 @@
+import sys
+import argparse
+from importlib import import_module
+
+
+# One entry point for the processing steps:
+#   python cli.py <command> [options]   (`python cli.py <command> -h` for options)
+# A command module is imported only when the command is run,
+# so offline commands (e.g. `rank`, `tune`) do not load NLP models,
+# the ontology, or network configuration (`secrets.py`).
+
+
+# command -> (module, arguments prepended to the command's arguments, description)
+COMMANDS = {
+    'ner': ('parse_ner', [], 'find locations in DraCor plays with Stanza (autoparsed corpus)'),
+    'kwic': ('create_kwic', [], 'create KWIC table of locations from the final corpus'),
+    'normalize': ('create_location_list', [], 'create the list of unique locations with normalized forms'),
+    'candidates': ('wikidata', ['stats'], 'collect Wikidata candidates with stats for unique locations'),
+    'index': ('wikidata_index', [], 'build an offline Wikidata index from a dump, or collect candidates from it'),
+    'rank': ('ranking', [], 'rank candidates with the scoring formula'),
+    'tune': ('find_coefficients', [], 'find optimal coefficients for the ranking formula'),
+    'hyperlinks': ('create_location_hyperlinks', [], 'create hyperlinked candidate lists for KWIC rows'),
+    'ontology': ('ontology', [], 'compile the ontology of plays, speakers and locations'),
+    'query': ('ontology_query', [], 'query plays, speakers and locations of the compiled ontology')
+}
+
+
+def main(argv=None):
+    commands_help = '\n'.join(
+        f'  {name:<12}{description}' for name, (_, _, description) in COMMANDS.items()
+    )
+    parser = argparse.ArgumentParser(
+        epilog=f'commands:\n{commands_help}',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='options of the command')
+    args = parser.parse_args(argv)
+
+    module_name, prefix, _ = COMMANDS[args.command]
+    sys.argv[0] = f'{parser.prog} {args.command}'
+    import_module(module_name).main(prefix + args.args)
+
+
+if __name__ == '__main__':
+    main()
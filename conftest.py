@@ -0,0 +1,47 @@
+import pytest
+
+
+CORPUS_INFO = {
+    'rus': {
+        'bulgakov-beg.xml': {
+            'title': 'Бег',
+            'speakers': {'golubkov': 'Голубков', 'serafima': 'Серафима'},
+            'locations': {
+                'golubkov': {'Петербург': 3, 'Крым': 6},
+                'serafima': {'Новый Свет': 1},
+                'charnota': {'Крым': 2}  # not in the speaker list
+            }
+        }
+    },
+    'span': {
+        'valle-luces.xml': {
+            'title': 'Luces de bohemia',
+            'speakers': {'max': 'Max Estrella'},
+            'locations': {'max': {'Madrid': 4, 'Calle de Bastardillos': 1}}
+        }
+    }
+}
+LINKS = {
+    'ru': {'Петербург': ['Q656'], 'Крым': ['Q7835'], 'Новый Свет': []},
+    'es': {'Madrid': ['Q2807'], 'Calle de Bastardillos': []}
+}
+
+
+@pytest.fixture(scope='session')
+def ontology_files(tmp_path_factory):
+    """
+    The ontology of CORPUS_INFO saved by `ontology.py` and by `ontology.py --bulk`.
+    Built once: individuals are added to the module-level ontology.
+    """
+    import ontology
+
+    folder = tmp_path_factory.mktemp('ontology')
+    owl_path = str(folder / 'locations.owl')
+    nt_path = str(folder / 'locations.nt')
+
+    # the bulk writer saves `onto` before individuals are created
+    ontology.write_ontology_bulk(CORPUS_INFO, LINKS, nt_path)
+    location_objs = ontology.create_location_objs(LINKS)
+    ontology.compile_ontology(CORPUS_INFO, LINKS, location_objs)
+    ontology.onto.save(owl_path)
+    return owl_path, nt_path
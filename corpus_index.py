@@ -0,0 +1,432 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+
+# Parse every play of the final corpus once and cache a compact record
+# for it, so that all downstream scripts read the records instead of XML.
+# A record is rebuilt only when the content of its XML file changes.
+
+
+NAMESPACE = {
+    'ns': 'http://www.tei-c.org/ns/1.0',
+    'xml': 'http://www.w3.org/XML/1998/namespace'
+}
+UTTERANCE_XPATH = '//ns:sp'
+TEXT_XPATH = './ns:p'
+TITLE_XPATH = '//ns:title[@type="main"]'
+SPEAKER_XPATH = '//ns:particDesc/ns:listPerson/ns:person'
+
+TEI_TAG_PREFIX = f'{{{NAMESPACE["ns"]}}}'
+LOC_START = '\ue000'
+LOC_END = '\ue001'
+LOC_MARKER_REGEX = re.compile(f'[{LOC_START}{LOC_END}]')
+ATTR_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\t': '&#9;', '\r': '&#13;'}
+
+SPACE_REGEX = re.compile(r'\s+')
+
+CORPUS_FOLDER = os.path.join('corpus', 'final')
+INDEX_FOLDER = os.path.join('intermediate_data_files', 'corpus_index')
+INDEX_VERSION = 3  # increment when the record format or extraction changes
+
+LANGS = {
+    'rus': 'ru',
+    'span': 'es'
+}
+
+
+def get_attr_name(key):
+    qname = etree.QName(key)
+    if qname.namespace == NAMESPACE['xml']:
+        return f'xml:{qname.localname}'
+    return qname.localname
+
+
+def get_start_tag(elem, tag):
+    """Serialize the start tag of a TEI element the same way as lxml does."""
+    attrs = ''.join(
+        f' {get_attr_name(key)}="{escape(value, ATTR_ENTITIES)}"'
+        for key, value in elem.attrib.items()
+    )
+    return f'<{tag}{attrs}>'
+
+
+def add_element_markup(chunks, elem, loc_names):
+    """
+    Add markup of an element and its contents (but not its tail) to chunks.
+    <loc> elements are enclosed in LOC_START / LOC_END markers,
+    their text content without nested tags is added to `loc_names`.
+    """
+    if not isinstance(elem.tag, str) or not elem.tag.startswith(TEI_TAG_PREFIX):
+        # comments, processing instructions and foreign elements are rare,
+        # so they are serialized by lxml
+        chunks.append(etree.tostring(elem, encoding='unicode', with_tail=False))
+        return
+
+    tag = elem.tag[len(TEI_TAG_PREFIX):]
+    is_loc = tag == 'loc'
+    if is_loc:
+        chunks.append(LOC_START)
+        loc_names.append((
+            escape(''.join(elem.itertext())),
+            elem.get('from') == 'manual'
+        ))
+
+    start_tag = get_start_tag(elem, tag) if elem.attrib else f'<{tag}>'
+    if elem.text is None and not len(elem):
+        chunks.append(start_tag[:-1] + '/>')
+    else:
+        chunks.append(start_tag)
+        add_contents_markup(chunks, elem, loc_names)
+        chunks.append(f'</{tag}>')
+
+    if is_loc:
+        chunks.append(LOC_END)
+
+
+def add_contents_markup(chunks, elem, loc_names):
+    """Add text and children of an element (with their tails) to chunks."""
+    if elem.text:
+        chunks.append(escape(elem.text))
+
+    for child in elem:
+        add_element_markup(chunks, child, loc_names)
+        if child.tail:
+            chunks.append(escape(child.tail))
+
+
+def get_utterance_markup(p_tags):
+    """
+    Compile the utterance string with the inline markup of <p> tags
+    and find spans of all locations in it.
+    The string is built by walking the tree; locations are marked
+    while walking and their offsets are taken after whitespace normalization.
+    Each location is [start, end, name, is_manual].
+    """
+    chunks = []
+    loc_names = []
+
+    for p in p_tags:
+        chunks.append(' ')
+        add_contents_markup(chunks, p, loc_names)
+        if p.tail:
+            chunks.append(escape(p.tail))
+
+    curr_utterance = SPACE_REGEX.sub(' ', ''.join(chunks))
+    if not loc_names:
+        return curr_utterance, []
+
+    # markers are never surrounded by whitespace from both sides
+    # (they are adjacent to the tags), so they do not affect normalization
+    locs = []
+    open_locs = []
+    for n_markers, marker in enumerate(LOC_MARKER_REGEX.finditer(curr_utterance)):
+        offset = marker.start() - n_markers
+        if marker.group() == LOC_START:
+            name, is_manual = loc_names[len(locs)]
+            open_locs.append(len(locs))
+            locs.append([offset, None, SPACE_REGEX.sub(' ', name), is_manual])
+        else:
+            locs[open_locs.pop()][1] = offset
+
+    curr_utterance = LOC_MARKER_REGEX.sub('', curr_utterance)
+    return curr_utterance, locs
+
+
+def get_text_parts(p_tag):
+    """
+    In <p> tag, separate raw text and locations.
+    Treat `note` tags as nested <p>, leave out `stage` tags,
+    keep only text of all other tags.
+    Locations are stored as {'loc': text}.
+    """
+    parts = [' ']
+
+    if p_tag.text:
+        parts.append(p_tag.text)
+
+    for child in p_tag:
+        if child.tag == f'{{{NAMESPACE["ns"]}}}note':
+            parts += get_text_parts(child)
+            continue
+
+        if child.tag == f'{{{NAMESPACE["ns"]}}}loc':
+            parts.append({'loc': child.text})
+        elif child.tag != f'{{{NAMESPACE["ns"]}}}stage':
+            parts.append(child.text or '')
+
+        if child.tail:
+            parts.append(child.tail)
+
+    return parts
+
+
+def get_play_title(tree):
+    titles = tree.xpath(TITLE_XPATH, namespaces=NAMESPACE)
+    for title in titles:
+        lang = title.attrib.get(f'{{{NAMESPACE["xml"]}}}lang')
+        if lang is None:
+            return title.text
+
+
+def get_play_speakers(tree):
+    speakers = {}
+    speaker_elems = tree.xpath(SPEAKER_XPATH, namespaces=NAMESPACE)
+    for speaker_elem in speaker_elems:
+        sp_id = speaker_elem.attrib.get(f'{{{NAMESPACE["xml"]}}}id')
+        name = ''
+        for child in speaker_elem:
+            lang = child.attrib.get(f'{{{NAMESPACE["xml"]}}}lang')
+            if child.tag == f"{{{NAMESPACE['ns']}}}persName" and lang is None:
+                name = child.text
+                break
+
+        speakers[sp_id] = name
+
+    return speakers
+
+
+def parse_utterance(utterance):
+    """
+    Create a record for one <sp> element.
+    `loc_texts` are texts of all <loc> elements of the utterance at any depth
+    (also outside <p>), as counted by `ontology.py`.
+    """
+    p_tags = utterance.xpath(TEXT_XPATH, namespaces=NAMESPACE)
+    markup, locs = get_utterance_markup(p_tags)
+    return {
+        'who': utterance.get('who').strip('#'),
+        'markup': markup,
+        'locs': locs,
+        'paragraphs': [get_text_parts(p) for p in p_tags],
+        'loc_texts': [loc.text for loc in utterance.iter(f'{TEI_TAG_PREFIX}loc')]
+    }
+
+
+def parse_play(xml):
+    """Parse play XML (bytes) into a record."""
+    tree = etree.ElementTree(etree.fromstring(xml))
+    utterances = tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE)
+
+    return {
+        'title': get_play_title(tree),
+        'speakers': get_play_speakers(tree),
+        'utterances': [parse_utterance(u) for u in utterances]
+    }
+
+
+def iter_utterances(xml_path):
+    """
+    Stream utterance records from play XML without building the whole tree.
+    Each <sp> element is cleared after processing
+    together with everything before it, so memory stays flat.
+    """
+    context = etree.iterparse(
+        xml_path,
+        events=('end',),
+        tag=f'{{{NAMESPACE["ns"]}}}sp'
+    )
+    for _, utterance in context:
+        yield parse_utterance(utterance)
+
+        utterance.clear(keep_tail=True)
+        while utterance.getprevious() is not None:
+            del utterance.getparent()[0]
+
+    del context
+
+
+def parse_play_header(xml_path):
+    """
+    Get title and speakers of the play,
+    parsing only <teiHeader> of the XML.
+    """
+    context = etree.iterparse(
+        xml_path,
+        events=('end',),
+        tag=f'{{{NAMESPACE["ns"]}}}teiHeader'
+    )
+    _, header = next(context)
+    tree = etree.ElementTree(header)
+    del context
+
+    return {
+        'title': get_play_title(tree),
+        'speakers': get_play_speakers(tree)
+    }
+
+
+def get_record_path(lang, filename):
+    return os.path.join(INDEX_FOLDER, lang, filename[:-4] + '.json')
+
+
+def load_play(lang, filename):
+    """
+    Get the record of one play from the index.
+    Parse the play and update the index if the XML has changed.
+    """
+    with open(os.path.join(CORPUS_FOLDER, lang, filename), 'rb') as f:
+        xml = f.read()
+    source_hash = hashlib.md5(xml).hexdigest()
+
+    record_path = get_record_path(lang, filename)
+    if os.path.exists(record_path):
+        with open(record_path) as f:
+            record = json.load(f)
+        is_valid = (
+            record.get('version') == INDEX_VERSION
+            and record['source_hash'] == source_hash
+        )
+        if is_valid:
+            return record
+
+    record = parse_play(xml)
+    record['version'] = INDEX_VERSION
+    record['source_hash'] = source_hash
+
+    # write to a temporary file and rename it, so that stages running
+    # at the same time never read a half-written record
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(record_path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, record_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return record
+
+
+def get_playnames(lang, folder=CORPUS_FOLDER):
+    """Get XML filenames of the plays in one language, sorted."""
+    lang_folder = os.path.join(folder, lang)
+    return sorted(fn for fn in os.listdir(lang_folder) if fn.endswith('.xml'))
+
+
+def get_plays(folder=CORPUS_FOLDER):
+    """Get (lang, filename) of all plays, ordered by language, then filename."""
+    return [(lang, fn) for lang in LANGS for fn in get_playnames(lang, folder)]
+
+
+def map_plays(func, plays=None, jobs=1):
+    """
+    Apply `func(lang, filename)` to every play
+    (all plays of the final corpus by default).
+    With jobs > 1, plays are processed in a pool of worker processes.
+    Results are returned as (lang, filename, result)
+    in the order of `plays`, independently of the number of jobs.
+    """
+    if plays is None:
+        plays = get_plays()
+
+    if jobs > 1 and len(plays) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(func, *zip(*plays)))
+    else:
+        results = [func(lang, filename) for lang, filename in plays]
+
+    return [
+        (lang, filename, result)
+        for (lang, filename), result in zip(plays, results)
+    ]
+
+
+def iter_corpus():
+    """Yield (lang, filename, record) for every play in the corpus."""
+    for lang, filename in get_plays():
+        yield lang, filename, load_play(lang, filename)
+
+
+def render_parts(parts, target=None):
+    """
+    Compile text from parts.
+    If `target` is None, annotate all locations with [START] and [END];
+    otherwise annotate only location number `target`
+    and write other locations as raw text.
+    """
+    texts = []
+    loc_i = 0
+    for part in parts:
+        if isinstance(part, str):
+            texts.append(part)
+            continue
+
+        if target is None:
+            texts.append(f'[START] {part["loc"]} [END]')
+        elif target == loc_i:
+            texts.append(f'[START] {part["loc"]} [END] ')
+        else:
+            texts.append(part['loc'])
+        loc_i += 1
+
+    return SPACE_REGEX.sub(' ', ''.join(texts)).strip()
+
+
+def get_location_texts(record):
+    """
+    Create a text with annotated locations for each utterance
+    (input for babelfy).
+    """
+    return [
+        render_parts([part for p in utterance['paragraphs'] for part in p])
+        for utterance in record['utterances']
+    ]
+
+
+def get_single_location_parts(record):
+    """
+    Yield parts of the text for each utterance with locations (input for GENRE).
+    Include the last <p> tag of the previous utterance
+    for more informative left context; its locations are raw text.
+    """
+    prev_parts = []
+    for utterance in record['utterances']:
+        if not utterance['paragraphs']:
+            prev_parts = []
+            continue
+
+        if utterance['locs']:
+            # locations from the previous utterance are not annotated
+            prev_text = [
+                part if isinstance(part, str) else part['loc']
+                for part in prev_parts
+            ]
+            yield prev_text + [' '] + [
+                part for p in utterance['paragraphs'] for part in p
+            ]
+
+        prev_parts = utterance['paragraphs'][-1]
+
+
+def get_single_location_texts(record):
+    """
+    Create a separate text for each location in the play
+    where only this location is annotated (input for GENRE).
+    """
+    texts = []
+    for parts in get_single_location_parts(record):
+        n_locs = sum(not isinstance(part, str) for part in parts)
+        texts += [render_parts(parts, target=i) for i in range(n_locs)]
+    return texts
+
+
+def count_utterances(lang, filename):
+    return len(load_play(lang, filename)['utterances'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    args = parser.parse_args()
+
+    for lang, filename, n_utterances in map_plays(count_utterances, jobs=args.jobs):
+        print(lang, filename, n_utterances)
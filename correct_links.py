@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+
+
+# Gold Wikidata links of location mentions (`disambiguation_annotation/correct_links.csv`).
+# The file has a row for each row of the KWIC table (`create_kwic.py`)
+# with its language, play and location, and comma-separated Wikidata IDs.
+# Rows are checked against the KWIC table, so that links
+# cannot silently move to other mentions when the KWIC order changes.
+
+
+DATA_DIR = 'intermediate_data_files'
+ANN_DIR = 'disambiguation_annotation'
+KWIC_FILENAME = os.path.join(DATA_DIR, 'location_kwic.csv')
+CORRECT_LINKS_FILENAME = os.path.join(ANN_DIR, 'correct_links.csv')
+
+KEY_COLUMNS = ['lang', 'play', 'location']
+
+
+def parse_links(raw_link):
+    raw_link = raw_link.strip().strip(',')
+    return set(raw_link.split(',')) if raw_link else set()
+
+
+def read_correct_links(kwic_path=KWIC_FILENAME, links_path=CORRECT_LINKS_FILENAME):
+    """
+    Read gold links of all KWIC rows: [(lang, location, set of Wikidata IDs), ...]
+    in the order of the KWIC table.
+    """
+    kwic = pd.read_csv(kwic_path, sep='\t', keep_default_na=False)
+    gold = pd.read_csv(links_path, keep_default_na=False, dtype=str)
+
+    assert len(gold) == len(kwic), f'{len(gold)} gold rows for {len(kwic)} KWIC rows'
+    kwic_keys = kwic[KEY_COLUMNS].astype(str).itertuples(index=False)
+    for i, (kwic_key, gold_key) in enumerate(zip(kwic_keys, gold[KEY_COLUMNS].itertuples(index=False))):
+        assert tuple(kwic_key) == tuple(gold_key), f'row {i}: KWIC {tuple(kwic_key)}, gold {tuple(gold_key)}'
+
+    return [
+        (lang, location, parse_links(raw_link))
+        for lang, location, raw_link in zip(gold.lang, gold.location, gold.links)
+    ]
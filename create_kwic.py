@@ -1,99 +1,89 @@
 import os
-import re
+import csv
+import argparse
 
 import pandas as pd
-from lxml import etree
 
+from corpus_index import (
+    CORPUS_FOLDER,
+    get_plays,
+    iter_utterances,
+    load_play,
+    map_plays
+)
 
-NAMESPACE = {'ns': 'http://www.tei-c.org/ns/1.0'}
-UTTERANCE_XPATH = '//ns:sp'
-TEXT_XPATH = './ns:p'
 
-P_REGEX = re.compile(r'<p.*?>(.+?)</p>')
-LOC_REGEX = re.compile(r'(<loc(.*?)>(.+?)</loc>)')
-SPACE_REGEX = re.compile(r'\s+')
-
-CORPUS_FOLDER = os.path.join('corpus', 'final')
 KWIC_FILENAME = os.path.join('intermediate_data_files', 'location_kwic.csv')
-
-LANGS = {
-    'rus': 'ru',
-    'span': 'es'
-}
+KWIC_COLUMNS = [
+    'lang',
+    'play',
+    'extraction_mode',
+    'prev_utterance',
+    'utterance_left',
+    'location',
+    'utterance_right'
+]
 
 
 def process_utterance(lang, play, utterance, prev_utterance):
     """Compile kwic for one utterance."""
+    curr_utterance = utterance['markup']
     curr_locs = []
 
-    p_tags = utterance.xpath(TEXT_XPATH, namespaces=NAMESPACE)
-    curr_utterance = ''
-    for p in p_tags:
-        xml_str = etree.tostring(p, encoding='utf-8').decode('utf-8')
-        curr_utterance += ' ' + P_REGEX.sub(r'\1', xml_str)
-    curr_utterance = SPACE_REGEX.sub(' ', curr_utterance)
-
-    for loc in LOC_REGEX.finditer(curr_utterance):
-        mode = 'fixed' if 'from="manual"' in loc.group(2) else 'auto'
+    for start, end, location, is_manual in utterance['locs']:
+        mode = 'fixed' if is_manual else 'auto'
         curr_locs.append([
             lang,
             play,
             mode,
             prev_utterance,
-            curr_utterance[:loc.start()],
-            loc.group(3),
-            curr_utterance[loc.end():],
+            curr_utterance[:start],
+            location,
+            curr_utterance[end:],
         ])
 
     return curr_utterance, curr_locs
 
 
-def process_play(lang, folder, filename):
-    """Compile kwic for one play."""
-    with open(os.path.join(folder, filename)) as f:
-        tree = etree.parse(f)
-
+def iter_play_kwic(lang, filename, utterances):
+    """
+    Yield kwic rows for one play.
+    Only the previous utterance is kept between iterations.
+    """
     play = filename[:-4]
-    play_kwic = []
 
     prev_utterance = ''
-    utterances = tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE)
-
     for utterance in utterances:
         curr_utterance, utt_kwic = process_utterance(
             lang, play, utterance, prev_utterance
         )
-        play_kwic += utt_kwic
+        yield from utt_kwic
         prev_utterance = curr_utterance
 
-    return play_kwic
+
+def process_play(lang, filename, record):
+    """Compile kwic for one play."""
+    return list(iter_play_kwic(lang, filename, record['utterances']))
+
+
+def get_play_kwic(lang, filename):
+    """Compile kwic for one play from the corpus index."""
+    return process_play(lang, filename, load_play(lang, filename))
 
 
-def get_kwic_df():
+def get_kwic_df(jobs=1):
     """
     Compile kwic for all plays
     and write to KWIC_FILENAME file.
+    Plays are processed in `jobs` processes;
+    rows are ordered by language, play, and position in the play.
     """
     kwic = []
 
-    for lang, wikilang in LANGS.items():
-        folder = os.path.join(CORPUS_FOLDER, lang)
-        for filename in os.listdir(folder):
-            if filename.endswith('.xml'):
-                kwic += process_play(lang, folder, filename)
-
-    df = pd.DataFrame(
-        kwic,
-        columns=[
-            'lang',
-            'play',
-            'extraction_mode',
-            'prev_utterance',
-            'utterance_left',
-            'location',
-            'utterance_right'
-        ]
-    )
+    for _, _, play_kwic in map_plays(get_play_kwic, jobs=jobs):
+        kwic += play_kwic
+
+    df = pd.DataFrame(kwic, columns=KWIC_COLUMNS)
 
     df.to_csv(
         KWIC_FILENAME,
@@ -102,5 +92,38 @@ def get_kwic_df():
     )
 
 
+def stream_kwic():
+    """
+    Compile kwic for all plays streaming them from XML
+    utterance by utterance and write rows to KWIC_FILENAME
+    as soon as they are found.
+    The output is the same as in `get_kwic_df`.
+    """
+    with open(KWIC_FILENAME, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(KWIC_COLUMNS)
+
+        for lang, filename in get_plays():
+            xml_path = os.path.join(CORPUS_FOLDER, lang, filename)
+            utterances = iter_utterances(xml_path)
+            writer.writerows(iter_play_kwic(lang, filename, utterances))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='create KWIC table of locations from the final corpus')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='stream plays from XML with bounded memory instead of the corpus index'
+    )
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    if args.stream:
+        stream_kwic()
+    else:
+        get_kwic_df(args.jobs)
+
+
 if __name__ == '__main__':
-    get_kwic_df()
+    main()
@@ -1,12 +1,15 @@
 import os
 import json
+import argparse
 from collections import Counter
 
+import numpy as np
 import pandas as pd
 
 
 TOP_LINKS = 5
 GENRE_THRESHOLD = -0.65
+CHUNK_SIZE = 100_000  # KWIC rows joined and written at once
 
 DATA_DIR = 'intermediate_data_files'
 KWIC_FILENAME = os.path.join(DATA_DIR, 'location_kwic.csv')
@@ -23,10 +26,42 @@ LANGS = {
 }
 
 
-def hyperlink_str(score_tuple):
-    """Create a hyperlink formula for Google Sheets."""
-    id_, _, link = score_tuple
-    return f'=HYPERLINK("{link}";"{id_}")'
+def hyperlink_column(ids, links):
+    """Create hyperlink formulas for Google Sheets from columns of ids and links."""
+    return '=HYPERLINK("' + links + '";"' + ids + '")'
+
+
+def get_link_table(rankings, keys):
+    """
+    Build a table with top-TOP_LINKS hyperlinks in columns HEADER,
+    indexed by `keys`, from {key tuple: ranking} mapping.
+    """
+    ranks = pd.DataFrame(
+        [
+            (*key, rank, id_, link)
+            for key, loc_scores in rankings.items()
+            for rank, (id_, _, link) in enumerate(loc_scores[:TOP_LINKS])
+        ],
+        columns=keys + ['rank', 'id', 'link']
+    )
+    ranks['hyperlink'] = hyperlink_column(ranks['id'].astype(str), ranks['link'].astype(str))
+
+    table = ranks.pivot(index=keys, columns='rank', values='hyperlink')
+    table = table.reindex(columns=range(TOP_LINKS))
+    table.columns = HEADER
+    return table.reset_index()
+
+
+def write_links(df, table, keys, filename):
+    """
+    Join the link table to KWIC rows by `keys`
+    and write link columns to tsv chunk by chunk.
+    """
+    with open(filename, 'w') as f:
+        for start in range(0, max(len(df), 1), CHUNK_SIZE):
+            chunk = df.iloc[start:start + CHUNK_SIZE][keys]
+            links = chunk.merge(table, how='left', on=keys)
+            links[HEADER].to_csv(f, index=False, sep='\t', header=start == 0)
 
 
 def get_wikidata_links_for_kwic(df):
@@ -41,17 +76,15 @@ def get_wikidata_links_for_kwic(df):
     with open(NORMALIZED_LOCATIONS_FILENAME) as f:
         normalized_locations = json.load(f)
 
-    links = []
-
-    for _, row in df.iterrows():
-        lang = LANGS[row['lang']]
-        normalized_loc = normalized_locations[lang][row['location']]
-        loc_scores = location_scores[lang][normalized_loc]
-        hyperlinks = [hyperlink_str(s) for s in loc_scores[:TOP_LINKS]]
-        links.append(hyperlinks)
+    # location -> normalized location -> ranking, for each unique location
+    rankings = {}
+    for lang, wikilang in LANGS.items():
+        for loc in df.loc[df.lang == lang, 'location'].unique():
+            normalized_loc = normalized_locations[wikilang][loc]
+            rankings[lang, loc] = location_scores[wikilang][normalized_loc]
 
-    links_df = pd.DataFrame(links, columns=HEADER)
-    links_df.to_csv(FINAL_LINKS_FILENAME % 'wikidata', index=False, sep='\t')
+    table = get_link_table(rankings, ['lang', 'location'])
+    write_links(df, table, ['lang', 'location'], FINAL_LINKS_FILENAME % 'wikidata')
 
 
 def get_genre_links_for_kwic(df):
@@ -71,20 +104,32 @@ def get_genre_links_for_kwic(df):
     }
     assert locs_by_play == links_by_play
 
-    links = []
+    # GENRE results are listed by play in order of KWIC rows
+    df = df[['play']].copy()
+    df['loc_idx'] = df.groupby('play', sort=False).cumcount()
+    df = df.iloc[np.argsort(pd.factorize(df.play)[0], kind='stable')]
 
-    plays = df.groupby('play', sort=False)
-    for play_name, play_locs in plays:
-        for i in range(play_locs.shape[0]):
-            loc_scores = location_scores[play_name][i]['scores']
-            hyperlinks = [hyperlink_str(s) for s in loc_scores[:TOP_LINKS]]
-            links.append(hyperlinks)
+    rankings = {
+        (play, i): loc['scores']
+        for play, play_locs in location_scores.items()
+        for i, loc in enumerate(play_locs)
+    }
 
-    links_df = pd.DataFrame(links, columns=HEADER)
-    links_df.to_csv(FINAL_LINKS_FILENAME % 'genre', index=False, sep='\t')
+    table = get_link_table(rankings, ['play', 'loc_idx'])
+    write_links(df, table, ['play', 'loc_idx'], FINAL_LINKS_FILENAME % 'genre')
 
 
-if __name__ == '__main__':
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='create hyperlinked candidate lists for KWIC rows')
+    parser.parse_args(argv)
+
     df = pd.read_csv(KWIC_FILENAME, sep='\t')
     get_wikidata_links_for_kwic(df)
-    get_genre_links_for_kwic(df)
+    if os.path.exists(GENRE_LINKS_FILENAME):
+        get_genre_links_for_kwic(df)
+    else:
+        print(f'{GENRE_LINKS_FILENAME} not found (run GENRE.ipynb), GENRE links are skipped')
+
+
+if __name__ == '__main__':
+    main()
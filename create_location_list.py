@@ -1,6 +1,7 @@
 import os
 import json
-from collections import defaultdict
+import argparse
+from functools import lru_cache
 
 import pandas as pd
 from pymorphy2 import MorphAnalyzer
@@ -8,12 +9,17 @@ from pymorphy2 import MorphAnalyzer
 
 # Create a list of locations with their normalized versions.
 # Resulting file must be manually corrected for Russian (normalization errors).
+# Existing file is kept as a normalization table: on re-run, only new locations
+# are normalized, so manual corrections are preserved.
+# Locations that are no longer in KWIC are moved to a separate table of stale
+# locations (not read by other scripts) and restored from it when they come back.
 
 DATA_DIR = 'intermediate_data_files'
 KWIC_FILENAME = os.path.join(DATA_DIR, 'location_kwic.csv')
 NORMALIZED_LOCATIONS_FILENAME = os.path.join(DATA_DIR, 'locations_normalized.json')
+STALE_LOCATIONS_FILENAME = os.path.join(DATA_DIR, 'locations_normalized_stale.json')
 
-m = MorphAnalyzer()
+TOKEN_CACHE_SIZE = 100_000
 
 LANG_MAPPING = {
     'rus': 'ru',
@@ -21,6 +27,12 @@ LANG_MAPPING = {
 }
 
 
+@lru_cache(maxsize=None)
+def get_analyzer():
+    """Create MorphAnalyzer on first use (loading dictionaries is slow)."""
+    return MorphAnalyzer()
+
+
 def capitalize(nomn_token, token):
     """
     Repeat capitalization of the original name.
@@ -36,37 +48,98 @@ def capitalize(nomn_token, token):
     return '-'.join(nomn_tok_spl)
 
 
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def token_to_nomn(token):
+    """
+    Inflect one token to nominative case,
+    preferring geographical parses.
+    """
+    all_parsed = get_analyzer().parse(token)
+    parsed = all_parsed[0]
+    for item in all_parsed[1:]:
+        if 'Geox' in item.tag:
+            parsed = item
+            break
+
+    nomn_token = parsed.inflect({'nomn'}).word
+    return capitalize(nomn_token, token)
+
+
 def location_to_nomn(loc):
     """
     For Russian: inflect location name to nominative case.
     """
     tokens = loc.strip().split()
-    nomn_tokens = []
-
-    for token in tokens:
-        all_parsed = m.parse(token)
-        parsed = all_parsed[0]
-        for item in all_parsed[1:]:
-            if 'Geox' in item.tag:
-                parsed = item
-                break
+    return ' '.join(token_to_nomn(token) for token in tokens)
 
-        nomn_token = parsed.inflect({'nomn'}).word
-        nomn_token = capitalize(nomn_token, token)
-        nomn_tokens.append(nomn_token)
 
-    return ' '.join(nomn_tokens)
+def load_normalization_table(path=NORMALIZED_LOCATIONS_FILENAME):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
 
 
-if __name__ == '__main__':
-    all_locs = pd.read_csv(KWIC_FILENAME)
-    norm_locs = defaultdict(dict)
-
-    for lang in ['rus', 'span']:
-        locs = all_locs.loc[all_locs.lang == lang, 'location'].to_list()
+def normalize_locations(all_locs, table, stale_table=None):
+    """
+    Normalize unique locations of each language.
+    Locations from the existing table keep their (possibly corrected) forms,
+    locations from the stale table are restored, only new ones are normalized.
+    Return (normalization table, stale table); locations no longer in KWIC
+    are moved to the stale table.
+    """
+    stale_table = stale_table or {}
+    norm_locs = {}
+    stale_locs = {}
+
+    for lang, wikilang in LANG_MAPPING.items():
+        lang_table = table.get(wikilang, {})
+        lang_stale = stale_table.get(wikilang, {})
+        locs = all_locs.loc[all_locs.lang == lang, 'location'].drop_duplicates().to_list()
+        loc_set = set(locs)
+
+        # keep order of the existing table to make manual diffs readable
+        norm_locs[wikilang] = {
+            loc: norm_loc for loc, norm_loc in lang_table.items() if loc in loc_set
+        }
+        n_new = n_restored = 0
         for loc in locs:
-            norm_loc = location_to_nomn(loc) if lang == 'rus' else loc
-            norm_locs[LANG_MAPPING[lang]][loc] = norm_loc
+            if loc in norm_locs[wikilang]:
+                continue
+            if loc in lang_stale:
+                norm_locs[wikilang][loc] = lang_stale[loc]
+                n_restored += 1
+            else:
+                norm_locs[wikilang][loc] = location_to_nomn(loc) if lang == 'rus' else loc
+                n_new += 1
+
+        stale_locs[wikilang] = {
+            loc: norm_loc for loc, norm_loc in {**lang_stale, **lang_table}.items() if loc not in loc_set
+        }
+        print(
+            f'{lang}: {len(locs)} unique locations, {n_new} new, {n_restored} restored, '
+            f'{len(stale_locs[wikilang])} stale'
+        )
+
+    return norm_locs, stale_locs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='create the list of unique locations with normalized forms')
+    parser.parse_args(argv)
+
+    all_locs = pd.read_csv(KWIC_FILENAME, sep='\t')
+    norm_locs, stale_locs = normalize_locations(
+        all_locs,
+        load_normalization_table(),
+        load_normalization_table(STALE_LOCATIONS_FILENAME)
+    )
 
     with open(NORMALIZED_LOCATIONS_FILENAME, 'w') as f:
         json.dump(norm_locs, f, ensure_ascii=False, indent=2)
+    with open(STALE_LOCATIONS_FILENAME, 'w') as f:
+        json.dump(stale_locs, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
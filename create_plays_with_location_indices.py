@@ -1,18 +1,14 @@
 import re
 import os
 import json
+import argparse
+from functools import partial
 from collections import defaultdict
 
-import pandas as pd
-from lxml import etree
+from corpus_index import load_play, map_plays, get_location_texts
+from correct_links import read_correct_links
 
 
-NAMESPACE = {'ns': 'http://www.tei-c.org/ns/1.0'}
-UTTERANCE_XPATH = '//ns:sp'
-TEXT_XPATH = './ns:p'
-LOC_XPATH = './/ns:loc'
-
-SPACE_REGEX = re.compile(r'\s+')
 LOC_REGEX = re.compile(r'\[START\] (.+?) \[END\]')
 
 LANGS = {
@@ -21,105 +17,24 @@ LANGS = {
 }
 
 DATA_DIR = 'intermediate_data_files'
-ANN_DIR = 'disambiguation_annotation'
-KWIC_FILENAME = os.path.join(DATA_DIR, 'location_kwic.csv')
-CORRECT_LINKS_FILENAME = os.path.join(ANN_DIR, 'correct_links.csv')
 LOCATION_IDXS_FILENAME = os.path.join(DATA_DIR, 'plays_with_location_indices.json')
 
 
 def get_correct_links():
-    kwic = pd.read_csv(KWIC_FILENAME, sep='\t')
-    locations = list(kwic.location)
-    langs = list(kwic.lang)
-
-    with open(CORRECT_LINKS_FILENAME) as f:
-        raw_links = f.read().split('\n')
-
-    assert len(raw_links) == len(locations)
-
     links = defaultdict(lambda: defaultdict(set))
-    for lang, loc, raw_link in zip(langs, locations, raw_links):
-        wikilang = LANGS[lang]
-        raw_link = raw_link.strip().strip(',')
-        curr_links = raw_link.split(',') if raw_link else []
-        curr_links = set(curr_links)
-        links[wikilang][loc] |= curr_links
+    for lang, loc, curr_links in read_correct_links():
+        links[LANGS[lang]][loc] |= curr_links
 
     return links
 
 
-def get_text_parts(p_tag):
+def get_location_texts_for_play(record):
     """
-    In <p> tag, separate raw text and XML elements.
-    Treat `note` tags as nested <p>.
-    if `text_only_for_loc` is True, write only raw text for loc tags.
+    Given a play record from the corpus index,
+    create a text with annotated locations for each utterance.
     """
-    parts = [' ']
-
-    if p_tag.text:
-        parts.append(p_tag.text)
-
-    for child in p_tag:
-        if child.tag == f'{{{NAMESPACE["ns"]}}}note':
-            parts += get_text_parts(child)
-            continue
-
-        parts.append(child)
-
-        if child.tail:
-            parts.append(child.tail)
-
-    return parts
-
-
-def compile_relevant_texts(parts):
-    """
-    From all parts of <p> tag (got from get_text_parts),
-    compile text with annotated locations.
-    """
-    selected_parts = []
-    for part in parts:
-        text = part if isinstance(part, str) else part.text
-
-        if not isinstance(part, str):
-            # leave out <stage> tag
-            if part.tag == f'{{{NAMESPACE["ns"]}}}stage':
-                continue
-
-            # save parts that contain target locations
-            elif part.tag == f'{{{NAMESPACE["ns"]}}}loc':
-                text = f'[START] {text} [END]'
-
-        selected_parts.append(text)
-
-    return SPACE_REGEX.sub(' ', ''.join(selected_parts)).strip()
-
-
-def get_location_text_for_utterance(p_tags):
-    """
-    Parse locations in all <p> tags inside one speaker's utterance
-    and create a text with annotated locations.
-    """
-    # one flat list of parts for the whole utterance (multiple <p> tags)
-    all_parts = [part for p_tag in p_tags for part in get_text_parts(p_tag)]
-    utterance_loc_text = compile_relevant_texts(all_parts)
-    return utterance_loc_text
-
-
-def get_location_texts_for_play(tree):
-    """
-    Given XML of a play, find all utterances with locations,
-    and create a text with annotated locations for each utterance.
-    """
-    linking_texts = []
-
-    utterances = tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE)
-    print('N utterances', len(utterances))
-
-    for utterance in utterances:
-        p_tags = utterance.xpath(TEXT_XPATH, namespaces=NAMESPACE)
-        linking_texts.append(get_location_text_for_utterance(p_tags))
-    return linking_texts
+    print('N utterances', len(record['utterances']))
+    return get_location_texts(record)
 
 
 def get_indices_for_locations(text, links):
@@ -149,7 +64,7 @@ def get_indices_for_locations(text, links):
         if links[loc_name]:
             link = ', '.join([
                 f'https://www.wikidata.org/wiki/{l}'
-                for l in links[loc_name]
+                for l in sorted(links[loc_name])
             ])
         else:
             link = ''
@@ -161,41 +76,37 @@ def get_indices_for_locations(text, links):
     return [new_text, loc_idxs]
 
 
-def process_play(xml_path, links):
-  """
-  The main function.
-  Get texts with annotated locations for each utterance in the play,
-  get indices of locations in the text.
-  """
-  with open(xml_path) as f:
-    tree = etree.parse(f)
+def process_play(lang, playname, links):
+    """
+    The main function.
+    Get texts with annotated locations for each utterance in the play,
+    get indices of locations in the text.
+    """
+    record = load_play(lang, playname)
+    linking_texts = get_location_texts_for_play(record)
+    linking_text = '\n'.join(linking_texts)
+    text_with_indices = get_indices_for_locations(linking_text, links)
+
+    return text_with_indices
 
-  linking_texts = get_location_texts_for_play(tree)
-  linking_text = '\n'.join(linking_texts)
-  text_with_indices = get_indices_for_locations(linking_text, links)
 
-  return text_with_indices
+def process_play_with_links(lang, playname, links):
+    print(playname)
+    return process_play(lang, playname, links[LANGS[lang]])
 
 
 if __name__ == '__main__':
-    langs = os.listdir(os.path.join('corpus', 'final'))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    args = parser.parse_args()
+
     locations = defaultdict(dict)
 
     links = get_correct_links()
+    process_func = partial(process_play_with_links, links=dict(links))
 
-    for lang in langs:
-        if lang.startswith('.'):
-            continue
-
-        corpus_dir = os.path.join('corpus', 'final', lang)
-        for playname in os.listdir(corpus_dir):
-            if not playname.endswith('.xml'):
-                continue
-
-            print(playname)
-            xml_path = os.path.join(corpus_dir, playname)
-            play_locations = process_play(xml_path, links[LANGS[lang]])
-            locations[lang][playname[:-4]] = play_locations
+    for lang, playname, play_locations in map_plays(process_func, jobs=args.jobs):
+        locations[lang][playname[:-4]] = play_locations
 
     with open(LOCATION_IDXS_FILENAME, 'w') as f:
         json.dump(locations, f, ensure_ascii=False)
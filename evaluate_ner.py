@@ -1,5 +1,9 @@
 import re
 import os
+import argparse
+from collections import defaultdict
+
+from corpus_index import get_plays, map_plays
 
 
 # Evaluate NER performance on the plays;
@@ -12,42 +16,64 @@ MANUAL_LOC_REGEX = re.compile(r'{{(.+?)}}')
 AUTO_CORPUS_FOLDER = os.path.join('corpus', 'autoparsed')
 FIXED_CORPUS_FOLDER = os.path.join('corpus', 'fixed')
 FINAL_CORPUS_FOLDER = os.path.join('corpus', 'final')
-LANGS = ['rus', 'span']
 
 
-for lang in LANGS:
-    n = 0
-    locs_in_auto = 0
-    left_locs_in_fixed = 0
-    manual_locs_in_fixed = 0
+def process_play(lang, filename):
+    """
+    Count locations in the autoparsed and fixed versions of the play
+    and write the final version.
+    Return None if there is no fixed version.
+    """
+    with open(os.path.join(AUTO_CORPUS_FOLDER, lang, filename)) as f:
+        auto_play = f.read()
 
-    os.makedirs(os.path.join(FINAL_CORPUS_FOLDER, lang), exist_ok=True)
+    if not os.path.exists(os.path.join(FIXED_CORPUS_FOLDER, lang, filename)):
+        return None
 
-    for filename in os.listdir(os.path.join(AUTO_CORPUS_FOLDER, lang)):
-        if not filename.endswith('.xml'):
-            continue
+    with open(os.path.join(FIXED_CORPUS_FOLDER, lang, filename)) as f:
+        fixed_play = f.read()
+
+    counts = {
+        'locs_in_auto': len(AUTO_LOC_REGEX.findall(auto_play)),
+        'left_locs_in_fixed': len(AUTO_LOC_REGEX.findall(fixed_play)),
+        'manual_locs_in_fixed': len(MANUAL_LOC_REGEX.findall(fixed_play))
+    }
+
+    final_play = MANUAL_LOC_REGEX.sub('<loc from="manual">\\1</loc>', fixed_play)
+    with open(os.path.join(FINAL_CORPUS_FOLDER, lang, filename), 'w') as f:
+        f.write(final_play)
 
-        with open(os.path.join(AUTO_CORPUS_FOLDER, lang, filename)) as f:
-            auto_play = f.read()
+    return counts
 
-        if not os.path.exists(os.path.join(FIXED_CORPUS_FOLDER, lang, filename)):
+
+def evaluate(jobs=1):
+    plays = get_plays(AUTO_CORPUS_FOLDER)
+    for lang in {lang for lang, _ in plays}:
+        os.makedirs(os.path.join(FINAL_CORPUS_FOLDER, lang), exist_ok=True)
+
+    lang_counts = defaultdict(lambda: defaultdict(int))
+    for lang, _, counts in map_plays(process_play, plays, jobs):
+        if counts is None:
             continue
 
-        n += 1
-        with open(os.path.join(FIXED_CORPUS_FOLDER, lang, filename)) as f:
-            fixed_play = f.read()
+        lang_counts[lang]['n'] += 1
+        for key, value in counts.items():
+            lang_counts[lang][key] += value
+
+    for lang, counts in lang_counts.items():
+        precision = counts['left_locs_in_fixed'] / counts['locs_in_auto']
+        recall = counts['left_locs_in_fixed'] / (
+            counts['left_locs_in_fixed'] + counts['manual_locs_in_fixed']
+        )
+        print(f'{lang}, {counts["n"]} plays\nprecision: {precision}\nrecall: {recall}\n')
 
-        locs_in_auto += len(AUTO_LOC_REGEX.findall(auto_play))
-        left_locs_in_fixed += len(AUTO_LOC_REGEX.findall(fixed_play))
-        manual_locs_in_fixed += len(MANUAL_LOC_REGEX.findall(fixed_play))
 
-        final_play = MANUAL_LOC_REGEX.sub('<loc from="manual">\\1</loc>', fixed_play)
-        with open(os.path.join(FINAL_CORPUS_FOLDER, lang, filename), 'w') as f:
-            f.write(final_play)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    args = parser.parse_args()
 
-    precision = left_locs_in_fixed / locs_in_auto
-    recall = left_locs_in_fixed / (left_locs_in_fixed + manual_locs_in_fixed)
-    print(f'{lang}, {n} plays\nprecision: {precision}\nrecall: {recall}\n')
+    evaluate(args.jobs)
 
 
 # Evaluation results:
@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import argparse
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import pandas as pd
+
+from response_cache import ResponseCache
+
+
+# Evaluate spans predicted by a linker (Babelfy, mGENRE, ...) against gold location spans
+# from `create_plays_with_location_indices.py` (offsets in the play text, end exclusive).
+# Gold spans are sorted once; each predicted span finds gold spans it may match
+# with bisect, so a play is evaluated in O((n + m) log n).
+# Match modes: `exact` (same offsets), `overlap` (common characters),
+# `contain` (one span contains the other). Each gold span is matched at most once.
+# A link is correct if its Wikidata ID is among gold IDs of the matched span.
+# Babelfy links are DBpedia URLs: they are mapped to Wikidata IDs with owl:sameAs
+# links of DBpedia (`--sameas`, responses are cached); without the mapping,
+# link accuracy of Babelfy is reported as unsupported.
+
+
+LOCATION_IDXS_FILENAME = os.path.join('intermediate_data_files', 'plays_with_location_indices.json')
+BABELFY_OUTPUTS_FILENAME = os.path.join('intermediate_data_files', 'babelfy_outputs.json')
+GENRE_LINKS_FILENAME = os.path.join('intermediate_data_files', 'genre_ranking.json')
+
+MATCH_MODES = ['exact', 'overlap', 'contain']
+WIKIDATA_ID_REGEX = re.compile(r'\bQ\d+\b')
+LINKS_UNSUPPORTED = 'unsupported'
+
+DBPEDIA_SPARQL_URL = 'https://dbpedia.org/sparql'
+WIKIDATA_ENTITY_PREFIX = 'http://www.wikidata.org/entity/'
+SAMEAS_QUERY = '''
+SELECT ?item ?same WHERE {
+  VALUES ?item { %s }
+  ?item owl:sameAs ?same .
+  FILTER(STRSTARTS(STR(?same), "http://www.wikidata.org/entity/"))
+}
+'''
+SAMEAS_BATCH_SIZE = 50
+TIMEOUT = 60  # seconds
+
+
+def get_wikidata_ids(link):
+    """Wikidata IDs in a link or a comma-separated list of links."""
+    return set(WIKIDATA_ID_REGEX.findall(link or ''))
+
+
+class SpanIndex:
+    """Sorted index of non-overlapping gold spans [(start, end, link), ...]."""
+    def __init__(self, spans):
+        self.spans = sorted(spans)
+        self.starts = [start for start, _, _ in self.spans]
+        self.ends = [end for _, end, _ in self.spans]
+
+    def find(self, start, end, mode='exact'):
+        """Indices of gold spans matching the span [start, end)."""
+        if mode == 'exact':
+            i = bisect_left(self.starts, start)
+            if i < len(self.spans) and self.starts[i] == start and self.ends[i] == end:
+                return [i]
+            return []
+
+        # gold spans overlapping [start, end)
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+        idxs = range(first, last)
+        if mode == 'overlap':
+            return list(idxs)
+        return [
+            i for i in idxs
+            if self.starts[i] <= start and end <= self.ends[i]
+            or start <= self.starts[i] and self.ends[i] <= end
+        ]
+
+
+def evaluate_play(gold_spans, predictions, mode='exact'):
+    """
+    Count predictions, gold spans, matches and correct links of a play.
+    Predictions are [(start, end, link), ...]; links can be None (not evaluated).
+    """
+    index = SpanIndex(gold_spans)
+    matched = set()
+    counts = defaultdict(int, {'gold': len(index.spans), 'predicted': len(predictions)})
+
+    for start, end, link in sorted(predictions):
+        idxs = [i for i in index.find(start, end, mode) if i not in matched]
+        if not idxs:
+            continue
+
+        i = idxs[0]
+        matched.add(i)
+        counts['matched'] += 1
+
+        pred_ids = get_wikidata_ids(link)
+        if pred_ids:
+            counts['with_link'] += 1
+            counts['correct_link'] += bool(pred_ids & get_wikidata_ids(index.spans[i][2]))
+
+    return counts
+
+
+def get_scores(counts):
+    precision = counts['matched'] / counts['predicted'] if counts['predicted'] else 0
+    recall = counts['matched'] / counts['gold'] if counts['gold'] else 0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0
+    link_accuracy = counts['correct_link'] / counts['with_link'] if counts['with_link'] else None
+    return {'precision': precision, 'recall': recall, 'f1': f1, 'link_accuracy': link_accuracy}
+
+
+def evaluate(gold, predictions, mode='exact', links=True):
+    """
+    Evaluate predictions {lang: {playname: [(start, end, link), ...]}}
+    against gold texts {lang: {playname: [text, locations]}}.
+    Return a table with a row for each play and each language.
+    If `links` is False (links of the linker cannot be mapped to Wikidata IDs),
+    link accuracy is marked as unsupported.
+    """
+    rows = []
+    for lang, plays in gold.items():
+        lang_counts = defaultdict(int)
+        for playname, (_, locations) in plays.items():
+            gold_spans = [(start, end, link) for _, (start, end), link in locations]
+            counts = evaluate_play(gold_spans, predictions.get(lang, {}).get(playname, []), mode)
+            for key, value in counts.items():
+                lang_counts[key] += value
+            rows.append({'lang': lang, 'play': playname, **counts, **get_scores(counts)})
+        rows.append({'lang': lang, 'play': 'all', **lang_counts, **get_scores(lang_counts)})
+
+    count_columns = ['gold', 'predicted', 'matched', 'with_link', 'correct_link']
+    score_columns = ['precision', 'recall', 'f1', 'link_accuracy']
+    table = pd.DataFrame(rows).reindex(columns=['lang', 'play'] + count_columns + score_columns)
+    table = table.fillna({column: 0 for column in count_columns})
+    if not links:
+        table['link_accuracy'] = LINKS_UNSUPPORTED
+    return table
+
+
+def get_sameas_wikidata_ids(urls, cache=None, endpoint=DBPEDIA_SPARQL_URL, batch_size=SAMEAS_BATCH_SIZE):
+    """
+    Wikidata IDs of DBpedia resources {url: [id, ...]} from their owl:sameAs links,
+    queried in batches of `batch_size` resources.
+    """
+    import requests
+
+    def request(params):
+        r = requests.get(endpoint, params=params, timeout=TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    urls = sorted(set(urls))
+    wikidata_ids = defaultdict(set)
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start:start + batch_size]
+        params = {
+            'query': SAMEAS_QUERY % ' '.join(f'<{url}>' for url in batch),
+            'format': 'json'
+        }
+        if cache is not None:
+            response = cache.fetch(endpoint, params, lambda: request(params))
+        else:
+            response = request(params)
+
+        for binding in response['results']['bindings']:
+            wikidata_ids[binding['item']['value']].add(
+                binding['same']['value'][len(WIKIDATA_ENTITY_PREFIX):]
+            )
+
+    return {url: sorted(wikidata_ids[url]) for url in urls}
+
+
+def get_babelfy_urls(babelfy_outputs):
+    return [
+        a['DBpediaURL']
+        for plays in babelfy_outputs.values()
+        for annotations in plays.values()
+        for a in annotations
+        if a['DBpediaURL']
+    ]
+
+
+def get_babelfy_predictions(babelfy_outputs, require_dbpedia=True, wikidata_ids=None):
+    """
+    Spans of Babelfy annotations (`charFragment` end is inclusive).
+    As in `babelfy.ipynb`, only annotations with DBpedia URL are kept by default.
+    Links are Wikidata IDs of DBpedia URLs from `wikidata_ids`
+    ({url: [id, ...]}, see `get_sameas_wikidata_ids`); without them, links are None.
+    """
+    def get_link(annotation):
+        if wikidata_ids is None or not annotation['DBpediaURL']:
+            return None
+        return ','.join(wikidata_ids.get(annotation['DBpediaURL'], []))
+
+    return {
+        lang: {
+            playname: [
+                (
+                    a['charFragment']['start'],
+                    a['charFragment']['end'] + 1,
+                    get_link(a)
+                )
+                for a in annotations
+                if a['DBpediaURL'] or not require_dbpedia
+            ]
+            for playname, annotations in plays.items()
+        }
+        for lang, plays in babelfy_outputs.items()
+    }
+
+
+def get_genre_predictions(gold, genre_links):
+    """
+    Spans of mGENRE links (`GENRE.ipynb`): there is one context for each location
+    of the play in the same order, so the span is the gold span
+    and the link is the best scored Wikidata ID (None if there are none).
+    """
+    predictions = defaultdict(dict)
+    for lang, plays in gold.items():
+        for playname, (_, locations) in plays.items():
+            if playname not in genre_links:
+                continue
+            contexts = genre_links[playname]
+            assert len(contexts) == len(locations), playname
+            predictions[lang][playname] = [
+                (start, end, max(context['scores'], key=lambda x: x[1])[0] if context['scores'] else None)
+                for (_, (start, end), _), context in zip(locations, contexts)
+            ]
+    return predictions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('linker', choices=['babelfy', 'genre'], help='linker output to evaluate')
+    parser.add_argument('--predictions', help='linker output (default path of the linker)')
+    parser.add_argument('--mode', choices=MATCH_MODES, default='exact', help='span matching')
+    parser.add_argument('--output', help='save the table to csv')
+    parser.add_argument(
+        '--sameas',
+        action='store_true',
+        help='map DBpedia URLs of Babelfy to Wikidata IDs with owl:sameAs (DBpedia SPARQL, cached)'
+    )
+    parser.add_argument('--offline', action='store_true', help='only use cached owl:sameAs responses')
+    args = parser.parse_args(argv)
+
+    with open(LOCATION_IDXS_FILENAME) as f:
+        gold = json.load(f)
+
+    links = True
+    if args.linker == 'babelfy':
+        with open(args.predictions or BABELFY_OUTPUTS_FILENAME) as f:
+            babelfy_outputs = json.load(f)
+        wikidata_ids = None
+        if args.sameas:
+            with ResponseCache(offline=args.offline) as cache:
+                wikidata_ids = get_sameas_wikidata_ids(get_babelfy_urls(babelfy_outputs), cache)
+        predictions = get_babelfy_predictions(babelfy_outputs, wikidata_ids=wikidata_ids)
+        links = wikidata_ids is not None
+    else:
+        with open(args.predictions or GENRE_LINKS_FILENAME) as f:
+            predictions = get_genre_predictions(gold, json.load(f))
+
+    table = evaluate(gold, predictions, args.mode, links)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(table.round(3).to_string(index=False))
+    if args.output is not None:
+        table.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,20 @@
 import os
 import json
 import random
+import argparse
+from math import prod
+from itertools import islice, product
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-import pandas as pd
+import numpy as np
 
-from wikidata import score_candidates
+from correct_links import read_correct_links
+from ranking import STAT_KEYS, build_features, score_candidates
 
 
-random.seed(42)
+SEED = 42
+random.seed(SEED)
 
 LANGS = {
     'rus': 'ru',
@@ -17,9 +23,6 @@ LANGS = {
 
 
 DATA_DIR = 'intermediate_data_files'
-ANN_DIR = 'disambiguation_annotation'
-KWIC_FILENAME = os.path.join(DATA_DIR, 'location_kwic.csv')
-CORRECT_LINKS_FILENAME = os.path.join(ANN_DIR, 'correct_links.csv')
 NORMALIZED_LOCATIONS_FILENAME = os.path.join(DATA_DIR, 'locations_normalized.json')
 LOC_INFO_FILENAME = os.path.join(DATA_DIR, 'wikidata_locations_info.json')
 COEFS_FILENAME = 'coefficients.json'
@@ -40,26 +43,18 @@ COEFS_GRID = [
 DEFAULT = {k[0]: 1 for k in COEFS_GRID}
 DEFAULT['n_links'] = 'log'
 
+N_RUNS = 50  # random restarts of grid search
+BATCH_SIZE = 512  # coefficient sets evaluated at once in batched search
+MAX_EXHAUSTIVE_SIZE = 10 ** 6
 
-def get_correct_links():
-    kwic = pd.read_csv(KWIC_FILENAME, sep='\t')
-    locations = list(kwic.location)
-    langs = list(kwic.lang)
 
+def get_correct_links():
     with open(NORMALIZED_LOCATIONS_FILENAME) as f:
         normalized_locations = json.load(f)
 
-    with open(CORRECT_LINKS_FILENAME) as f:
-        raw_links = f.read().split('\n')
-
-    assert len(raw_links) == len(locations)
-
     links = defaultdict(lambda: defaultdict(set))
-    for lang, loc, raw_link in zip(langs, locations, raw_links):
+    for lang, loc, curr_links in read_correct_links():
         wikilang = LANGS[lang]
-        raw_link = raw_link.strip().strip(',')
-        curr_links = raw_link.split(',') if raw_link else []
-        curr_links = set(curr_links)
         loc_norm = normalized_locations[wikilang].get(loc, loc)
         links[wikilang][loc_norm] |= curr_links
 
@@ -139,6 +134,224 @@ def one_grid_search_run(candidates, stats, correct_links):
     return max_accs, coefs
 
 
+def build_search_data(candidates, stats, correct_links):
+    """
+    Precompute arrays for batched evaluation of coefficients.
+    For each language: stats (and log-stats) of all (location, candidate) pairs
+    with label/alias match flags and gold flags, starts of locations in the pairs,
+    and the number of NIL locations predicted correctly.
+    """
+    features = build_features(candidates, stats)
+
+    data = {}
+    for lang, lang_features in features.items():
+        rows = []
+        is_label = []
+        is_alias = []
+        is_gold = []
+        starts = []
+        n_nil_correct = 0
+
+        for loc, loc_features in lang_features['locations'].items():
+            correct = correct_links[lang][loc]
+            if not len(loc_features['rows']):  # NIL
+                n_nil_correct += not correct
+                continue
+
+            starts.append(sum(len(r) for r in rows))
+            rows.append(loc_features['rows'])
+            is_label.append(loc_features['is_label'])
+            is_alias.append(loc_features['is_alias'])
+            is_gold.append([lang_features['ids'][row] in correct for row in loc_features['rows']])
+
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        data[lang] = {
+            'stats': lang_features['stats'][rows],
+            'log_stats': lang_features['log_stats'][rows],
+            'is_label': np.concatenate(is_label) if rows.size else np.zeros(0, dtype=bool),
+            'is_alias': np.concatenate(is_alias) if rows.size else np.zeros(0, dtype=bool),
+            'is_gold': np.concatenate(is_gold).astype(bool) if rows.size else np.zeros(0, dtype=bool),
+            'starts': np.array(starts, dtype=np.int64),
+            'n_nil_correct': n_nil_correct,
+            'n_locs': len(lang_features['locations'])
+        }
+
+    return data
+
+
+def coefs_to_arrays(coefs_batch):
+    """
+    Stack coefficient dicts into arrays:
+    linear weights and log flags of stats, label and alias coefficients.
+    """
+    weights = np.array([
+        [0 if coefs[key] == 'log' else coefs[key] for key in STAT_KEYS]
+        for coefs in coefs_batch
+    ], dtype=np.float64)
+    log_flags = np.array([
+        [coefs[key] == 'log' for key in STAT_KEYS]
+        for coefs in coefs_batch
+    ], dtype=np.float64)
+    label_coefs = np.array([coefs['label'] for coefs in coefs_batch], dtype=np.float64)
+    alias_coefs = np.array([coefs['aliases'] for coefs in coefs_batch], dtype=np.float64)
+    return weights, log_flags, label_coefs, alias_coefs
+
+
+def get_accuracy_batch(data, coefs_batch):
+    """
+    Batched version of score_candidates + get_accuracy:
+    score all candidates for many coefficient sets with matrix products.
+    Return a list of accuracy dicts, one per coefficient set.
+    Sums are not accumulated in the same order as in `calculate_score`,
+    so scores can differ from it in the last bits (which matters only
+    for ties after rounding); final results are checked with `evaluate`.
+    """
+    weights, log_flags, label_coefs, alias_coefs = coefs_to_arrays(coefs_batch)
+    accs = [{} for _ in coefs_batch]
+
+    for lang, lang_data in data.items():
+        n_correct = np.full(len(coefs_batch), lang_data['n_nil_correct'])
+
+        if len(lang_data['starts']):
+            # (n_pairs, batch)
+            stat_sums = lang_data['stats'] @ weights.T + lang_data['log_stats'] @ log_flags.T
+            coef = np.where(
+                lang_data['is_label'][:, None],
+                label_coefs[None, :],
+                np.where(lang_data['is_alias'][:, None], alias_coefs[None, :], 1)
+            )
+            scores = np.round(coef * stat_sums, 3)
+
+            # first candidate with the max score for each location
+            starts = lang_data['starts']
+            loc_max = np.maximum.reduceat(scores, starts, axis=0)
+            loc_idx = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(scores))))
+            pair_idx = np.arange(len(scores))[:, None]
+            is_max = scores == loc_max[loc_idx]
+            first = np.minimum.reduceat(np.where(is_max, pair_idx, len(scores)), starts, axis=0)
+            n_correct = n_correct + lang_data['is_gold'][first].sum(axis=0)
+
+        for acc, n in zip(accs, n_correct.tolist()):
+            acc[lang] = n / lang_data['n_locs']
+
+    return accs
+
+
+def one_batched_search_run(data, seed):
+    """
+    Same as `one_grid_search_run`, but all values of one coefficient
+    are evaluated in one batch. Restarts are seeded independently.
+    """
+    rng = random.Random(seed)
+    max_accs = None
+
+    coefs_grid = rng.sample(COEFS_GRID, len(COEFS_GRID))
+    coefs = {k: 1 for k, _ in coefs_grid}
+
+    for key, values in coefs_grid:
+        batch = [{**coefs, key: val} for val in values]
+
+        max_val = 1
+        for val, accs in zip(values, get_accuracy_batch(data, batch)):
+            if acc_improved(accs, max_accs):
+                max_accs = accs
+                max_val = val
+
+        coefs[key] = max_val
+
+    return max_accs, coefs
+
+
+SEARCH_DATA = None
+
+
+def init_search_worker(data):
+    global SEARCH_DATA
+    SEARCH_DATA = data
+
+
+def run_batched_search(seed):
+    return one_batched_search_run(SEARCH_DATA, seed)
+
+
+def select_best(results):
+    """Choose the best result in order, as in `grid_search`."""
+    overall_max_acc = None
+    best_coefs = None
+    for max_acc, coefs in results:
+        if best_coefs is None or acc_improved(max_acc, overall_max_acc):
+            overall_max_acc = max_acc
+            best_coefs = coefs
+    return overall_max_acc, best_coefs
+
+
+def batched_grid_search(info, correct_links, dev_locs, n_runs=N_RUNS, jobs=1, seed=SEED):
+    """
+    Random-restart coordinate search with batched evaluation;
+    restarts are distributed across `jobs` processes.
+    Restart i uses seed `seed + i`, so results do not depend on `jobs`.
+    """
+    candidates = filter_candidates(info['candidates'], dev_locs)
+    data = build_search_data(candidates, info['stats'], correct_links)
+    seeds = [seed + i for i in range(n_runs)]
+
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs, initializer=init_search_worker, initargs=(data,)) as executor:
+            results = list(executor.map(run_batched_search, seeds))
+    else:
+        results = [one_batched_search_run(data, s) for s in seeds]
+
+    overall_max_acc, best_coefs = select_best(results)
+    print(f'Coefficients: {best_coefs}')
+    print(f'Dev acc: {overall_max_acc}')
+    return best_coefs
+
+
+def iter_grid(keys, batch_size):
+    """Iterate over all combinations of values of `keys` in batches."""
+    grid = dict(COEFS_GRID)
+    combinations = product(*[grid[key] for key in keys])
+    while True:
+        batch = [
+            {**DEFAULT, **dict(zip(keys, values))}
+            for values in islice(combinations, batch_size)
+        ]
+        if not batch:
+            break
+        yield batch
+
+
+def get_grid_size(keys):
+    grid = dict(COEFS_GRID)
+    return prod(len(grid[key]) for key in keys)
+
+
+def exhaustive_search(info, correct_links, dev_locs, keys, batch_size=BATCH_SIZE):
+    """
+    Evaluate all combinations of COEFS_GRID values for `keys`;
+    other coefficients are taken from DEFAULT.
+    """
+    grid_size = get_grid_size(keys)
+    if grid_size > MAX_EXHAUSTIVE_SIZE:
+        raise ValueError(
+            f'Grid of {grid_size} combinations is too large for exhaustive search '
+            f'(max {MAX_EXHAUSTIVE_SIZE}), choose fewer coefficients'
+        )
+
+    candidates = filter_candidates(info['candidates'], dev_locs)
+    data = build_search_data(candidates, info['stats'], correct_links)
+
+    results = (
+        (accs, coefs)
+        for batch in iter_grid(keys, batch_size)
+        for accs, coefs in zip(get_accuracy_batch(data, batch), batch)
+    )
+    overall_max_acc, best_coefs = select_best(results)
+    print(f'Coefficients: {best_coefs}')
+    print(f'Dev acc: {overall_max_acc}')
+    return best_coefs
+
+
 def calculate_default(dev_locs, test_locs, info, correct_links):
     dev_candidates = filter_candidates(info['candidates'], dev_locs)
     test_candidates = filter_candidates(info['candidates'], test_locs)
@@ -160,7 +373,7 @@ def grid_search(info, correct_links, dev_locs):
 
     candidates = filter_candidates(info['candidates'], dev_locs)
 
-    for _ in range(50):
+    for _ in range(N_RUNS):
         max_acc, coefs = one_grid_search_run(candidates, info['stats'], correct_links)
         if best_coefs is None or acc_improved(max_acc, overall_max_acc):
             overall_max_acc = max_acc
@@ -179,7 +392,37 @@ def evaluate(info, correct_links, coefs, test_locs):
     return acc
 
 
-if __name__ == '__main__':
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='find optimal coefficients for the ranking formula')
+    parser.add_argument(
+        '--mode',
+        choices=['sequential', 'batched', 'exhaustive'],
+        default='sequential',
+        help='original grid search, batched grid search with random restarts '
+             'in parallel, or exhaustive search over the grid'
+    )
+    parser.add_argument('--jobs', type=int, default=1, help='processes for batched search')
+    parser.add_argument('--runs', type=int, default=N_RUNS, help='random restarts for batched search')
+    parser.add_argument(
+        '--keys',
+        nargs='+',
+        choices=[key for key, _ in COEFS_GRID],
+        metavar='KEY',
+        help='coefficients to vary in exhaustive search (required with --mode exhaustive), '
+             f'of: {", ".join(key for key, _ in COEFS_GRID)}'
+    )
+    args = parser.parse_args(argv)
+
+    if args.mode == 'exhaustive':
+        if not args.keys:
+            parser.error('--mode exhaustive requires --keys (the full grid is too large)')
+        grid_size = get_grid_size(args.keys)
+        if grid_size > MAX_EXHAUSTIVE_SIZE:
+            parser.error(
+                f'grid of {grid_size} combinations is too large for exhaustive search '
+                f'(max {MAX_EXHAUSTIVE_SIZE}), choose fewer --keys'
+            )
+
     with open(LOC_INFO_FILENAME) as f:
         info = json.load(f)
 
@@ -189,13 +432,22 @@ if __name__ == '__main__':
     calculate_default(dev_locs, test_locs, info, correct_links)
     print()
 
-    coefs = grid_search(info, correct_links, dev_locs)
+    if args.mode == 'batched':
+        coefs = batched_grid_search(info, correct_links, dev_locs, args.runs, args.jobs)
+    elif args.mode == 'exhaustive':
+        coefs = exhaustive_search(info, correct_links, dev_locs, args.keys)
+    else:
+        coefs = grid_search(info, correct_links, dev_locs)
     test_acc = evaluate(info, correct_links, coefs, test_locs)
 
     with open(COEFS_FILENAME, 'w') as f:
         json.dump(coefs, f, indent=2)
 
 
+if __name__ == '__main__':
+    main()
+
+
 # Coefficients: {'n_labels': 1, 'n_descriptions': 1, 'n_sitelinks': 1, 'n_aliases': 1, 'n_statements': 1, 'n_qualifiers': 1, 'n_references': 1, 'n_links': 'log', 'label': 1, 'aliases': 1}
 # Dev acc: {'ru': 0.7608695652173914, 'es': 0.6973684210526315}
 # Test acc: {'ru': 0.6989247311827957, 'es': 0.7368421052631579}
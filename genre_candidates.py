@@ -0,0 +1,87 @@
+import os
+import re
+import json
+import hashlib
+from urllib.parse import unquote
+
+from corpus_index import LANGS
+from genre_trie import SequenceTrie, get_title_sequence
+
+
+# Constrained mGENRE decoding: instead of all Wikipedia titles,
+# the title of a location is decoded only among ru/es Wikipedia titles
+# of its Wikidata candidates (`wikidata.py stats`).
+# A small trie is built for each distinct set of candidates;
+# locations without candidates are decoded with the global title trie.
+
+
+LOC_INFO_FILENAME = os.path.join('intermediate_data_files', 'wikidata_locations_info.json')
+NORMALIZED_LOCATIONS_FILENAME = os.path.join('intermediate_data_files', 'locations_normalized.json')
+
+LOC_REGEX = re.compile(r'\[START\] (.+?) \[END\]')
+
+
+def get_wikipedia_title(url):
+    return unquote(url.rsplit('/wiki/', 1)[1]).replace('_', ' ')
+
+
+def load_candidate_titles(loc_info_path=LOC_INFO_FILENAME):
+    """
+    Load Wikidata candidates of locations {wikilang: {location: [id, ...]}}
+    and Wikipedia titles of candidates {id: [(title, wikilang), ...]}.
+    """
+    with open(loc_info_path) as f:
+        loc_info = json.load(f)
+
+    titles = {}
+    for wikilang, lang_stats in loc_info['stats'].items():
+        for entity_id, info in lang_stats.items():
+            if info['wikipedia_url'] is not None:
+                title = get_wikipedia_title(info['wikipedia_url'])
+                titles.setdefault(entity_id, []).append((title, wikilang))
+
+    return loc_info['candidates'], titles
+
+
+class CandidateConstraints:
+    """
+    Usage:
+        constraints = CandidateConstraints(model)
+        results = linker.link(texts, constraints.get_constraints(lang, texts))
+    """
+    def __init__(
+            self,
+            model,
+            loc_info_path=LOC_INFO_FILENAME,
+            normalized_locations_path=NORMALIZED_LOCATIONS_FILENAME
+    ):
+        self.model = model
+        self.candidates, self.titles = load_candidate_titles(loc_info_path)
+        with open(normalized_locations_path) as f:
+            self.normalized_locations = json.load(f)
+        self.tries = {}
+
+    def get_titles(self, lang, loc):
+        """Sorted (title, wikilang) of candidates of the location."""
+        wikilang = LANGS[lang]
+        loc_norm = self.normalized_locations.get(wikilang, {}).get(loc, loc)
+        entity_ids = self.candidates.get(wikilang, {}).get(loc_norm, [])
+        return sorted({title for entity_id in entity_ids for title in self.titles.get(entity_id, [])})
+
+    def get_constraint(self, lang, text):
+        """(name, trie) of candidate titles of the annotated location, or None if there are none."""
+        titles = self.get_titles(lang, LOC_REGEX.search(text).group(1))
+        if not titles:
+            return None
+
+        key = '\n'.join(f'{title} >> {wikilang}' for title, wikilang in titles)
+        if key not in self.tries:
+            self.tries[key] = SequenceTrie(
+                get_title_sequence(self.model, title, wikilang)
+                for title, wikilang in titles
+            )
+        name = 'candidates:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return name, self.tries[key]
+
+    def get_constraints(self, lang, texts):
+        return [self.get_constraint(lang, text) for text in texts]
@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+from bisect import bisect_left, bisect_right
+
+from corpus_index import (
+    LANGS,
+    LOC_START,
+    LOC_END,
+    SPACE_REGEX,
+    get_single_location_parts
+)
+
+
+# Cut context of every location so that it fits into mGENRE
+# (input of `GENRE.ipynb`, same texts as `corpus_index.get_single_location_texts`).
+# Each utterance is split into sentences once (not once per location in it):
+# texts of a language go through `nlp.pipe` with only the components
+# needed for sentence boundaries, and sentence boundaries are cached by text hash.
+# The context window is found with prefix sums of sentence lengths and bisect.
+
+
+MAX_CONTEXT_CHARS = 1000  # context limit from one side of location
+
+SPACY_MODELS = {
+    'rus': 'ru_core_news_sm',
+    'span': 'es_core_news_sm'
+}
+SENTENCE_PIPES = ['tok2vec', 'parser', 'senter']
+BATCH_SIZE = 256
+
+CACHE_FILENAME = os.path.join('intermediate_data_files', 'sentence_cache.json')
+
+START_MARKER = '[START] '
+END_MARKER = ' [END]'
+
+
+def load_sentence_nlp(lang, fast=False):
+    """
+    spaCy pipeline that only splits text into sentences.
+    If `fast` is True, use rule-based sentencizer (punctuation)
+    instead of the dependency parser of the model.
+    """
+    import spacy
+
+    if fast:
+        nlp = spacy.blank(LANGS[lang])
+        nlp.add_pipe('sentencizer')
+        return nlp
+
+    nlp = spacy.load(SPACY_MODELS[lang])
+    nlp.select_pipes(enable=[pipe for pipe in SENTENCE_PIPES if pipe in nlp.pipe_names])
+    return nlp
+
+
+class SentenceSegmenter:
+    """
+    Split texts into sentences (spans of characters) in batches.
+    Segmentations are cached by hash of the text
+    and saved to `cache_path` if given.
+    """
+    def __init__(self, fast=False, cache_path=None, batch_size=BATCH_SIZE):
+        self.fast = fast
+        self.batch_size = batch_size
+        self.cache_path = cache_path
+        self.nlps = {}
+
+        self.cache = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def get_key(self, lang, text):
+        segmenter = 'rules' if self.fast else SPACY_MODELS[lang]
+        return hashlib.sha1(f'{segmenter}\n{text}'.encode('utf-8')).hexdigest()
+
+    def get_nlp(self, lang):
+        if lang not in self.nlps:
+            self.nlps[lang] = load_sentence_nlp(lang, self.fast)
+        return self.nlps[lang]
+
+    def segment(self, lang, texts):
+        """List of sentence spans [(start, end), ...] for each text."""
+        keys = [self.get_key(lang, text) for text in texts]
+        new_texts = {key: text for key, text in zip(keys, texts) if key not in self.cache}
+
+        if new_texts:
+            docs = self.get_nlp(lang).pipe(new_texts.values(), batch_size=self.batch_size)
+            for key, doc in zip(new_texts, docs):
+                self.cache[key] = [(s.start_char, s.end_char) for s in doc.sents]
+
+        return [self.cache[key] for key in keys]
+
+    def save(self):
+        if self.cache_path is not None:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.cache, f)
+
+
+def render_plain(parts):
+    """
+    Compile text from parts without annotation.
+    Return the text and spans of locations in it.
+    """
+    texts = [
+        part if isinstance(part, str) else f'{LOC_START}{part["loc"]}{LOC_END}'
+        for part in parts
+    ]
+    marked = SPACE_REGEX.sub(' ', ''.join(texts)).strip()
+
+    text = []
+    loc_spans = []
+    for char in marked:
+        if char == LOC_START:
+            start = len(text)
+        elif char == LOC_END:
+            loc_spans.append((start, len(text)))
+        else:
+            text.append(char)
+    return ''.join(text), loc_spans
+
+
+def mark_location(text, loc_span):
+    """
+    Annotate the location with [START] and [END]
+    (the same text as `corpus_index.render_parts` with `target`).
+    Return the text and a function mapping indices of the plain text to it
+    (an end index right after the location is mapped to the end of [END]).
+    """
+    start, end = loc_span
+    tail = text[end:]
+    # `render_parts` adds a space after [END]; it is merged with the space after the location
+    space = ' ' if tail and not tail.startswith(' ') else ''
+    marked = text[:start] + START_MARKER + text[start:end] + END_MARKER + space + tail
+
+    def shift(i, is_end=False):
+        if i <= start:
+            return i
+        if i < end:
+            return i + len(START_MARKER)
+        if i == end and is_end:
+            return i + len(START_MARKER) + len(END_MARKER)
+        return i + len(START_MARKER) + len(END_MARKER) + len(space)
+
+    return marked, shift
+
+
+def get_prefix_sums(lengths):
+    sums = [0]
+    for length in lengths:
+        sums.append(sums[-1] + length)
+    return sums
+
+
+def cut_context(text, sentence_spans, loc_span):
+    """
+    Cut sentences from left and right context of the location:
+    take sentences until the context of each side reaches MAX_CONTEXT_CHARS.
+    The side starts with the part of the location sentence
+    before the start (left) or the end (right) of the location,
+    as in the original `find_context` of the notebook.
+    `text` and spans are in the annotated text.
+    """
+    if len(text) <= MAX_CONTEXT_CHARS:
+        return text
+
+    loc_start, loc_end = loc_span
+    starts = [start for start, _ in sentence_spans]
+    lengths = [end - start for start, end in sentence_spans]
+    sums = get_prefix_sums(lengths)
+
+    # sentences with the location (usually one)
+    first = max(bisect_right(starts, loc_start) - 1, 0)
+    last = max(bisect_right(starts, loc_end - 1) - 1, first)
+    loc_sentence_start = starts[first]
+    loc_sentence_len = sentence_spans[last][1] - loc_sentence_start
+
+    left_chars = min(loc_start - loc_sentence_start, loc_sentence_len)
+    left = first
+    if left_chars < MAX_CONTEXT_CHARS:
+        # the first sentence i such that sentences i..first-1 fit into the rest of the limit
+        left = min(bisect_right(sums, sums[first] - MAX_CONTEXT_CHARS + left_chars), first)
+
+    right_chars = min(loc_end - loc_sentence_start, loc_sentence_len)
+    right = last
+    if right_chars < MAX_CONTEXT_CHARS:
+        # the last sentence i such that sentences last+1..i fit into the rest of the limit
+        right = max(bisect_left(sums, sums[last + 1] + MAX_CONTEXT_CHARS - right_chars) - 2, last)
+
+    return ' '.join(text[start:end] for start, end in sentence_spans[left:right + 1])
+
+
+def get_context_texts(parts, sentence_spans):
+    """Text with cut context for each location in the parts."""
+    plain_text, loc_spans = render_plain(parts)
+
+    texts = []
+    for loc_span in loc_spans:
+        text, shift = mark_location(plain_text, loc_span)
+        texts.append(cut_context(
+            text,
+            [(shift(start), shift(end, is_end=True)) for start, end in sentence_spans],
+            (loc_span[0], shift(loc_span[1], is_end=True))
+        ))
+    return texts
+
+
+def needs_split(parts):
+    """Check if some annotated text of the parts exceeds the limit."""
+    n_chars = sum(len(part if isinstance(part, str) else part['loc']) for part in parts)
+    return n_chars + len(START_MARKER) + len(END_MARKER) + 1 > MAX_CONTEXT_CHARS
+
+
+def get_contexts(records, segmenter):
+    """
+    Texts with cut context for each location of each play.
+    `records` are (lang, playname, record); all long utterances
+    of a language are split into sentences in one batch.
+    Return {playname: [text, ...]}.
+    """
+    play_parts = {
+        playname: (lang, list(get_single_location_parts(record)))
+        for lang, playname, record in records
+    }
+
+    to_split = {}
+    for playname, (lang, utterances) in play_parts.items():
+        for i, parts in enumerate(utterances):
+            if needs_split(parts):
+                to_split[(playname, i)] = (lang, render_plain(parts)[0])
+
+    sentence_spans = {}
+    for lang in LANGS:
+        keys = [key for key, (text_lang, _) in to_split.items() if text_lang == lang]
+        segmented = segmenter.segment(lang, [to_split[key][1] for key in keys])
+        sentence_spans.update(zip(keys, segmented))
+
+    contexts = {}
+    for playname, (_, utterances) in play_parts.items():
+        contexts[playname] = []
+        for i, parts in enumerate(utterances):
+            contexts[playname] += get_context_texts(parts, sentence_spans.get((playname, i), []))
+
+    segmenter.save()
+    return contexts
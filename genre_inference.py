@@ -0,0 +1,134 @@
+from response_cache import MISSING, ResponseCache
+
+
+# Batched mGENRE inference for `GENRE.ipynb`.
+# Identical texts ([START] ... [END] contexts) are decoded once;
+# unique texts are grouped by constraint, sorted by length and split into batches,
+# so that texts in a batch need little padding and share one title trie
+# (fairseq reorders a batch by length, so `batch_id` of `prefix_allowed_tokens_fn`
+# cannot be used to find the trie of a text).
+# Results are kept in a ResponseCache keyed by (model, text, beam, constraint),
+# so after a corpus edit only new contexts are decoded.
+# Decoding of a text can be constrained by its own title trie
+# (e.g. titles of its Wikidata candidates, see `genre_candidates.py`).
+
+
+MODEL_NAME = 'fairseq_multilingual_entity_disambiguation'
+BEAM = 5
+BATCH_SIZE = 16
+N_THREADS = 4  # intra-op threads of torch on CPU
+
+
+def set_threads(n_threads=N_THREADS):
+    import torch
+    torch.set_num_threads(n_threads)
+
+
+def open_cache(path):
+    """Cache of model outputs; they do not expire."""
+    return ResponseCache(path, ttl=None)
+
+
+def make_batches(items, batch_size=BATCH_SIZE):
+    """
+    Group (text, constraint name) by constraint name, sort each group by length of text
+    and split it into batches, so that all texts of a batch have the same constraint.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(item[1], []).append(item)
+
+    batches = []
+    for group in groups.values():
+        group = sorted(group, key=lambda item: len(item[0]))
+        batches.extend(group[i:i + batch_size] for i in range(0, len(group), batch_size))
+    return batches
+
+
+class GenreLinker:
+    """
+    Usage:
+        linker = GenreLinker(model, prefix_allowed_tokens_fn, cache=open_cache(path))
+        results = linker.link(texts)
+    `constraint` names the set of titles allowed by `prefix_allowed_tokens_fn`
+    (it is a part of the cache key).
+    `link` can get a (name, trie) constraint for each text
+    to decode it with the trie instead of `prefix_allowed_tokens_fn`.
+    """
+    def __init__(
+            self,
+            model,
+            prefix_allowed_tokens_fn=None,
+            model_name=MODEL_NAME,
+            beam=BEAM,
+            batch_size=BATCH_SIZE,
+            cache=None,
+            constraint='titles'
+    ):
+        self.model = model
+        self.prefix_allowed_tokens_fn = prefix_allowed_tokens_fn
+        self.model_name = model_name
+        self.beam = beam
+        self.batch_size = batch_size
+        self.cache = cache
+        self.constraint = constraint
+
+    def get_cache_params(self, text, constraint=None):
+        return {'text': text, 'beam': self.beam, 'constraint': constraint or self.constraint}
+
+    def get_prefix_allowed_tokens_fn(self, trie=None):
+        """
+        Allowed tokens from the trie shared by all texts of the batch,
+        or from `prefix_allowed_tokens_fn` if there is no trie.
+        """
+        if trie is None:
+            return self.prefix_allowed_tokens_fn
+
+        def get_allowed_tokens(batch_id, sent):
+            return trie.get(sent.tolist())
+
+        return get_allowed_tokens
+
+    def decode(self, texts, trie=None):
+        """Run the model on a batch; scores are converted to float for json."""
+        linked_locations = self.model.sample(
+            texts,
+            beam=self.beam,
+            prefix_allowed_tokens_fn=self.get_prefix_allowed_tokens_fn(trie)
+        )
+        return [
+            [{'text': loc['text'], 'score': float(loc['score'])} for loc in loc_group]
+            for loc_group in linked_locations
+        ]
+
+    def link(self, texts, constraints=None, verbose=False):
+        """
+        Return [text, [{'text': title, 'score': score}, ...]] for each text.
+        `constraints` are (name, trie) or None (no own trie) for each text.
+        """
+        constraints = [constraint or (None, None) for constraint in constraints or [None] * len(texts)]
+        keys = [(text, name) for text, (name, _) in zip(texts, constraints)]
+        tries = {key: trie for key, (_, trie) in zip(keys, constraints)}
+
+        results = {}
+        to_decode = []
+        for key in tries:
+            cached = MISSING
+            if self.cache is not None:
+                cached = self.cache.get(self.model_name, self.get_cache_params(*key), MISSING)
+            if cached is MISSING:
+                to_decode.append(key)
+            else:
+                results[key] = cached
+
+        if verbose:
+            print(f'{len(texts)} texts, {len(tries)} unique, {len(to_decode)} to decode')
+
+        for batch in make_batches(to_decode, self.batch_size):
+            batch_texts = [text for text, _ in batch]
+            for key, loc_group in zip(batch, self.decode(batch_texts, tries[batch[0]])):
+                results[key] = loc_group
+                if self.cache is not None:
+                    self.cache.set(self.model_name, self.get_cache_params(*key), loc_group)
+
+        return [[text, results[key]] for text, key in zip(texts, keys)]
@@ -0,0 +1,155 @@
+import json
+import pickle
+import argparse
+
+import marisa_trie
+
+
+# Prefix tree of Wikipedia titles for mGENRE restricted to WIKILANGS.
+# The released trie (`titles_lang_all105_marisa_trie_with_redirect.pkl`)
+# covers 105 languages and is unpickled into memory; titles of other languages
+# are dropped later anyway. This script keeps only ru/es titles once and saves
+# them in marisa format, which `load_lang_trie` memory-maps instead of reading.
+#
+# Title sequences are [2] + tokens of `title >> lang` + [2] (see GENRE README);
+# tokens are stored as characters like in `genre.trie.MarisaTrie`,
+# so titles of a language are the keys ending with the tokens of ` >> lang`.
+
+
+WIKILANGS = ['ru', 'es']
+FULL_TRIE_FILENAME = 'titles_lang_all105_marisa_trie_with_redirect.pkl'
+TRIE_FILENAME = 'titles_ru_es_marisa_trie_with_redirect.marisa'
+MODEL_NAME = 'fairseq_multilingual_entity_disambiguation'
+
+
+def token_to_char(token):
+    """Same encoding as `genre.trie.MarisaTrie.int2char` (surrogates are skipped)."""
+    return chr(token) if token < 55000 else chr(token + 10000)
+
+
+def char_to_token(char):
+    code = ord(char)
+    return code if code < 55000 else code - 10000
+
+
+def encode_sequence(sequence):
+    return ''.join(token_to_char(token) for token in sequence)
+
+
+def get_lang_suffix(model, lang):
+    """Tokens of ` >> lang` with end of sequence, as at the end of title sequences."""
+    title = model.encode('a').tolist()
+    title_with_lang = model.encode(f'a >> {lang}').tolist()
+    assert title_with_lang[:len(title) - 1] == title[:-1]
+    return title_with_lang[len(title) - 1:]
+
+
+class LangTitleTrie:
+    """
+    Title trie with the interface of `genre.trie.MarisaTrie`
+    (`get(prefix_sequence)` returns allowed next tokens).
+    """
+    def __init__(self, trie, zero_iter, first_iter):
+        self.trie = trie
+        self.zero_iter = zero_iter
+        self.first_iter = first_iter
+
+    def get(self, prefix_sequence):
+        if len(prefix_sequence) == 0:
+            return self.zero_iter
+        if len(prefix_sequence) == 1 and self.zero_iter == prefix_sequence:
+            return self.first_iter
+
+        key = encode_sequence(prefix_sequence)
+        return list({
+            char_to_token(e[len(key)])
+            for e in self.trie.keys(key)
+            if len(e) > len(key)
+        })
+
+    def __iter__(self):
+        for key in self.trie.iterkeys():
+            yield [char_to_token(char) for char in key]
+
+    def __len__(self):
+        return len(self.trie)
+
+
+def get_title_sequence(model, title, lang):
+    """Tokens of the title as in title tries: [2] + tokens of `title >> lang` + [2]."""
+    return [2] + model.encode(f'{title} >> {lang}').tolist()[1:]
+
+
+class SequenceTrie:
+    """
+    Small prefix tree of token sequences in memory
+    (e.g. titles of Wikidata candidates of one location)
+    with the same `get` as the title tries.
+    """
+    def __init__(self, sequences):
+        self.root = {}
+        for sequence in sequences:
+            node = self.root
+            for token in sequence:
+                node = node.setdefault(token, {})
+
+    def get(self, prefix_sequence):
+        node = self.root
+        for token in prefix_sequence:
+            node = node.get(token)
+            if node is None:
+                return []
+        return list(node)
+
+
+def build_lang_trie(full_trie, lang_suffixes, path=TRIE_FILENAME):
+    """
+    Save titles of the languages from `full_trie` (`genre.trie.MarisaTrie`)
+    to `path` (marisa) and first branches to `path`.json.
+    `lang_suffixes` are {lang: tokens of ` >> lang`} (see `get_lang_suffix`).
+    """
+    assert all(full_trie.int2char[i] == token_to_char(i) for i in range(0, len(full_trie.int2char), 997))
+
+    suffixes = tuple(encode_sequence(suffix) for suffix in lang_suffixes.values())
+    trie = marisa_trie.Trie(key for key in full_trie.trie.iterkeys() if key.endswith(suffixes))
+    trie.save(path)
+
+    first_branches = {
+        'zero_iter': sorted({char_to_token(key[0]) for key in trie.iterkeys()}),
+        'first_iter': sorted({char_to_token(key[1]) for key in trie.iterkeys() if len(key) > 1})
+    }
+    with open(f'{path}.json', 'w') as f:
+        json.dump(first_branches, f)
+
+    print(f'{len(trie)} of {len(full_trie.trie)} titles saved to {path}')
+
+
+def load_lang_trie(path=TRIE_FILENAME):
+    """Memory-map the trie saved by `build_lang_trie`."""
+    trie = marisa_trie.Trie()
+    trie.mmap(path)
+    with open(f'{path}.json') as f:
+        first_branches = json.load(f)
+    return LangTitleTrie(trie, first_branches['zero_iter'], first_branches['first_iter'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='save ru/es titles of the mGENRE trie in memory-mappable format')
+    parser.add_argument('--full-trie', default=FULL_TRIE_FILENAME, help='pickled trie of all languages')
+    parser.add_argument('--model', default=MODEL_NAME, help='mGENRE model folder (for tokens of languages)')
+    parser.add_argument('--output', default=TRIE_FILENAME)
+    args = parser.parse_args(argv)
+
+    from fairseq_model import mGENRE  # GENRE/genre must be in sys.path
+
+    model = mGENRE.from_pretrained(args.model).eval()
+    lang_suffixes = {lang: get_lang_suffix(model, lang) for lang in WIKILANGS}
+
+    with open(args.full_trie, 'rb') as f:
+        full_trie = pickle.load(f)
+
+    build_lang_trie(full_trie, lang_suffixes, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,9 @@
 import os
 import json
+import argparse
+from functools import lru_cache, partial
 from collections import defaultdict
 
-import pandas as pd
-from lxml import etree
 from owlready2 import (
     get_ontology,
     Thing,
@@ -12,31 +12,34 @@ from owlready2 import (
     DataProperty
 )
 
+from corpus_index import (
+    CORPUS_FOLDER,
+    iter_utterances,
+    load_play,
+    map_plays,
+    parse_play_header
+)
+from correct_links import read_correct_links
+
+
 LANGS = {
     'rus': 'ru',
     'span': 'es'
 }
 
-CORPUS_FOLDER = os.path.join('corpus', 'final')
-KWIC_FILENAME = os.path.join('intermediate_data_files', 'location_kwic.csv')
-CORRECT_LINKS_FILENAME = os.path.join('disambiguation_annotation', 'correct_links.csv')
 NORMALIZED_LOCATIONS_FILENAME = os.path.join(
     'intermediate_data_files',
     'locations_normalized.json'
 )
 CORPUS_INFO_FILENAME = 'corpus_ontology_info.json'
+ONTOLOGY_FILENAME = 'locations.owl'
+BULK_ONTOLOGY_FILENAME = 'locations.nt'
 
-NAMESPACE = {
-    'ns': 'http://www.tei-c.org/ns/1.0',
-    'xml': 'http://www.w3.org/XML/1998/namespace'
-}
-UTTERANCE_XPATH = '//ns:sp'
-LOC_XPATH = './/ns:loc'
-TITLE_XPATH = '//ns:title[@type="main"]'
-SPEAKER_XPATH = '//ns:particDesc/ns:listPerson/ns:person'
 
-with open(NORMALIZED_LOCATIONS_FILENAME) as f:
-    NORMALIZED_LOCATIONS = json.load(f)
+@lru_cache(maxsize=None)
+def load_normalized_locations():
+    with open(NORMALIZED_LOCATIONS_FILENAME) as f:
+        return json.load(f)
 
 
 onto = get_ontology("http://test.org/drama_locations")
@@ -71,22 +74,11 @@ with onto:
 
 
 def get_correct_links():
-    kwic = pd.read_csv(KWIC_FILENAME, sep='\t')
-    locations = list(kwic.location)
-    langs = list(kwic.lang)
-
-    with open(CORRECT_LINKS_FILENAME) as f:
-        raw_links = f.read().split('\n')
-
-    assert len(raw_links) == len(locations)
-
+    normalized_locations = load_normalized_locations()
     links = defaultdict(lambda: defaultdict(set))
-    for lang, loc, raw_link in zip(langs, locations, raw_links):
+    for lang, loc, curr_links in read_correct_links():
         wikilang = LANGS[lang]
-        raw_link = raw_link.strip().strip(',')
-        curr_links = raw_link.split(',') if raw_link else []
-        curr_links = set(curr_links)
-        loc_norm = NORMALIZED_LOCATIONS[wikilang].get(loc, loc)
+        loc_norm = normalized_locations[wikilang].get(loc, loc)
         links[wikilang][loc_norm] |= curr_links
 
     links = {
@@ -96,73 +88,48 @@ def get_correct_links():
     return links
 
 
-def get_location_counts(tree, lang):
+def get_location_counts(utterances, lang):
+    normalized_locations = load_normalized_locations()[LANGS[lang]]
     location_counts = defaultdict(lambda: defaultdict(int))
 
-    utterances = tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE)
     for utterance in utterances:
-        speaker = utterance.get('who').strip('#')
-        locs = utterance.xpath(LOC_XPATH, namespaces=NAMESPACE)
-        for loc in locs:
-            loc_norm = NORMALIZED_LOCATIONS[LANGS[lang]].get(loc.text, loc.text)
+        speaker = utterance['who']
+        for loc in utterance['loc_texts']:
+            loc_norm = normalized_locations.get(loc, loc)
             location_counts[speaker][loc_norm] += 1
 
-    return location_counts
-
-
-def get_play_title(tree):
-    titles = tree.xpath(TITLE_XPATH, namespaces=NAMESPACE)
-    for title in titles:
-        lang = title.attrib.get(f'{{{NAMESPACE["xml"]}}}lang')
-        if lang is None:
-            return title.text
-
-
-def get_play_speakers(tree):
-    speakers = {}
-    speaker_elems = tree.xpath(SPEAKER_XPATH, namespaces=NAMESPACE)
-    for speaker_elem in speaker_elems:
-        sp_id = speaker_elem.attrib.get(f'{{{NAMESPACE["xml"]}}}id')
-        name = ''
-        for child in speaker_elem:
-            lang = child.attrib.get(f'{{{NAMESPACE["xml"]}}}lang')
-            if child.tag == f"{{{NAMESPACE['ns']}}}persName" and lang is None:
-                name = child.text
-                break
+    return {speaker: dict(counts) for speaker, counts in location_counts.items()}
 
-        speakers[sp_id] = name
 
-    return speakers
+def get_play_info(lang, playname, stream=False):
+    """
+    Get location counts, title and speakers of the play.
+    If `stream` is True, read utterances one by one from XML
+    instead of the corpus index.
+    """
+    if stream:
+        xml_path = os.path.join(CORPUS_FOLDER, lang, playname)
+        record = parse_play_header(xml_path)
+        utterances = iter_utterances(xml_path)
+    else:
+        record = load_play(lang, playname)
+        utterances = record['utterances']
 
-
-def get_play_info(playname, lang):
-    with open(os.path.join(CORPUS_FOLDER, lang, playname)) as f:
-        tree = etree.parse(f)
-
-    location_counts = get_location_counts(tree, lang)
-    title = get_play_title(tree)
-    speakers = get_play_speakers(tree)
+    location_counts = get_location_counts(utterances, lang)
 
     return {
         'locations': location_counts,
-        'title': title,
-        'speakers': speakers
+        'title': record['title'],
+        'speakers': record['speakers']
     }
 
 
-def get_corpus_info():
+def get_corpus_info(stream=False, jobs=1):
     corpus_info = defaultdict(dict)
 
-    for lang in LANGS:
-        if lang.startswith('.'):
-            continue
-
-        playnames = os.listdir(os.path.join(CORPUS_FOLDER, lang))
-        for playname in playnames:
-            if not playname.endswith('.xml'):
-                continue
-
-            corpus_info[lang][playname] = get_play_info(playname, lang)
+    plays_info = map_plays(partial(get_play_info, stream=stream), jobs=jobs)
+    for lang, playname, play_info in plays_info:
+        corpus_info[lang][playname] = play_info
 
     return corpus_info
 
@@ -189,13 +156,19 @@ def get_loc_id(loc_links, loc_name):  # arbitrary decision
     return loc_links[0] if loc_links else f'NULL_{loc_name}'
 
 
-def create_location_objs(links):
+def get_location_data(links):
+    """Group links and names of locations by location id."""
     location_data = defaultdict(lambda: defaultdict(set))
     for lang_links in links.values():
         for loc_name, loc_links in lang_links.items():
             loc_id = get_loc_id(loc_links, loc_name)
             location_data[loc_id]['links'] |= set(loc_links)
             location_data[loc_id]['names'].add(loc_name)
+    return location_data
+
+
+def create_location_objs(links):
+    location_data = get_location_data(links)
 
     locations = {}
     for loc_id, loc_data in location_data.items():
@@ -239,12 +212,146 @@ def compile_ontology(corpus_info, links, location_objs):
             add_play_to_ontology(playname, info, lang_obj, links, location_objs)
 
 
-if __name__ == '__main__':
-    corpus_info = get_corpus_info()
+# Bulk build: write the same triples as `compile_ontology` + `onto.save`
+# directly to an N-Triples file, without creating owlready2 individuals.
+# Class and property definitions are taken from `onto` (saved before any
+# individuals are created), individuals are streamed play by play.
+
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+NAMED_INDIVIDUAL = '<http://www.w3.org/2002/07/owl#NamedIndividual>'
+XSD_TYPES = {
+    str: 'http://www.w3.org/2001/XMLSchema#string',
+    int: 'http://www.w3.org/2001/XMLSchema#integer'
+}
+# characters not allowed in an N-Triples IRIREF, written as \uXXXX escapes
+IRI_ESCAPES = str.maketrans({
+    char: f'\\u{ord(char):04X}' for char in [chr(i) for i in range(0x21)] + list('<>"{}|^`\\')
+})
+LITERAL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+
+
+def entity_iri(name):
+    """IRI of an entity of `onto`; only characters not allowed in N-Triples IRIs (e.g. spaces) are escaped."""
+    return f'<{onto.base_iri}{name.translate(IRI_ESCAPES)}>'
+
+
+def literal(value):
+    return f'"{str(value).translate(LITERAL_ESCAPES)}"^^<{XSD_TYPES[type(value)]}>'
+
+
+def individual_triples(name, cls, properties):
+    """
+    N-Triples lines for an individual of the class `cls`.
+    `properties` are (property, value) pairs; values are individual names
+    (for object properties) or str/int literals (for data properties).
+    """
+    subject = entity_iri(name)
+    lines = [
+        f'{subject} {RDF_TYPE} {NAMED_INDIVIDUAL} .\n',
+        f'{subject} {RDF_TYPE} {entity_iri(cls.name)} .\n'
+    ]
+    for prop, value in properties:
+        if value is None:
+            continue
+        if issubclass(prop, ObjectProperty):
+            value = entity_iri(value)
+        else:
+            value = literal(value)
+        lines.append(f'{subject} {entity_iri(prop.name)} {value} .\n')
+    return lines
+
+
+def location_triples(links):
+    for loc_id, loc_data in get_location_data(links).items():
+        yield from individual_triples(
+            loc_id,
+            Location,
+            [(wikidata_id, link) for link in loc_data['links']]
+            + [(location_name, name) for name in loc_data['names']]
+        )
+
+
+def speaker_triples(speaker_id, speaker_name, play_id):
+    speaker_obj_id = f'#{play_id}_{speaker_id}'
+    return speaker_obj_id, individual_triples(
+        speaker_obj_id,
+        Speaker,
+        [(has_name, speaker_name), (is_character_of, play_id)]
+    )
+
+
+def play_triples(playname, play_info, lang, links):
+    """Same individuals as `add_play_to_ontology`."""
+    play_id = playname[:-4]
+    yield from individual_triples(
+        play_id,
+        Play,
+        [(in_language, lang), (has_title, play_info['title'])]
+    )
+
+    speaker_ids = {}
+    for speaker_id, name in play_info['speakers'].items():
+        speaker_ids[speaker_id], lines = speaker_triples(speaker_id, name, play_id)
+        yield from lines
+
+    for speaker, places in play_info['locations'].items():
+        speaker_obj_id = speaker_ids.get(speaker)
+        if speaker_obj_id is None:
+            speaker_obj_id, lines = speaker_triples(speaker, speaker, play_id)
+            yield from lines
+
+        for place, n_mentions in places.items():
+            location_id = get_loc_id(links[LANGS[lang]][place], place)
+            loc_mention_id = f'#mention_{speaker_obj_id}_{place}'
+            yield from individual_triples(
+                loc_mention_id,
+                NMentions,
+                [(is_about, location_id), (n, n_mentions)]
+            )
+            yield f'{entity_iri(speaker_obj_id)} {entity_iri(mentions_n.name)} {entity_iri(loc_mention_id)} .\n'
+
+
+def write_ontology_bulk(corpus_info, links, filename):
+    """Write the ontology to an N-Triples file line by line."""
+    with open(filename, 'wb') as f:
+        onto.save(f, format='ntriples')
+
+    with open(filename, 'a') as f:
+        f.writelines(location_triples(links))
+        for lang, plays in corpus_info.items():
+            f.writelines(individual_triples(lang, Language, []))
+            for playname, info in plays.items():
+                f.writelines(play_triples(playname, info, lang, links))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='compile the ontology of plays, speakers and locations')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='stream plays from XML with bounded memory instead of the corpus index'
+    )
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help=f'write triples directly to {BULK_ONTOLOGY_FILENAME} instead of building owlready2 objects'
+    )
+    args = parser.parse_args(argv)
+
+    corpus_info = get_corpus_info(args.stream, args.jobs)
     with open(CORPUS_INFO_FILENAME, 'w') as f:
         json.dump(corpus_info, f, indent=2, ensure_ascii=False)
 
     links = get_correct_links()
+    if args.bulk:
+        write_ontology_bulk(corpus_info, links, BULK_ONTOLOGY_FILENAME)
+        return
+
     location_objs = create_location_objs(links)
     compile_ontology(corpus_info, links, location_objs)
-    onto.save('locations.owl')
+    onto.save(ONTOLOGY_FILENAME)
+
+
+if __name__ == '__main__':
+    main()
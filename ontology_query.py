@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+from collections import defaultdict
+
+
+# Query the compiled ontology (`ontology.py`): which plays and speakers
+# mention a location, which locations a play or a language mentions,
+# which locations are shared across languages.
+# The ontology is scanned once with owlready2; mentions are saved
+# to an index file (rebuilt when the ontology file changes),
+# and lookup tables are built from it in memory.
+
+
+ONTOLOGY_FILENAME = 'locations.owl'
+INDEX_FILENAME = os.path.join('intermediate_data_files', 'ontology_index.json')
+INDEX_VERSION = 3
+IRI_ESCAPE_REGEX = re.compile(r'\\u([0-9A-Fa-f]{4})|\\U([0-9A-Fa-f]{8})')
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def unescape_iri(iri):
+    """Decode \\uXXXX escapes of an N-Triples IRI (owlready2 keeps them as they are)."""
+    return IRI_ESCAPE_REGEX.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)), iri)
+
+
+def get_name(entity, base_iri, escaped=False):
+    """Name of the entity in the ontology namespace; `escaped` IRIs are read from N-Triples."""
+    iri = unescape_iri(entity.iri) if escaped else entity.iri
+    if iri.startswith(base_iri):
+        return iri[len(base_iri):].lstrip('#')
+    return entity.name
+
+
+def scan_ontology(ontology_path):
+    """Read plays, speakers, locations and mentions from the ontology."""
+    from owlready2 import World
+
+    world = World()
+    onto = world.get_ontology(f'file://{os.path.abspath(ontology_path)}').load()
+    base_iri = onto.base_iri
+    escaped = ontology_path.endswith('.nt')  # written by `ontology.py --bulk`
+
+    plays = {}
+    for play in onto.Play.instances():
+        plays[get_name(play, base_iri, escaped)] = {
+            'title': play.has_title,
+            'lang': play.in_language.name if play.in_language else None
+        }
+
+    locations = {}
+    for loc in onto.Location.instances():
+        locations[get_name(loc, base_iri, escaped)] = {
+            'names': sorted(loc.location_name),
+            'wikidata_ids': sorted(loc.wikidata_id)
+        }
+
+    speakers = {}
+    mentions = []
+    for speaker in onto.Speaker.instances():
+        speaker_id = get_name(speaker, base_iri, escaped)
+        play = speaker.is_character_of
+        speakers[speaker_id] = {
+            'name': speaker.has_name,
+            'play': get_name(play, base_iri, escaped) if play else None
+        }
+        for mention in speaker.mentions_n:
+            mentions.append([speaker_id, get_name(mention.is_about, base_iri, escaped), mention.n])
+
+    world.close()
+    return {
+        'plays': plays,
+        'locations': locations,
+        'speakers': speakers,
+        'mentions': mentions
+    }
+
+
+def load_index_data(ontology_path=ONTOLOGY_FILENAME, index_path=INDEX_FILENAME):
+    """Load saved index or scan the ontology if it changed."""
+    ontology_hash = hash_file(ontology_path)
+
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            data = json.load(f)
+        if data.get('version') == INDEX_VERSION and data.get('ontology_hash') == ontology_hash:
+            return data
+
+    data = scan_ontology(ontology_path)
+    data['version'] = INDEX_VERSION
+    data['ontology_hash'] = ontology_hash
+    with open(index_path, 'w') as f:
+        json.dump(data, f, ensure_ascii=False)
+    return data
+
+
+def sort_counts(counts):
+    """Sort {key: count} by count (desc), then key."""
+    return sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+
+
+class OntologyIndex:
+    """
+    Lookup tables over mentions of the ontology:
+    location -> plays / speakers, play -> locations, language -> locations.
+    Locations can be queried by Wikidata ID, location id or location name.
+    Query results are cached.
+    """
+    def __init__(self, data):
+        self.plays = data['plays']
+        self.locations = data['locations']
+        self.speakers = data['speakers']
+
+        self.ids_by_key = defaultdict(set)
+        for loc_id, loc in self.locations.items():
+            for key in [loc_id] + loc['wikidata_ids'] + loc['names']:
+                self.ids_by_key[key].add(loc_id)
+
+        self.location_plays = defaultdict(lambda: defaultdict(int))
+        self.location_speakers = defaultdict(lambda: defaultdict(int))
+        self.play_locations = defaultdict(lambda: defaultdict(int))
+        self.lang_locations = defaultdict(lambda: defaultdict(int))
+        self.speaker_locations = defaultdict(set)
+
+        for speaker_id, loc_id, n in data['mentions']:
+            play = self.speakers[speaker_id]['play']
+            lang = self.plays.get(play, {}).get('lang')
+            self.location_plays[loc_id][play] += n
+            self.location_speakers[loc_id][speaker_id] += n
+            self.play_locations[play][loc_id] += n
+            self.lang_locations[lang][loc_id] += n
+            self.speaker_locations[speaker_id].add(loc_id)
+
+        self.results = {}  # (query, arguments) -> result
+
+    @classmethod
+    def load(cls, ontology_path=ONTOLOGY_FILENAME, index_path=INDEX_FILENAME):
+        return cls(load_index_data(ontology_path, index_path))
+
+    def resolve(self, location):
+        """Location ids by Wikidata ID, location id or name."""
+        return sorted(self.ids_by_key.get(location, []))
+
+    def _cached(self, query, args, get_result):
+        if (query, args) not in self.results:
+            self.results[(query, args)] = get_result()
+        return self.results[(query, args)]
+
+    def _merge_counts(self, table, location):
+        counts = defaultdict(int)
+        for loc_id in self.resolve(location):
+            for key, n in table[loc_id].items():
+                counts[key] += n
+        return sort_counts(counts)
+
+    def plays_mentioning(self, location):
+        """[(play, n mentions)] for the location."""
+        return self._cached(
+            'plays', location,
+            lambda: self._merge_counts(self.location_plays, location)
+        )
+
+    def speakers_mentioning(self, location):
+        """[(speaker id, n mentions)] for the location."""
+        return self._cached(
+            'speakers', location,
+            lambda: self._merge_counts(self.location_speakers, location)
+        )
+
+    def locations_of_play(self, play):
+        """[(location id, n mentions)] in the play."""
+        return self._cached('play', play, lambda: sort_counts(self.play_locations.get(play, {})))
+
+    def locations_of_language(self, lang):
+        """[(location id, n mentions)] in plays of the language."""
+        return self._cached('language', lang, lambda: sort_counts(self.lang_locations.get(lang, {})))
+
+    def shared_locations(self, langs=None):
+        """Location ids mentioned in plays of all given languages (all by default)."""
+        langs = tuple(langs or self.lang_locations)
+        return self._cached('shared', langs, lambda: self._get_shared_locations(langs))
+
+    def _get_shared_locations(self, langs):
+        if not langs:
+            return []
+        return sorted(set.intersection(*[set(self.lang_locations.get(lang, {})) for lang in langs]))
+
+    def top_speakers(self, top=10, exclude=()):
+        """
+        Speakers mentioning the most distinct locations,
+        not counting `exclude` (e.g. Wikidata IDs of home countries
+        to get speakers mentioning the most foreign places).
+        """
+        exclude = tuple(exclude)
+        return self._cached('top-speakers', (top, exclude), lambda: self._get_top_speakers(top, exclude))
+
+    def _get_top_speakers(self, top, exclude):
+        excluded = {loc_id for location in exclude for loc_id in self.resolve(location)}
+        counts = {
+            speaker_id: len(loc_ids - excluded)
+            for speaker_id, loc_ids in self.speaker_locations.items()
+        }
+        return sort_counts(counts)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='query the compiled ontology')
+    parser.add_argument('--ontology', default=ONTOLOGY_FILENAME, help='ontology file (.owl or .nt)')
+    parser.add_argument('--index', default=INDEX_FILENAME, help='index file')
+    subparsers = parser.add_subparsers(dest='query', required=True)
+
+    subparsers.add_parser('plays', help='plays mentioning a location').add_argument(
+        'location', help='Wikidata ID, location id or name'
+    )
+    subparsers.add_parser('speakers', help='speakers mentioning a location').add_argument(
+        'location', help='Wikidata ID, location id or name'
+    )
+    subparsers.add_parser('play', help='locations mentioned in a play').add_argument('play')
+    subparsers.add_parser('language', help='locations mentioned in plays of a language').add_argument('lang')
+    subparsers.add_parser('shared', help='locations mentioned in all languages').add_argument(
+        'langs', nargs='*', help='languages (all by default)'
+    )
+    top_parser = subparsers.add_parser('top-speakers', help='speakers mentioning the most locations')
+    top_parser.add_argument('-n', type=int, default=10, help='number of speakers')
+    top_parser.add_argument('--exclude', nargs='*', default=[], help='locations not to count (e.g. home country)')
+    args = parser.parse_args(argv)
+
+    index = OntologyIndex.load(args.ontology, args.index)
+
+    if args.query == 'plays':
+        results = index.plays_mentioning(args.location)
+    elif args.query == 'speakers':
+        results = index.speakers_mentioning(args.location)
+    elif args.query == 'play':
+        results = index.locations_of_play(args.play)
+    elif args.query == 'language':
+        results = index.locations_of_language(args.lang)
+    elif args.query == 'shared':
+        results = index.shared_locations(tuple(args.langs) or None)
+    else:
+        results = index.top_speakers(args.n, tuple(args.exclude))
+
+    for result in results:
+        print('\t'.join(map(str, result)) if isinstance(result, (list, tuple)) else result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+import os
+import argparse
+from io import BytesIO
+from time import sleep
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+from lxml import etree
+
+from corpus_index import NAMESPACE, UTTERANCE_XPATH, TEXT_XPATH, SPACE_REGEX
+
+
+# Run Stanza NER on DraCor plays and insert found locations
+# as <loc> elements (`NER.ipynb`); the output is the autoparsed corpus.
+# Texts of all <p> tags are extracted first and sent to Stanza
+# in batches of documents, instead of one pipeline call per <p> tag.
+# With --jobs N, batches are processed in N worker processes,
+# each with its own ru / es pipelines.
+# Locations are then inserted back into their <p> tags.
+
+
+API = 'https://dracor.org/api'
+AUTO_CORPUS_FOLDER = os.path.join('corpus', 'autoparsed')
+
+DRACOR_TO_STANZA = {
+    'span': 'es',
+    'rus': 'ru'
+}
+PROCESSORS = 'tokenize,ner'
+
+PLAYS = {
+    'rus': [
+        'bulgakov-beg',
+        'petrov-ostrov-mira',
+        'bulgakov-zojkina-kvartira',
+        'chekhov-vishnevyi-sad',
+        'ostrovsky-bespridannitsa',
+        'chekhov-tri-sestry',
+        'ostrovsky-groza',
+        'turgenev-holostjak',
+        'gogol-revizor',
+        'ostrovsky-beshenye-dengi'
+    ],
+    'span': [
+        'clarin-teresa',
+        'dicenta-juan-jose',
+        'echegaray-arrastrarse',
+        'echegaray-mancha',
+        'galdos-casandra',
+        'galdos-electra',
+        'galdos-perfecta',
+        'lorca-bernarda',
+        'lorca-bodas',
+        'lorca-rosita',
+        'lorca-yerma',
+        'lorca-zapatera',
+        'munoz-conferencia',
+        'munoz-ortiz',
+        'munoz-pergaminos',
+        'munoz-refugio',
+        'unamuno-esfinge',
+        'unamuno-fedra',
+        'valera-asclepigenia',
+        'valera-atahualpa',
+        'valle-aguila',
+        'valle-cara',
+        'valle-divinas-palabras',
+        'valle-luces',
+        'valle-romance'
+    ]
+}
+
+LOC_XPATH = '//loc'
+BATCH_SIZE = 1000  # <p> texts in one pipeline call
+
+# same attributes as Stanza entities used below
+Location = namedtuple('Location', ['text', 'start_char', 'end_char'])
+
+
+def download_play_texts(plays=PLAYS):
+    """Get TEI of the plays {lang: {playname: xml}} from DraCor API."""
+    playtexts = {}
+    for lang, playlist in plays.items():
+        playtexts[lang] = {}
+        for playname in playlist:
+            endpoint = f'{API}/corpora/{lang}/play/{playname}/tei'
+            playtexts[lang][playname] = requests.get(endpoint).text
+            sleep(1)  # just in case: to avoid DDoS :)
+    return playtexts
+
+
+def load_play_texts(folder):
+    """Get TEI of all plays {lang: {playname: xml}} saved as `folder/lang/playname.xml`."""
+    playtexts = {}
+    for lang in DRACOR_TO_STANZA:
+        playtexts[lang] = {}
+        for filename in sorted(os.listdir(os.path.join(folder, lang))):
+            if filename.endswith('.xml'):
+                with open(os.path.join(folder, lang, filename)) as f:
+                    playtexts[lang][filename[:-len('.xml')]] = f.read()
+    return playtexts
+
+
+# Prepare the text for NER parsing and save all other XML elements.
+
+def get_text_parts(p_tag):
+    """In <p> tag, separate raw text and XML elements"""
+    parts = []
+
+    if p_tag.text:
+        parts.append(p_tag.text)
+
+    for child in p_tag:
+        parts.append(child)
+        if child.tail:
+            parts.append(child.tail)
+
+    return parts
+
+
+def compile_relevant_text(parts):
+    """
+    From all parts of <p> tag (got from get_text_parts),
+    compile the text for NER parsing and save information
+    about relevant parts.
+    """
+    selected_parts = []  # parts of text for NER parsing
+    selected_part_idxs = []  # idxs of parts where the locations will be annotated
+    selected_char_idxs = []  # starts and ends of parts in the string
+
+    prev_end_idx = 0
+    for i, part in enumerate(parts):
+        text = part if isinstance(part, str) else part.text
+        preproc = SPACE_REGEX.sub(' ', text)
+        end_idx = prev_end_idx + len(preproc)
+
+        if not isinstance(part, str):
+            # replace all `\n` inside <stage> tag for convenience
+            # but not include it into parsing
+            if part.tag == 'stage':
+                part.text = preproc
+            else:
+                # include tag text into the string
+                # but not to the list of parts where locations will be annotated
+                # (because if it is in some tag, it's probably another entity)
+                selected_parts.append(preproc)
+                prev_end_idx = end_idx
+            continue
+
+        selected_parts.append(preproc)
+        selected_part_idxs.append(i)
+        selected_char_idxs.append((prev_end_idx, end_idx))
+        prev_end_idx = end_idx
+
+    return (
+        ''.join(selected_parts),
+        selected_part_idxs,
+        selected_char_idxs
+    )
+
+
+# Insert parsed locations to the <p> tag as XML elements.
+
+def group_locations_by_relevant_parts(locations, selected_char_idxs):
+    """Save the list of locations for each relevant part"""
+    locations_by_part = [[] for _ in selected_char_idxs]
+
+    curr_part_idx = 0
+    for location in locations:
+        # find corresponding part for a location
+        while location.start_char >= selected_char_idxs[curr_part_idx][1]:
+            curr_part_idx += 1
+
+        part_start, part_end = selected_char_idxs[curr_part_idx]
+        # location should be strictly inside the part
+        if part_start <= location.start_char and location.end_char < part_end:
+            locations_by_part[curr_part_idx].append(location)
+
+    return locations_by_part
+
+
+def create_elems_from_locations(location_lst, part_text, part_start):
+    """
+    Create XML elemets for each location found in the string part.
+    If no locations are found, raw text is the only element in the part.
+    """
+    parsed_elems = []
+    prev_end_idx = 0
+
+    for ent in location_lst:
+        # create XML element for a location
+        ent_start = ent.start_char - part_start
+        ent_end = ent.end_char - part_start
+        loc_elem = etree.Element('loc')
+        loc_elem.text = ent.text
+
+        # Account for all text before the entity
+        # (put it as a starting text of the part or join it to previous element)
+        starting_text = part_text[prev_end_idx:ent_start]
+        if not parsed_elems:
+            parsed_elems.append(starting_text)
+        else:
+            parsed_elems[-1].tail = starting_text
+
+        parsed_elems.append(loc_elem)
+        prev_end_idx = ent_end
+
+    if parsed_elems:  # join the remaining text to the last entity
+        parsed_elems[-1].tail = part_text[prev_end_idx:]
+    else:  # if there were no locations, raw text is the only element
+        parsed_elems = [part_text]
+
+    return parsed_elems
+
+
+def create_elems_from_ner(text, locations, all_parts, selected_part_idxs, selected_char_idxs):
+    """
+    Update parts of <p> tag so that they include DOM elements for all locations
+    while preserving all other elements that were there before parsing.
+    """
+    locations_by_part = group_locations_by_relevant_parts(locations, selected_char_idxs)
+
+    for location_lst, char_span, part_idx in zip(locations_by_part, selected_char_idxs, selected_part_idxs):
+        part_start, part_end = char_span
+        part_text = text[part_start:part_end]
+        parsed_elems = create_elems_from_locations(location_lst, part_text, part_start)
+        all_parts[part_idx] = parsed_elems
+
+    return all_parts
+
+
+def flatten_parts(all_parts):
+    """
+    From collected elements for each part,
+    make a flattened element list that can be inserted in <p>
+    """
+    flat_parts = []
+    for element_lst in all_parts:
+        # an initial XML tag inside <p>, not touched by parsing, e.g. <stage> or <rs>
+        if not isinstance(element_lst, list):
+            element_lst = [element_lst]
+
+        for i, element in enumerate(element_lst):
+            # if the first element is a raw string, add it as a <p> starting text
+            # or join to element from previous part
+            if not i and isinstance(element, str):
+                if not flat_parts:
+                    flat_parts.append(element)
+                else:
+                    flat_parts[-1].tail = element
+
+            else:  # all other elements in the list are definitely XML elements
+                flat_parts.append(element)
+
+    return flat_parts
+
+
+def replace_text_in_tag(parsed_elems, p_tag):
+    """Replace everything inside <p> with new parts with parsed locations"""
+    for child in list(p_tag):
+        p_tag.remove(child)
+    p_tag.text = ''
+
+    for i, elem in enumerate(parsed_elems):
+        if not i and isinstance(elem, str):
+            p_tag.text = elem
+        else:
+            p_tag.append(elem)
+
+
+# Run NER in batches, in worker processes.
+
+PIPELINES = {}  # lang -> Stanza pipeline of the process
+USE_GPU = True
+
+
+def download_models(langs):
+    """Download models once before workers load them."""
+    import stanza
+    for lang in langs:
+        stanza.download(DRACOR_TO_STANZA[lang], processors=PROCESSORS, logging_level='WARN')
+
+
+def init_ner_worker(use_gpu=True, n_threads=None):
+    global USE_GPU
+    USE_GPU = use_gpu
+    if n_threads is not None:
+        import torch
+        torch.set_num_threads(n_threads)
+
+
+def get_pipeline(lang):
+    if lang not in PIPELINES:
+        import stanza
+        PIPELINES[lang] = stanza.Pipeline(
+            lang=DRACOR_TO_STANZA[lang],
+            processors=PROCESSORS,
+            use_gpu=USE_GPU,
+            download_method=None,
+            logging_level='WARN'
+        )
+    return PIPELINES[lang]
+
+
+def find_locations(lang, texts):
+    """Run NER on a batch of texts; return a list of LOC entities for each text."""
+    import stanza
+    docs = get_pipeline(lang)([stanza.Document([], text=text) for text in texts])
+    return [
+        [Location(ent.text, ent.start_char, ent.end_char) for ent in doc.ents if ent.type == 'LOC']
+        for doc in docs
+    ]
+
+
+def find_all_locations(texts, batch_size=BATCH_SIZE, jobs=1, use_gpu=True):
+    """
+    Find locations in all texts [(lang, text), ...].
+    Texts are split into batches by language; batches run in `jobs` processes.
+    """
+    batches = []
+    for lang in DRACOR_TO_STANZA:
+        idxs = [i for i, (text_lang, _) in enumerate(texts) if text_lang == lang]
+        for start in range(0, len(idxs), batch_size):
+            batches.append((lang, idxs[start:start + batch_size]))
+
+    batch_langs = [lang for lang, _ in batches]
+    batch_texts = [[texts[i][1] for i in idxs] for _, idxs in batches]
+    if jobs > 1 and len(batches) > 1:
+        n_threads = max(1, (os.cpu_count() or 1) // jobs)
+        with ProcessPoolExecutor(jobs, initializer=init_ner_worker, initargs=(use_gpu, n_threads)) as executor:
+            results = list(executor.map(find_locations, batch_langs, batch_texts))
+    else:
+        init_ner_worker(use_gpu)
+        results = [find_locations(lang, batch) for lang, batch in zip(batch_langs, batch_texts)]
+
+    locations = [[] for _ in texts]
+    for (_, idxs), batch_locations in zip(batches, results):
+        for i, text_locations in zip(idxs, batch_locations):
+            locations[i] = text_locations
+    return locations
+
+
+def get_relevant_texts(tree):
+    """
+    Get (p_tag, all_parts, text, selected_part_idxs, selected_char_idxs)
+    for every <p> tag of utterances that has relevant text.
+    """
+    p_texts = []
+    for utterance in tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE):
+        for p_tag in utterance.xpath(TEXT_XPATH, namespaces=NAMESPACE):
+            # get the text for parsing and save other elements inside <p> tag
+            all_parts = get_text_parts(p_tag)
+            text, selected_part_idxs, selected_char_idxs = compile_relevant_text(all_parts)
+            # if there's no relevant text, leave <p> as it was
+            if text:
+                p_texts.append((p_tag, all_parts, text, selected_part_idxs, selected_char_idxs))
+    return p_texts
+
+
+def write_play(tree, xml_path):
+    xml_str = etree.tostring(
+        tree,
+        pretty_print=True,
+        encoding='utf-8',
+        xml_declaration=True
+    ).decode('utf-8')
+
+    with open(xml_path, 'w', encoding='utf-8') as f:
+        f.write(xml_str)
+
+
+def parse_ner_in_plays(
+        playtexts,
+        output_folder=AUTO_CORPUS_FOLDER,
+        batch_size=BATCH_SIZE,
+        jobs=1,
+        use_gpu=True
+):
+    """
+    The main function.
+    Take XML of the plays {lang: {playname: xml}}, collect texts of <p> tags
+    in utterances, find locations in all of them, insert locations
+    as XML elements and write new XML of each play into a file.
+    """
+    plays = []
+    texts = []
+    for lang, corpus in playtexts.items():
+        for playname, xml_text in corpus.items():
+            tree = etree.parse(BytesIO(xml_text.encode('utf-8')))
+            p_texts = get_relevant_texts(tree)
+            plays.append((lang, playname, tree, p_texts))
+            # whitespace-only texts have no locations, but their <p> is still rebuilt
+            texts += [(lang, text) for _, _, text, _, _ in p_texts if text.strip()]
+
+    locations = iter(find_all_locations(texts, batch_size, jobs, use_gpu))
+
+    for lang, playname, tree, p_texts in plays:
+        for p_tag, all_parts, text, selected_part_idxs, selected_char_idxs in p_texts:
+            p_locations = next(locations) if text.strip() else []
+            all_parts = create_elems_from_ner(
+                text,
+                p_locations,
+                all_parts,
+                selected_part_idxs,
+                selected_char_idxs
+            )
+            replace_text_in_tag(flatten_parts(all_parts), p_tag)
+
+        n_utterances = len(tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE))
+        n_locations = len(tree.xpath(LOC_XPATH, namespaces=NAMESPACE))
+        print(f'{lang} {playname}: {n_utterances} utterances, {n_locations} locations')
+
+        os.makedirs(os.path.join(output_folder, lang), exist_ok=True)
+        write_play(tree, os.path.join(output_folder, lang, f'{playname}.xml'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', help='parse TEI files lang/playname.xml of this folder instead of the plays from DraCor API')
+    parser.add_argument('--output', default=AUTO_CORPUS_FOLDER, help='folder for the parsed plays')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='<p> texts in one pipeline call')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--cpu', action='store_true', help='do not use GPU')
+    args = parser.parse_args(argv)
+
+    if args.source is not None:
+        playtexts = load_play_texts(args.source)
+    else:
+        playtexts = download_play_texts()
+    download_models(playtexts)
+    parse_ner_in_plays(playtexts, args.output, args.batch_size, args.jobs, not args.cpu)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+# Run the whole processing pipeline (see README) incrementally.
+# Each stage declares its inputs and outputs. Content hashes of inputs
+# (including the code of the stage) are saved after a successful run,
+# and a stage is re-run only if its inputs changed or its outputs are missing.
+# Stages whose inputs are ready run concurrently.
+# Optional inputs are produced outside the pipeline (e.g. `genre_ranking.json`
+# by `GENRE.ipynb`); a stage runs without them and re-runs when they appear.
+#
+# Rebuilds are per stage, not per play. A folder is hashed as a whole, so
+# editing one play re-runs every stage downstream of the corpus, and each
+# of them processes all plays again; stages are not told which plays changed.
+# The only per-play reuse is the `corpus_index.py` cache: records of unchanged
+# plays are read from it instead of being parsed again.
+
+
+DATA_DIR = 'intermediate_data_files'
+ANN_DIR = 'disambiguation_annotation'
+STATE_FILENAME = os.path.join(DATA_DIR, 'pipeline_state.json')
+
+AUTO_CORPUS_FOLDER = os.path.join('corpus', 'autoparsed')
+FIXED_CORPUS_FOLDER = os.path.join('corpus', 'fixed')
+FINAL_CORPUS_FOLDER = os.path.join('corpus', 'final')
+KWIC_FILENAME = os.path.join(DATA_DIR, 'location_kwic.csv')
+NORMALIZED_LOCATIONS_FILENAME = os.path.join(DATA_DIR, 'locations_normalized.json')
+STALE_LOCATIONS_FILENAME = os.path.join(DATA_DIR, 'locations_normalized_stale.json')
+LOC_INFO_FILENAME = os.path.join(DATA_DIR, 'wikidata_locations_info.json')
+RANKING_FILENAME = os.path.join(DATA_DIR, 'wikidata_ranking.json')
+GENRE_LINKS_FILENAME = os.path.join(DATA_DIR, 'genre_ranking.json')
+LOCATION_IDXS_FILENAME = os.path.join(DATA_DIR, 'plays_with_location_indices.json')
+CORRECT_LINKS_FILENAME = os.path.join(ANN_DIR, 'correct_links.csv')
+COEFS_FILENAME = 'coefficients.json'
+
+JOBS = '{jobs}'  # placeholder for the number of processes inside a stage
+
+STAGES = [
+    {
+        'name': 'final_corpus',
+        'command': ['evaluate_ner.py', '--jobs', JOBS],
+        'code': ['evaluate_ner.py', 'corpus_index.py'],
+        'inputs': [AUTO_CORPUS_FOLDER, FIXED_CORPUS_FOLDER],
+        'outputs': [FINAL_CORPUS_FOLDER]
+    },
+    {
+        'name': 'kwic',
+        'command': ['create_kwic.py', '--jobs', JOBS],
+        'code': ['create_kwic.py', 'corpus_index.py'],
+        'inputs': [FINAL_CORPUS_FOLDER],
+        'outputs': [KWIC_FILENAME]
+    },
+    {
+        'name': 'location_list',
+        'command': ['create_location_list.py'],
+        'code': ['create_location_list.py'],
+        'inputs': [KWIC_FILENAME],
+        'outputs': [NORMALIZED_LOCATIONS_FILENAME, STALE_LOCATIONS_FILENAME]
+    },
+    {
+        'name': 'candidates',
+        'command': ['wikidata.py', 'stats'],
+        'code': ['wikidata.py', 'wikidata_stats.py', 'wikidata_client.py', 'response_cache.py'],
+        'inputs': [NORMALIZED_LOCATIONS_FILENAME],
+        'outputs': [LOC_INFO_FILENAME]
+    },
+    {
+        'name': 'coefficients',
+        'command': ['find_coefficients.py'],
+        'code': ['find_coefficients.py', 'ranking.py', 'correct_links.py'],
+        'inputs': [
+            KWIC_FILENAME,
+            CORRECT_LINKS_FILENAME,
+            NORMALIZED_LOCATIONS_FILENAME,
+            LOC_INFO_FILENAME
+        ],
+        'outputs': [COEFS_FILENAME]
+    },
+    {
+        'name': 'ranking',
+        'command': ['ranking.py'],
+        'code': ['ranking.py'],
+        'inputs': [LOC_INFO_FILENAME, COEFS_FILENAME],
+        'outputs': [RANKING_FILENAME]
+    },
+    {
+        'name': 'hyperlinks',
+        'command': ['create_location_hyperlinks.py'],
+        'code': ['create_location_hyperlinks.py'],
+        'inputs': [KWIC_FILENAME, NORMALIZED_LOCATIONS_FILENAME, RANKING_FILENAME],
+        'optional_inputs': [GENRE_LINKS_FILENAME],
+        'outputs': ['wikidata_location_links.csv']
+    },
+    {
+        'name': 'babelfy_input',
+        'command': ['create_plays_with_location_indices.py', '--jobs', JOBS],
+        'code': ['create_plays_with_location_indices.py', 'corpus_index.py', 'correct_links.py'],
+        'inputs': [FINAL_CORPUS_FOLDER, KWIC_FILENAME, CORRECT_LINKS_FILENAME],
+        'outputs': [LOCATION_IDXS_FILENAME]
+    },
+    {
+        'name': 'ontology',
+        'command': ['ontology.py', '--jobs', JOBS],
+        'code': ['ontology.py', 'corpus_index.py', 'correct_links.py'],
+        'inputs': [
+            FINAL_CORPUS_FOLDER,
+            KWIC_FILENAME,
+            CORRECT_LINKS_FILENAME,
+            NORMALIZED_LOCATIONS_FILENAME
+        ],
+        'outputs': ['corpus_ontology_info.json', 'locations.owl']
+    }
+]
+
+
+def hash_path(path):
+    """
+    Hash file content; for a folder, hash names and contents
+    of all files inside it. Return None if the path does not exist.
+    """
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    if not os.path.isdir(path):
+        return None
+
+    folder_hash = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.startswith('.'):
+                continue
+            file_path = os.path.join(root, filename)
+            folder_hash.update(os.path.relpath(file_path, path).encode('utf-8'))
+            folder_hash.update(hash_path(file_path).encode('utf-8'))
+    return folder_hash.hexdigest()
+
+
+def get_input_hashes(stage):
+    paths = stage['code'] + stage['inputs'] + stage.get('optional_inputs', [])
+    return {path: hash_path(path) for path in paths}
+
+
+def get_dependencies(stages):
+    """For each stage, find the stages producing its inputs."""
+    producers = {
+        output: stage['name']
+        for stage in stages
+        for output in stage['outputs']
+    }
+    return {
+        stage['name']: {
+            producers[path] for path in stage['inputs'] if path in producers
+        }
+        for stage in stages
+    }
+
+
+def select_stages(targets, dependencies):
+    """Get target stages together with all stages they depend on."""
+    selected = set()
+    to_visit = list(targets)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in selected:
+            selected.add(name)
+            to_visit += dependencies[name]
+    return selected
+
+
+def is_stale(stage, state, input_hashes):
+    """Check if the stage must be re-run."""
+    outputs_exist = all(os.path.exists(path) for path in stage['outputs'])
+    return not outputs_exist or state.get(stage['name']) != input_hashes
+
+
+def run_stage(stage, jobs):
+    command = [
+        jobs if part == JOBS else part
+        for part in stage['command']
+    ]
+    print(f'[{stage["name"]}] running: python {" ".join(command)}', flush=True)
+    result = subprocess.run([sys.executable] + command)
+    return result.returncode == 0
+
+
+def run_pipeline(targets=None, force=(), dry_run=False, jobs=1, workers=2):
+    """
+    Run stale stages in dependency order.
+    Stages from `force` are re-run regardless of their state.
+    Return names of the failed or blocked stages.
+    """
+    stages = {stage['name']: stage for stage in STAGES}
+    dependencies = get_dependencies(STAGES)
+    selected = select_stages(targets or stages, dependencies)
+
+    state = {}
+    if os.path.exists(STATE_FILENAME):
+        with open(STATE_FILENAME) as f:
+            state = json.load(f)
+
+    pending = [name for name in stages if name in selected]
+    done = set()
+    failed = set()
+    to_run = set()  # stages that would run, for dry run
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                stage_deps = dependencies[name] & selected
+                if stage_deps & failed:
+                    print(f'[{name}] blocked by failed stages: {", ".join(sorted(stage_deps & failed))}')
+                    failed.add(name)
+                    pending.remove(name)
+                    continue
+                if not stage_deps <= done:
+                    continue
+
+                pending.remove(name)
+                stage = stages[name]
+                input_hashes = get_input_hashes(stage)
+
+                missing = [path for path in stage['code'] + stage['inputs'] if input_hashes[path] is None]
+                if missing:
+                    print(f'[{name}] missing inputs: {", ".join(missing)}')
+                    failed.add(name)
+                elif dry_run:
+                    # outputs of upstream stages are not updated in a dry run
+                    upstream_runs = bool(stage_deps & to_run)
+                    if name in force or upstream_runs or is_stale(stage, state, input_hashes):
+                        print(f'[{name}] would run')
+                        to_run.add(name)
+                    else:
+                        print(f'[{name}] up to date')
+                    done.add(name)
+                elif name not in force and not is_stale(stage, state, input_hashes):
+                    print(f'[{name}] up to date')
+                    done.add(name)
+                else:
+                    future = executor.submit(run_stage, stage, str(jobs))
+                    running[future] = (name, input_hashes)
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, input_hashes = running.pop(future)
+                if future.result():
+                    done.add(name)
+                    state[name] = input_hashes
+                    with open(STATE_FILENAME, 'w') as f:
+                        json.dump(state, f, indent=2)
+                else:
+                    print(f'[{name}] failed')
+                    failed.add(name)
+
+    return failed
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    stage_names = [stage['name'] for stage in STAGES]
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'targets',
+        nargs='*',
+        help=f'stages to bring up to date (with everything they depend on): {", ".join(stage_names)}; all by default'
+    )
+    parser.add_argument('--force', action='store_true', help='re-run target stages even if up to date')
+    parser.add_argument('--dry-run', action='store_true', help='only show which stages would run')
+    parser.add_argument('--jobs', type=int, default=1, help='number of processes inside a stage')
+    parser.add_argument('--workers', type=int, default=2, help='number of stages run concurrently')
+    args = parser.parse_args()
+
+    unknown = set(args.targets) - set(stage_names)
+    if unknown:
+        parser.error(f'unknown stages: {", ".join(sorted(unknown))}')
+
+    force = set(args.targets or stage_names) if args.force else set()
+    failed = run_pipeline(args.targets, force, args.dry_run, args.jobs, args.workers)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,239 @@
+import os
+import json
+import argparse
+from math import log
+from collections import defaultdict
+
+import numpy as np
+
+
+# Rank Wikidata candidates of locations with page scoring formula
+# (offline: uses candidates and stats collected by `wikidata.py stats`).
+
+
+DATA_DIR = 'intermediate_data_files'
+LOC_INFO_FILENAME = os.path.join(DATA_DIR, 'wikidata_locations_info.json')
+RANKING_FILENAME = os.path.join(DATA_DIR, 'wikidata_ranking.json')
+COEFS_FILENAME = 'coefficients.json'
+
+STAT_KEYS = [
+    'n_labels',
+    'n_descriptions',
+    'n_sitelinks',
+    'n_aliases',
+    'n_statements',
+    'n_qualifiers',
+    'n_references',
+    'n_links'
+]
+
+
+def calculate_score(query, entity_info, coefs):
+    """
+    Calculate score based on entity stats
+    and optimal coefficients.
+    """
+    if query == entity_info['label']:
+        coef = coefs['label']
+    elif query in entity_info['aliases']:
+        coef = coefs['aliases']
+    else:
+        coef = 1
+
+    stat_sum = 0
+    for key, value in coefs.items():
+        if key in ['label', 'aliases']:
+            continue
+
+        stat = entity_info[key]
+        stat = log(stat + 1) if value == 'log' else stat * value
+        stat_sum += stat
+
+    score = coef * stat_sum
+    return round(score, 3)
+
+
+def score_candidates(location_candidates, candidates_stats, coefs):
+    scores = defaultdict(dict)
+    for lang, locs in location_candidates.items():
+        for loc, candidates in locs.items():
+            loc_scores = []
+
+            for candidate_id in candidates:
+                candidate_info = candidates_stats[lang].get(candidate_id)
+                if candidate_info is None:
+                    continue
+
+                score = calculate_score(loc, candidate_info, coefs)
+                loc_scores.append([
+                    candidate_id,
+                    score,
+                    candidate_info['wikipedia_url']
+                ])
+
+            scores[lang][loc] = sorted(loc_scores, key=lambda x: x[1], reverse=True)
+
+    return scores
+
+
+def build_features(location_candidates, candidates_stats):
+    """
+    Build per-language arrays for vectorized scoring:
+    a matrix of entity stats (one row per unique candidate)
+    with precomputed log(stat + 1) variant,
+    and for each location, rows of its candidates
+    with flags of label and alias match.
+    """
+    features = {}
+    for lang, locs in location_candidates.items():
+        lang_stats = candidates_stats[lang]
+
+        entity_ids = sorted({
+            candidate_id
+            for candidates in locs.values()
+            for candidate_id in candidates
+            if candidate_id in lang_stats
+        })
+        entity_rows = {entity_id: i for i, entity_id in enumerate(entity_ids)}
+
+        stats = np.array(
+            [[lang_stats[e][key] for key in STAT_KEYS] for e in entity_ids],
+            dtype=np.float64
+        ).reshape(len(entity_ids), len(STAT_KEYS))
+        # math.log, not np.log, to get exactly the same values as calculate_score
+        log_stats = np.array(
+            [[log(lang_stats[e][key] + 1) for key in STAT_KEYS] for e in entity_ids],
+            dtype=np.float64
+        ).reshape(len(entity_ids), len(STAT_KEYS))
+
+        loc_features = {}
+        for loc, candidates in locs.items():
+            candidates = [c for c in candidates if c in lang_stats]
+            loc_features[loc] = {
+                'rows': np.array([entity_rows[c] for c in candidates], dtype=np.int64),
+                'is_label': np.array(
+                    [loc == lang_stats[c]['label'] for c in candidates], dtype=bool
+                ),
+                'is_alias': np.array(
+                    [loc in set(lang_stats[c]['aliases']) for c in candidates], dtype=bool
+                )
+            }
+
+        features[lang] = {
+            'ids': entity_ids,
+            'urls': [lang_stats[e]['wikipedia_url'] for e in entity_ids],
+            'stats': stats,
+            'log_stats': log_stats,
+            'locations': loc_features
+        }
+
+    return features
+
+
+def get_stat_sums(lang_features, coefs):
+    """
+    Weighted sum of stats for all entities at once.
+    Columns are accumulated in the order of `coefs`
+    to reproduce float summation of `calculate_score` exactly.
+    """
+    stat_sums = np.zeros(len(lang_features['ids']), dtype=np.float64)
+    for key, value in coefs.items():
+        if key in ['label', 'aliases']:
+            continue
+
+        col = STAT_KEYS.index(key)
+        if value == 'log':
+            stat_sums += lang_features['log_stats'][:, col]
+        else:
+            stat_sums += lang_features['stats'][:, col] * value
+
+    return stat_sums
+
+
+def get_top_idxs(scores, top):
+    """
+    Indices of `top` highest scores, sorted by score;
+    equal scores keep their original order (as with stable sorting).
+    """
+    if top is None or top >= len(scores):
+        return np.argsort(-scores, kind='stable')
+
+    threshold = scores[np.argpartition(-scores, top - 1)[top - 1]]
+    idxs = np.concatenate([
+        np.flatnonzero(scores > threshold),
+        np.flatnonzero(scores == threshold)
+    ])[:top]
+    return idxs[np.argsort(-scores[idxs], kind='stable')]
+
+
+def score_features(features, coefs, top=None):
+    """
+    Vectorized version of `score_candidates` on features from `build_features`,
+    with the same results (including rounding and order of equal scores).
+    If `top` is given, keep only `top` best candidates for each location
+    (e.g. TOP_LINKS for hyperlink tables in create_location_hyperlinks.py).
+    """
+    # calculate_score returns ints if all coefficients are ints
+    int_terms = all(
+        isinstance(value, int)
+        for key, value in coefs.items()
+        if key not in ['label', 'aliases']
+    )
+
+    scores = defaultdict(dict)
+    for lang, lang_features in features.items():
+        stat_sums = get_stat_sums(lang_features, coefs)
+
+        for loc, loc_features in lang_features['locations'].items():
+            is_label = loc_features['is_label']
+            is_alias = loc_features['is_alias']
+            coef = np.where(is_label, coefs['label'], np.where(is_alias, coefs['aliases'], 1))
+            is_int = int_terms & np.where(
+                is_label,
+                isinstance(coefs['label'], int),
+                np.where(is_alias, isinstance(coefs['aliases'], int), True)
+            )
+
+            loc_scores = (coef * stat_sums[loc_features['rows']]).tolist()
+            loc_scores = [
+                int(score) if score_is_int else round(score, 3)
+                for score, score_is_int in zip(loc_scores, is_int.tolist())
+            ]
+
+            loc_ranking = []
+            for i in get_top_idxs(np.array(loc_scores, dtype=np.float64), top).tolist():
+                row = loc_features['rows'][i]
+                loc_ranking.append([
+                    lang_features['ids'][row],
+                    loc_scores[i],
+                    lang_features['urls'][row]
+                ])
+            scores[lang][loc] = loc_ranking
+
+    return scores
+
+
+def get_ranking():
+    with open(LOC_INFO_FILENAME) as f:
+        info = json.load(f)
+
+    with open(COEFS_FILENAME) as f:
+        coefs = json.load(f)
+
+    features = build_features(info['candidates'], info['stats'])
+    scores = score_features(features, coefs)
+
+    with open(RANKING_FILENAME, 'w') as f:
+        json.dump(scores, f, indent=2, ensure_ascii=False)
+
+    return scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='rank candidates with coefficients from coefficients.json')
+    parser.parse_args(argv)
+    get_ranking()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+from time import time
+
+
+# Persistent cache of responses of remote APIs (Wikidata, Wikipedia, Babelfy)
+# in a SQLite database, keyed by normalized request (endpoint + params).
+# Entries expire after `ttl` seconds; when the cache grows over `max_entries`,
+# least recently used entries are evicted.
+# In offline mode, only cached responses are replayed (regardless of their age),
+# and a cache miss raises CacheMiss instead of going to the network.
+# A response can be any JSON value including null, so callers check
+# for a miss with `cache.get(endpoint, params, MISSING) is MISSING`.
+
+
+CACHE_FILENAME = os.path.join('intermediate_data_files', 'response_cache.sqlite')
+TTL = 30 * 24 * 60 * 60  # 30 days
+MAX_ENTRIES = 1_000_000
+
+# params that do not change the response and must not be stored (e.g. API keys)
+IGNORED_PARAMS = {'key'}
+
+SPACE_REGEX = re.compile(r'\s+')
+
+MISSING = object()  # `default` of ResponseCache.get to tell a miss from a cached null
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def normalize_value(value):
+    """Collapse whitespace in strings (e.g. in SPARQL queries)."""
+    if isinstance(value, str):
+        return SPACE_REGEX.sub(' ', value).strip()
+    return value
+
+
+def make_key(endpoint, params=None):
+    """
+    Normalized request as a string and its hash:
+    params are sorted, whitespace in values is collapsed,
+    ignored params are dropped.
+    """
+    params = params or {}
+    normalized = json.dumps(
+        [endpoint, sorted(
+            (k, normalize_value(v)) for k, v in params.items()
+            if k not in IGNORED_PARAMS
+        )],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest(), normalized
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_FILENAME, ttl=TTL, max_entries=MAX_ENTRIES, offline=False):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.offline = offline
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, request TEXT, response TEXT, created REAL, accessed REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS accessed_idx ON responses (accessed)')
+        self.n_entries = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, endpoint, params=None, default=None):
+        """
+        Return cached response or `default`.
+        In offline mode, raise CacheMiss if there is no response.
+        """
+        key, request = make_key(endpoint, params)
+        row = self.conn.execute(
+            'SELECT response, created FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+
+        now = time()
+        if row is not None and not self.offline and self.ttl is not None and now - row[1] > self.ttl:
+            self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.n_entries -= 1
+            row = None
+
+        if row is None:
+            if self.offline:
+                raise CacheMiss(request)
+            return default
+
+        self.conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, endpoint, params, response):
+        key, request = make_key(endpoint, params)
+        now = time()
+        is_new = self.conn.execute(
+            'SELECT 1 FROM responses WHERE key = ?', (key,)
+        ).fetchone() is None
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+            (key, request, json.dumps(response, ensure_ascii=False), now, now)
+        )
+        self.n_entries += is_new
+
+        if self.n_entries > self.max_entries:
+            self.evict(self.n_entries - self.max_entries)
+
+    def evict(self, n):
+        """Delete `n` least recently used entries."""
+        self.conn.execute(
+            'DELETE FROM responses WHERE key IN '
+            '(SELECT key FROM responses ORDER BY accessed LIMIT ?)',
+            (n,)
+        )
+        self.n_entries = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def fetch(self, endpoint, params, request_func):
+        """
+        Return cached response for the request,
+        or call `request_func()` and cache its result.
+        """
+        response = self.get(endpoint, params, MISSING)
+        if response is MISSING:
+            response = request_func()
+            self.set(endpoint, params, response)
+        return response
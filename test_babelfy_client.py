@@ -0,0 +1,178 @@
+import re
+import random
+import asyncio
+from functools import partial
+
+import pytest
+from aiohttp import web
+
+import babelfy_client
+from babelfy_client import BabelfyClient, BabelfyError, link_plays, shift_annotation, split_text
+from response_cache import CacheMiss, ResponseCache
+from test_wikidata_client import run_with_server
+
+
+WORD_REGEX = re.compile(r'[A-Z]\w+')
+
+
+def random_text(rnd):
+    words = ['Madrid', 'calle', 'de', 'Toledo', 'Sevilla', 'sí', 'x' * 40]
+    utterances = [
+        ' '.join(rnd.choice(words) for _ in range(rnd.randint(0, 30)))
+        for _ in range(rnd.randint(0, 20))
+    ]
+    return '\n'.join(utterances)
+
+
+def test_split_text():
+    rnd = random.Random(0)
+    for _ in range(300):
+        text = random_text(rnd)
+        max_chars = rnd.randint(1, 200)
+        chunks = split_text(text, max_chars)
+
+        covered = set()
+        for offset, chunk in chunks:
+            assert 0 < len(chunk) <= max_chars
+            assert text[offset:offset + len(chunk)] == chunk
+            covered |= set(range(offset, offset + len(chunk)))
+        assert all(text[i].isspace() for i in range(len(text)) if i not in covered)
+        assert [offset for offset, _ in chunks] == sorted({offset for offset, _ in chunks})
+
+
+def test_split_text_at_newlines():
+    text = 'Madrid.\nSevilla y Toledo.\nsí'
+    assert split_text(text, 20) == [(0, 'Madrid.'), (8, 'Sevilla y Toledo.\nsí')]
+    assert split_text(text, 18) == [(0, 'Madrid.'), (8, 'Sevilla y Toledo.'), (26, 'sí')]
+    assert split_text('Sevilla y Toledo', 10) == [(0, 'Sevilla y'), (10, 'Toledo')]
+    assert split_text(text, 100) == [(0, text)]
+    assert split_text('', 10) == []
+
+
+def test_shift_annotation():
+    annotation = {'charFragment': {'start': 2, 'end': 7}, 'DBpediaURL': 'http://dbpedia.org/resource/Madrid'}
+    shifted = shift_annotation(annotation, 100)
+    assert shifted == {'charFragment': {'start': 102, 'end': 107}, 'DBpediaURL': annotation['DBpediaURL']}
+    assert annotation['charFragment'] == {'start': 2, 'end': 7}
+
+
+def test_link_text_offsets():
+    """Annotations of chunks point to the same words in the whole text."""
+    async def disambiguate(chunk, lang):
+        return [
+            {'charFragment': {'start': m.start(), 'end': m.end() - 1}, 'word': m.group()}
+            for m in WORD_REGEX.finditer(chunk)
+        ]
+
+    rnd = random.Random(1)
+    for _ in range(50):
+        text = random_text(rnd)
+        client = BabelfyClient('key', max_chunk_chars=rnd.randint(40, 300))
+        client.disambiguate = disambiguate
+        annotations = asyncio.run(client.link_text(text, 'ES'))
+
+        assert len(annotations) == len(WORD_REGEX.findall(text))
+        for annotation in annotations:
+            fragment = annotation['charFragment']
+            assert text[fragment['start']:fragment['end'] + 1] == annotation['word']
+
+
+def word_annotations(text):
+    return [
+        {'charFragment': {'start': m.start(), 'end': m.end() - 1}, 'word': m.group()}
+        for m in WORD_REGEX.finditer(text)
+    ]
+
+
+def test_stub_server_retries_and_cache(tmp_path):
+    requests = []
+
+    async def handler(request):
+        params = dict(await request.post())
+        requests.append(params)
+        if params['text'] == 'Toledo' and len([p for p in requests if p['text'] == 'Toledo']) == 1:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        if params['key'] != 'key':
+            return web.json_response({'message': 'Your key is not valid'})
+        return web.json_response(word_annotations(params['text']))
+
+    cache_path = str(tmp_path / 'cache.sqlite')
+
+    async def link(url, text, key='key', offline=False):
+        cache = ResponseCache(cache_path, offline=offline)
+        async with BabelfyClient(key, url, rate=100, max_chunk_chars=10, cache=cache) as client:
+            return await client.link_text(text, 'ES')
+
+    async def run_all(url):
+        annotations = await link(url, 'Madrid.\nToledo')
+        n_requests = len(requests)
+        # reruns are replayed from the cache (responses are cached by endpoint and text)
+        assert await link(url, 'Madrid.\nToledo') == annotations
+        assert await link(url, 'Madrid.\nToledo', offline=True) == annotations
+        assert len(requests) == n_requests
+
+        with pytest.raises(CacheMiss):
+            await link(url, 'Madrid.\nSevilla', offline=True)
+        with pytest.raises(BabelfyError, match='not valid'):
+            await link(url, 'Sevilla', key='other')
+        with pytest.raises(BabelfyError):  # the error is not cached
+            await link(url, 'Sevilla', key='other')
+        assert len(requests) == n_requests + 2
+        return annotations
+
+    annotations = asyncio.run(run_with_server(handler, run_all, method='POST'))
+    assert [a['word'] for a in annotations] == ['Madrid', 'Toledo']
+    assert [a['charFragment']['start'] for a in annotations] == [0, 8]
+    assert sorted(p['text'] for p in requests[:3]) == ['Madrid.', 'Toledo', 'Toledo']
+    assert requests[0] == {
+        'text': requests[0]['text'], 'lang': 'ES', 'key': 'key',
+        'annType': 'NAMED_ENTITIES', 'match': 'EXACT_MATCHING'
+    }
+
+
+def test_stub_server_retries_timeouts(monkeypatch):
+    delays = []
+
+    def get_retry_delay(attempt, response=None):
+        delays.append((attempt, response))
+        return 0
+
+    monkeypatch.setattr(babelfy_client, 'get_retry_delay', get_retry_delay)
+    requests = []
+
+    async def handler(request):
+        requests.append(dict(await request.post()))
+        if len(requests) < 3:
+            await asyncio.sleep(0.5)
+        return web.json_response(word_annotations(requests[-1]['text']))
+
+    async def link(url, max_retries=2):
+        async with BabelfyClient('key', url, rate=100, timeout=0.1, max_retries=max_retries) as client:
+            return await client.link_text('Madrid', 'ES')
+
+    annotations = asyncio.run(run_with_server(handler, link, method='POST'))
+    assert [a['word'] for a in annotations] == ['Madrid']
+    assert delays == [(0, None), (1, None)]
+
+    requests.clear()
+    with pytest.raises(asyncio.TimeoutError):  # timeouts after the last retry are raised
+        asyncio.run(run_with_server(handler, partial(link, max_retries=1), method='POST'))
+
+
+def test_link_plays():
+    async def handler(request):
+        params = await request.post()
+        return web.json_response(word_annotations(params['text']))
+
+    texts = {
+        'rus': {'beg': ['Поедем в Крым', []]},
+        'span': {'luces': ['Madrid y Toledo', []], 'yerma': ['sí', []]}
+    }
+
+    async def link(url):
+        return await link_plays(texts, 'key', url, rate=100)
+
+    outputs = asyncio.run(run_with_server(handler, link, method='POST'))
+    assert {lang: list(plays) for lang, plays in outputs.items()} == {'rus': ['beg'], 'span': ['luces', 'yerma']}
+    assert [a['word'] for a in outputs['span']['luces']] == ['Madrid', 'Toledo']
+    assert outputs['span']['yerma'] == []
@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from cli import COMMANDS
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ['owlready2', 'pymorphy2', 'aiohttp', 'stanza', 'secrets']
+
+
+@pytest.mark.parametrize('command', sorted(COMMANDS))
+def test_command_help(command):
+    result = subprocess.run(
+        [sys.executable, 'cli.py', command, '-h'],
+        capture_output=True,
+        text=True,
+        cwd=ROOT
+    )
+    assert result.returncode == 0, result.stderr
+    assert f'cli.py {command}' in result.stdout
+
+
+def test_commands_are_imported_lazily():
+    code = (
+        'import sys, cli\n'
+        'try:\n'
+        '    cli.main(["rank", "-h"])\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        f'print([m for m in {HEAVY_MODULES!r} if m in sys.modules])\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT)
+    assert result.stdout.strip().splitlines()[-1] == '[]'
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import random
+
+import pytest
+from lxml import etree
+
+import corpus_index
+
+from benchmark_kwic import get_utterance_markup_regex
+from corpus_index import (
+    NAMESPACE,
+    TEXT_XPATH,
+    get_utterance_markup,
+    iter_utterances,
+    load_play,
+    map_plays,
+    parse_play,
+    parse_play_header
+)
+
+
+PLAY = '''<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+  <teiHeader>
+    <fileDesc><titleStmt><title type="main">Бег</title></titleStmt></fileDesc>
+    <profileDesc><particDesc><listPerson>
+      <person xml:id="golubkov"><persName>Голубков</persName></person>
+    </listPerson></particDesc></profileDesc>
+  </teiHeader>
+  <text><body><div>
+    <sp who="#golubkov">
+      <speaker>Голубков из <loc>Петербурга</loc></speaker>
+      <p>Поедем в <loc>Крым</loc>, <stage>(в <loc>Париж</loc>)</stage> потом
+        <note>в <loc>Константинополь</loc></note>.</p>
+    </sp>
+    <sp who="#golubkov"><p>Нет.</p></sp>
+  </div></body></text>
+</TEI>
+'''
+
+
+def test_loc_texts_at_any_depth():
+    record = parse_play(PLAY.encode('utf-8'))
+    first, second = record['utterances']
+    assert first['loc_texts'] == ['Петербурга', 'Крым', 'Париж', 'Константинополь']
+    assert [name for _, _, name, _ in first['locs']] == ['Крым', 'Париж', 'Константинополь']
+    assert second['loc_texts'] == []
+
+
+def test_streaming_matches_index(tmp_path):
+    path = tmp_path / 'bulgakov-beg.xml'
+    path.write_text(PLAY, encoding='utf-8')
+    record = parse_play(PLAY.encode('utf-8'))
+    assert list(iter_utterances(str(path))) == record['utterances']
+    assert parse_play_header(str(path)) == {'title': 'Бег', 'speakers': {'golubkov': 'Голубков'}}
+
+
+def test_load_play_replaces_record_atomically(monkeypatch, tmp_path):
+    monkeypatch.setattr(corpus_index, 'CORPUS_FOLDER', str(tmp_path / 'corpus'))
+    monkeypatch.setattr(corpus_index, 'INDEX_FOLDER', str(tmp_path / 'index'))
+    os.makedirs(tmp_path / 'corpus' / 'rus')
+    play_path = tmp_path / 'corpus' / 'rus' / 'bulgakov-beg.xml'
+    play_path.write_text(PLAY, encoding='utf-8')
+
+    record = load_play('rus', 'bulgakov-beg.xml')
+    assert load_play('rus', 'bulgakov-beg.xml') == record
+    assert os.listdir(tmp_path / 'index' / 'rus') == ['bulgakov-beg.json']
+
+    # a failed write leaves the previous record in place
+    def dump(obj, f, **kwargs):
+        f.write('{"utterances": [')
+        raise OSError('disk full')
+
+    play_path.write_text(PLAY.replace('Нет.', 'Да.'), encoding='utf-8')
+    monkeypatch.setattr(json, 'dump', dump)
+    with pytest.raises(OSError):
+        load_play('rus', 'bulgakov-beg.xml')
+    monkeypatch.undo()
+    assert os.listdir(tmp_path / 'index' / 'rus') == ['bulgakov-beg.json']
+    with open(tmp_path / 'index' / 'rus' / 'bulgakov-beg.json') as f:
+        assert json.load(f) == record
+
+
+def random_p(rnd):
+    """
+    Non-empty <p> on one line with text, locations and other inline tags
+    (the old extraction left other <p> tags as raw markup).
+    """
+    chunks = []
+    for _ in range(rnd.randint(1, 8)):
+        kind = rnd.choice(['text', 'text', 'loc', 'manual', 'stage', 'hi', 'empty'])
+        text = rnd.choice(['Поедем в', ' и ', 'Madrid &amp; Toledo', '«туда»,', '  '])
+        name = rnd.choice(['Крым', 'Новый  Свет', 'R&amp;D'])
+        chunks.append({
+            'text': text,
+            'loc': f'<loc>{name}</loc>',
+            'manual': f'<loc from="manual">{name}</loc>',
+            'stage': f'<stage type="aside" n="1">{text}</stage>',
+            'hi': f'<hi>{text}</hi>',
+            'empty': '<lb/>'
+        }[kind])
+    return f'<p>{"".join(chunks)}</p>'
+
+
+def test_utterance_markup_matches_regex_extraction():
+    """Tree walk gives the same markup and locations as the old serialize + regex extraction."""
+    rnd = random.Random(0)
+    for _ in range(300):
+        sp = etree.fromstring(
+            f'<sp xmlns="{NAMESPACE["ns"]}" who="#a">'
+            + ''.join(random_p(rnd) + rnd.choice(['', ' ', '\n']) for _ in range(rnd.randint(1, 3)))
+            + '</sp>'
+        )
+        p_tags = sp.xpath(TEXT_XPATH, namespaces=NAMESPACE)
+        assert get_utterance_markup(p_tags) == get_utterance_markup_regex(p_tags)
+
+
+def slow_len(lang, filename):
+    time.sleep(0.01 * (len(filename) % 3))
+    return len(lang + filename)
+
+
+def test_map_plays_order_does_not_depend_on_jobs():
+    plays = [('rus', f'{"x" * i}.xml') for i in range(8)] + [('span', 'a.xml')]
+    expected = [(lang, filename, len(lang + filename)) for lang, filename in plays]
+    assert map_plays(slow_len, plays, jobs=1) == expected
+    assert map_plays(slow_len, plays, jobs=3) == expected
@@ -0,0 +1,64 @@
+import pytest
+
+import create_kwic
+from correct_links import CORRECT_LINKS_FILENAME, parse_links, read_correct_links
+
+
+KWIC_HEADER = 'lang\tplay\textraction_mode\tprev_utterance\tutterance_left\tlocation\tutterance_right\n'
+
+
+def write_files(tmp_path, kwic_rows, gold_rows):
+    kwic_path = tmp_path / 'kwic.csv'
+    kwic_path.write_text(KWIC_HEADER + ''.join(
+        f'{lang}\t{play}\tauto\t\tleft\t{loc}\tright\n' for lang, play, loc in kwic_rows
+    ))
+    links_path = tmp_path / 'links.csv'
+    links_path.write_text('lang,play,location,links\n' + ''.join(
+        f'{lang},{play},{loc},"{links}"\n' for lang, play, loc, links in gold_rows
+    ))
+    return str(kwic_path), str(links_path)
+
+
+def test_parse_links():
+    assert parse_links('Q656,Q4363833') == {'Q656', 'Q4363833'}
+    assert parse_links('Q649,') == {'Q649'}
+    assert parse_links(' ') == set()
+
+
+def test_read_correct_links(tmp_path):
+    paths = write_files(
+        tmp_path,
+        [('rus', 'a', 'Москва'), ('span', 'b', 'Madrid')],
+        [('rus', 'a', 'Москва', 'Q649,'), ('span', 'b', 'Madrid', '')]
+    )
+    assert read_correct_links(*paths) == [('rus', 'Москва', {'Q649'}), ('span', 'Madrid', set())]
+
+
+def test_read_correct_links_shifted_rows(tmp_path):
+    paths = write_files(
+        tmp_path,
+        [('rus', 'a', 'Москва'), ('rus', 'b', 'Крым')],
+        [('rus', 'b', 'Крым', 'Q7835'), ('rus', 'a', 'Москва', 'Q649')]
+    )
+    with pytest.raises(AssertionError, match='row 0'):
+        read_correct_links(*paths)
+
+
+def test_read_correct_links_row_count(tmp_path):
+    paths = write_files(tmp_path, [('rus', 'a', 'Москва')], [])
+    with pytest.raises(AssertionError):
+        read_correct_links(*paths)
+
+
+def test_gold_file_matches_kwic(monkeypatch, tmp_path):
+    """The tracked gold file is aligned with KWIC rows built from the tracked final corpus."""
+    kwic_path = str(tmp_path / 'location_kwic.csv')
+    monkeypatch.setattr(create_kwic, 'KWIC_FILENAME', kwic_path)
+    create_kwic.stream_kwic()
+
+    links = dict()
+    for lang, loc, loc_links in read_correct_links(kwic_path, CORRECT_LINKS_FILENAME):
+        links.setdefault((lang, loc), set()).update(loc_links)
+    assert links[('rus', 'Москве')] == {'Q649'}
+    assert links[('rus', 'Крым')] == {'Q7835'}
+    assert links[('span', 'Madrid')] == {'Q2807'}
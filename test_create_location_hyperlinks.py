@@ -0,0 +1,86 @@
+import json
+import random
+from collections import Counter
+
+import pandas as pd
+
+import create_location_hyperlinks
+from create_location_hyperlinks import HEADER, LANGS, TOP_LINKS
+
+
+# the row-by-row implementation before the lookup tables
+
+def hyperlink_str(score_tuple):
+    id_, _, link = score_tuple
+    return f'=HYPERLINK("{link}";"{id_}")'
+
+
+def old_wikidata_links(df, location_scores, normalized_locations):
+    links = []
+    for _, row in df.iterrows():
+        lang = LANGS[row['lang']]
+        normalized_loc = normalized_locations[lang][row['location']]
+        loc_scores = location_scores[lang][normalized_loc]
+        links.append([hyperlink_str(s) for s in loc_scores[:TOP_LINKS]])
+    return pd.DataFrame(links, columns=HEADER).to_csv(index=False, sep='\t')
+
+
+def old_genre_links(df, location_scores):
+    assert dict(Counter(df.play)) == {play: len(locs) for play, locs in location_scores.items()}
+    links = []
+    for play_name, play_locs in df.groupby('play', sort=False):
+        for i in range(play_locs.shape[0]):
+            loc_scores = location_scores[play_name][i]['scores']
+            links.append([hyperlink_str(s) for s in loc_scores[:TOP_LINKS]])
+    return pd.DataFrame(links, columns=HEADER).to_csv(index=False, sep='\t')
+
+
+def random_ranking(rnd, lang):
+    return [
+        [f'Q{rnd.randint(1, 999)}', rnd.random(), f'https://{lang}.wikipedia.org/wiki/{rnd.randint(1, 999)}']
+        for _ in range(rnd.choice([0, 1, 3, 5, 8]))
+    ]
+
+
+def test_links_match_row_by_row(tmp_path, monkeypatch):
+    rnd = random.Random(0)
+    locations = {'rus': ['Москва', 'москва', 'Крым', 'Рим'], 'span': ['Madrid', 'Roma', 'Toledo']}
+    plays = {'rus': ['beg', 'groza', 'revizor'], 'span': ['luces', 'electra']}
+
+    rows = []
+    for lang in ['rus', 'span']:
+        for play in plays[lang]:
+            rows += [(lang, play, rnd.choice(locations[lang])) for _ in range(rnd.randint(1, 40))]
+    rows.append(('rus', 'beg', 'Рим'))  # a play with non-contiguous rows
+    df = pd.DataFrame(rows, columns=['lang', 'play', 'location'])
+
+    normalized_locations = {
+        LANGS[lang]: {loc: loc.capitalize() for loc in locs}
+        for lang, locs in locations.items()
+    }
+    wikidata_scores = {
+        wikilang: {loc: random_ranking(rnd, wikilang) for loc in set(locs.values())}
+        for wikilang, locs in normalized_locations.items()
+    }
+    genre_scores = {
+        play: [{'scores': random_ranking(rnd, 'ru')} for _ in range(n)]
+        for play, n in Counter(df.play).items()
+    }
+
+    for name, data in [
+        ('WIKIDATA_LINKS_FILENAME', wikidata_scores),
+        ('NORMALIZED_LOCATIONS_FILENAME', normalized_locations),
+        ('GENRE_LINKS_FILENAME', genre_scores)
+    ]:
+        path = tmp_path / f'{name}.json'
+        path.write_text(json.dumps(data, ensure_ascii=False))
+        monkeypatch.setattr(create_location_hyperlinks, name, str(path))
+    monkeypatch.setattr(create_location_hyperlinks, 'FINAL_LINKS_FILENAME', str(tmp_path / '%s.csv'))
+    monkeypatch.setattr(create_location_hyperlinks, 'CHUNK_SIZE', 7)
+
+    create_location_hyperlinks.get_wikidata_links_for_kwic(df)
+    create_location_hyperlinks.get_genre_links_for_kwic(df)
+
+    expected = old_wikidata_links(df, wikidata_scores, normalized_locations)
+    assert (tmp_path / 'wikidata.csv').read_text() == expected
+    assert (tmp_path / 'genre.csv').read_text() == old_genre_links(df, genre_scores)
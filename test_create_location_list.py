@@ -0,0 +1,65 @@
+import pandas as pd
+
+import create_location_list
+from create_location_list import capitalize, normalize_locations
+
+
+def test_capitalize():
+    assert capitalize('нижний', 'Нижнем') == 'Нижний'
+    assert capitalize('ростов-на-дону', 'Ростове-на-Дону') == 'Ростов-на-Дону'
+    assert capitalize('москва', 'москве') == 'москва'
+
+
+def test_normalize_only_new_locations(monkeypatch):
+    normalized = []
+
+    def location_to_nomn(loc):
+        normalized.append(loc)
+        return loc.rstrip('е') + '*'
+
+    monkeypatch.setattr(create_location_list, 'location_to_nomn', location_to_nomn)
+    kwic = pd.DataFrame(
+        [
+            ('rus', 'Москве'), ('rus', 'Крыму'), ('rus', 'Петербурге'),
+            ('rus', 'Петербурге'), ('span', 'Madrid')
+        ],
+        columns=['lang', 'location']
+    )
+    table = {
+        'ru': {'Петербурге': 'Петербург', 'Лондоне': 'Лондон', 'Москве': 'Москва'},
+        'es': {}
+    }
+
+    norm_locs, stale_locs = normalize_locations(kwic, table)
+    # existing (manually corrected) forms and their order are kept, missing locations become stale
+    assert list(norm_locs['ru'].items()) == [
+        ('Петербурге', 'Петербург'), ('Москве', 'Москва'), ('Крыму', 'Крыму*')
+    ]
+    assert norm_locs['es'] == {'Madrid': 'Madrid'}
+    assert stale_locs == {'ru': {'Лондоне': 'Лондон'}, 'es': {}}
+    assert normalized == ['Крыму']
+
+    # a re-run on the same KWIC changes nothing
+    rerun, rerun_stale = normalize_locations(kwic, norm_locs, stale_locs)
+    assert {lang: list(locs.items()) for lang, locs in rerun.items()} == {
+        lang: list(locs.items()) for lang, locs in norm_locs.items()
+    }
+    assert rerun_stale == stale_locs
+    assert normalized == ['Крыму']
+
+
+def test_stale_locations_are_restored(monkeypatch):
+    monkeypatch.setattr(create_location_list, 'location_to_nomn', lambda loc: loc + '*')
+    table = {'ru': {'Лондоне': 'Лондон', 'Крыму': 'Крым'}, 'es': {}}
+
+    # a run without Лондоне keeps its corrected form in the stale table
+    kwic = pd.DataFrame([('rus', 'Крыму')], columns=['lang', 'location'])
+    norm_locs, stale_locs = normalize_locations(kwic, table)
+    assert norm_locs['ru'] == {'Крыму': 'Крым'}
+    assert stale_locs['ru'] == {'Лондоне': 'Лондон'}
+
+    # when it comes back, the corrected form is restored
+    kwic = pd.DataFrame([('rus', 'Крыму'), ('rus', 'Лондоне')], columns=['lang', 'location'])
+    norm_locs, stale_locs = normalize_locations(kwic, norm_locs, stale_locs)
+    assert norm_locs['ru'] == {'Крыму': 'Крым', 'Лондоне': 'Лондон'}
+    assert stale_locs['ru'] == {}
@@ -0,0 +1,158 @@
+import random
+
+import evaluate_spans
+from evaluate_spans import (
+    LINKS_UNSUPPORTED,
+    SpanIndex,
+    evaluate,
+    evaluate_play,
+    get_babelfy_predictions,
+    get_babelfy_urls,
+    get_genre_predictions,
+    get_sameas_wikidata_ids,
+    get_scores
+)
+
+
+WD = 'https://www.wikidata.org/wiki/'
+TEXT = 'Я понял, я заскучал по Петербургу. Поедем в Крым, потом в Париж.'
+GOLD = {
+    'rus': {
+        'beg': [TEXT, [
+            ['Петербургу', [23, 33], WD + 'Q656'],
+            ['Крым', [44, 48], WD + 'Q7835'],
+            ['Париж', [58, 63], '']
+        ]]
+    }
+}
+
+
+def babelfy_annotation(start, end, dbpedia_url):
+    return {
+        'charFragment': {'start': start, 'end': end - 1},
+        'DBpediaURL': dbpedia_url,
+        'BabelNetURL': 'http://babelnet.org/rdf/s00000000n'
+    }
+
+
+BABELFY_OUTPUTS = {
+    'rus': {
+        'beg': [
+            babelfy_annotation(23, 33, 'http://dbpedia.org/resource/Saint_Petersburg'),
+            babelfy_annotation(44, 48, 'http://dbpedia.org/resource/Crimean_Khanate'),
+            babelfy_annotation(58, 63, 'http://dbpedia.org/resource/Paris'),
+            babelfy_annotation(3, 8, '')
+        ]
+    }
+}
+WIKIDATA_IDS = {
+    'http://dbpedia.org/resource/Saint_Petersburg': ['Q656'],
+    'http://dbpedia.org/resource/Crimean_Khanate': ['Q215664'],
+    'http://dbpedia.org/resource/Paris': ['Q90']
+}
+
+
+def brute_force_find(spans, start, end, mode):
+    spans = sorted(spans)
+    idxs = []
+    for i, (s, e, _) in enumerate(spans):
+        if mode == 'exact':
+            match = (s, e) == (start, end)
+        elif mode == 'overlap':
+            match = s < end and start < e
+        else:
+            match = s <= start and end <= e or start <= s and e <= end
+        if match:
+            idxs.append(i)
+    return idxs
+
+
+def test_span_index_matches_brute_force():
+    rnd = random.Random(0)
+    for _ in range(200):
+        spans = []
+        pos = 0
+        for _ in range(rnd.randint(0, 10)):
+            pos += rnd.randint(0, 5)
+            length = rnd.randint(1, 6)
+            spans.append((pos, pos + length, None))
+            pos += length
+        index = SpanIndex(spans)
+        for _ in range(20):
+            start = rnd.randint(0, pos + 2)
+            end = start + rnd.randint(1, 8)
+            for mode in evaluate_spans.MATCH_MODES:
+                assert index.find(start, end, mode) == brute_force_find(spans, start, end, mode)
+
+
+def test_evaluate_play_matches_gold_once():
+    gold = [(0, 5, WD + 'Q1'), (10, 15, WD + 'Q2')]
+    predictions = [(0, 5, 'Q1'), (1, 4, 'Q3'), (10, 20, None)]
+    counts = evaluate_play(gold, predictions, mode='overlap')
+    assert counts == {'gold': 2, 'predicted': 3, 'matched': 2, 'with_link': 1, 'correct_link': 1}
+    assert evaluate_play(gold, predictions, mode='exact')['matched'] == 1
+
+
+def test_get_scores():
+    scores = get_scores({'gold': 4, 'predicted': 2, 'matched': 2, 'with_link': 2, 'correct_link': 1})
+    assert scores == {'precision': 1, 'recall': 0.5, 'f1': 2 / 3, 'link_accuracy': 0.5}
+    assert get_scores({'gold': 0, 'predicted': 0, 'matched': 0, 'with_link': 0, 'correct_link': 0}) == {
+        'precision': 0, 'recall': 0, 'f1': 0, 'link_accuracy': None
+    }
+
+
+def test_babelfy_link_accuracy():
+    predictions = get_babelfy_predictions(BABELFY_OUTPUTS, wikidata_ids=WIKIDATA_IDS)
+    assert predictions['rus']['beg'] == [(23, 33, 'Q656'), (44, 48, 'Q215664'), (58, 63, 'Q90')]
+
+    table = evaluate(GOLD, predictions)
+    row = table[table.play == 'all'].iloc[0]
+    assert (row.matched, row.with_link, row.correct_link) == (3, 3, 1)
+    assert row.link_accuracy == 1 / 3
+
+
+def test_babelfy_links_unsupported_without_mapping():
+    table = evaluate(GOLD, get_babelfy_predictions(BABELFY_OUTPUTS), links=False)
+    assert list(table.link_accuracy) == [LINKS_UNSUPPORTED] * 2
+    assert list(table.recall) == [1, 1]
+
+
+def test_get_sameas_wikidata_ids(monkeypatch):
+    requests_sent = []
+
+    class Response:
+        def __init__(self, params):
+            items = [url for url in WIKIDATA_IDS if f'<{url}>' in params['query']]
+            self.bindings = [
+                {'item': {'value': url}, 'same': {'value': 'http://www.wikidata.org/entity/' + wikidata_id}}
+                for url in items for wikidata_id in WIKIDATA_IDS[url]
+            ]
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'results': {'bindings': self.bindings}}
+
+    def get(url, params, timeout):
+        requests_sent.append(params)
+        return Response(params)
+
+    import requests
+    monkeypatch.setattr(requests, 'get', get)
+
+    urls = get_babelfy_urls(BABELFY_OUTPUTS)
+    assert get_sameas_wikidata_ids(urls + ['http://dbpedia.org/resource/Nowhere'], batch_size=2) == {
+        **WIKIDATA_IDS, 'http://dbpedia.org/resource/Nowhere': []
+    }
+    assert len(requests_sent) == 2
+
+
+def test_genre_predictions():
+    genre_links = {'beg': [
+        {'scores': [['Q656', 0.9], ['Q1', 0.1]]},
+        {'scores': []},
+        {'scores': [['Q90', 0.5]]}
+    ]}
+    predictions = get_genre_predictions(GOLD, genre_links)
+    assert predictions['rus']['beg'] == [(23, 33, 'Q656'), (44, 48, None), (58, 63, 'Q90')]
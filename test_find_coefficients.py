@@ -0,0 +1,74 @@
+import random
+from collections import defaultdict
+
+import pytest
+
+import find_coefficients
+from find_coefficients import (
+    COEFS_GRID,
+    DEFAULT,
+    batched_grid_search,
+    build_search_data,
+    get_accuracy,
+    get_accuracy_batch,
+    iter_grid
+)
+from ranking import score_candidates
+from test_ranking import make_info, random_coefs
+
+
+def make_correct_links(rnd, candidates):
+    """Gold links: a random candidate, another entity or NIL for each location."""
+    links = defaultdict(lambda: defaultdict(set))
+    for lang, locs in candidates.items():
+        for loc, loc_candidates in locs.items():
+            choice = rnd.random()
+            if loc_candidates and choice < 0.6:
+                links[lang][loc] = {rnd.choice(loc_candidates)}
+            elif choice < 0.8:
+                links[lang][loc] = {'Q1000'}
+            else:
+                links[lang][loc] = set()
+    return links
+
+
+def test_get_accuracy_batch_matches_get_accuracy():
+    rnd = random.Random(0)
+    candidates, stats = make_info(rnd)
+    correct_links = make_correct_links(rnd, candidates)
+    data = build_search_data(candidates, stats, correct_links)
+
+    coefs_batch = [DEFAULT] + [random_coefs(rnd) for _ in range(300)]
+    for coefs, accs in zip(coefs_batch, get_accuracy_batch(data, coefs_batch)):
+        assert accs == get_accuracy(correct_links, score_candidates(candidates, stats, coefs))
+
+
+def test_batched_search_does_not_depend_on_jobs():
+    rnd = random.Random(1)
+    candidates, stats = make_info(rnd)
+    correct_links = make_correct_links(rnd, candidates)
+    info = {'candidates': candidates, 'stats': stats}
+    dev_locs = {lang: set(locs) for lang, locs in candidates.items()}
+
+    coefs = batched_grid_search(info, correct_links, dev_locs, n_runs=4, jobs=1)
+    assert batched_grid_search(info, correct_links, dev_locs, n_runs=4, jobs=2) == coefs
+
+
+def test_iter_grid():
+    batches = list(iter_grid(['label', 'aliases'], batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 10, 6]
+    grid = dict(COEFS_GRID)
+    combinations = {(coefs['label'], coefs['aliases']) for batch in batches for coefs in batch}
+    assert combinations == {(a, b) for a in grid['label'] for b in grid['aliases']}
+    assert all(coefs['n_links'] == 'log' for batch in batches for coefs in batch)
+
+
+@pytest.mark.parametrize('argv', [
+    ['--mode', 'exhaustive'],
+    ['--mode', 'exhaustive', '--keys', 'n_label'],
+    ['--mode', 'exhaustive', '--keys'] + [key for key, _ in COEFS_GRID]
+])
+def test_exhaustive_search_arguments(argv, capsys):
+    with pytest.raises(SystemExit):
+        find_coefficients.main(argv)
+    assert 'error' in capsys.readouterr().err
@@ -0,0 +1,115 @@
+import re
+import random
+
+import genre_context
+from corpus_index import get_single_location_texts, parse_play
+from genre_context import MAX_CONTEXT_CHARS, SentenceSegmenter, cut_context, get_contexts, load_sentence_nlp
+
+
+# `cut_context` of the original GENRE.ipynb, with sentence spans given
+
+def get_location_sentence_id(loc_start, loc_end, sentence_idxs):
+    loc_sentence_id = 0
+    while loc_start >= sentence_idxs[loc_sentence_id][1]:
+        loc_sentence_id += 1
+    assert loc_end < sentence_idxs[loc_sentence_id][1]
+    return loc_sentence_id
+
+
+def find_context(sentences, loc_sentence_id, loc_span, loc_sentence_start):
+    context = {
+        'left': {'offset': 0, 'n_chars': 0, 'increment': -1, 'start': loc_span[0] - loc_sentence_start},
+        'right': {'offset': 0, 'n_chars': 0, 'increment': 1, 'start': loc_span[1] - loc_sentence_start}
+    }
+    for key, info in context.items():
+        idx = loc_sentence_id
+        stable_idx = loc_sentence_id
+        while info['n_chars'] < MAX_CONTEXT_CHARS:
+            stable_idx = idx
+            if info['offset'] == 0:
+                info['n_chars'] += len(sentences[loc_sentence_id][:info['start']])
+            else:
+                idx = loc_sentence_id + (info['offset'] * info['increment'])
+                if idx < 0 or idx == len(sentences):
+                    break
+                info['n_chars'] += len(sentences[idx])
+            info['offset'] += 1
+        info['idx'] = stable_idx
+    return context
+
+
+def notebook_cut_context(text, sentence_idxs):
+    if len(text) <= MAX_CONTEXT_CHARS:
+        return text
+
+    sentences = [text[s:e] for s, e in sentence_idxs]
+    loc = re.search(r'\[START\].+?\[END\]', text)
+    loc_sentence_id = get_location_sentence_id(loc.start(), loc.end(), sentence_idxs)
+    context = find_context(
+        sentences,
+        loc_sentence_id,
+        (loc.start(), loc.end()),
+        sentence_idxs[loc_sentence_id][0]
+    )
+    return ' '.join(sentences[context['left']['idx']:context['right']['idx'] + 1])
+
+
+def notebook_sentence_split(nlp, text):
+    clear_text = text.replace('[START] ', 'a' * 8).replace(' [END]', 'a' * 6)
+    return [(s.start_char, s.end_char) for s in nlp(clear_text).sents]
+
+
+def random_sentence(rnd, loc=None):
+    words = [rnd.choice(['Город', 'мы', 'поедем', 'туда', 'завтра', 'нет']) * rnd.randint(1, 30)
+             for _ in range(rnd.randint(1, 6))]
+    if loc is not None:
+        words.insert(rnd.randrange(len(words) + 1), loc)
+    return ' '.join(words) + rnd.choice(['.', '!', '?'])
+
+
+def test_cut_context_matches_notebook():
+    rnd = random.Random(0)
+    for _ in range(500):
+        n_sentences = rnd.randint(1, 40)
+        loc_sentence = rnd.randrange(n_sentences)
+        sentences = [
+            random_sentence(rnd, '[START] Москва [END]' if i == loc_sentence else None)
+            for i in range(n_sentences)
+        ]
+        text = ' '.join(sentences)
+        spans = []
+        for sentence in sentences:
+            start = spans[-1][1] + 1 if spans else 0
+            spans.append((start, start + len(sentence)))
+        loc = re.search(r'\[START\].+?\[END\]', text)
+
+        assert cut_context(text, spans, loc.span()) == notebook_cut_context(text, spans)
+
+
+def make_play(rnd):
+    utterances = []
+    for _ in range(6):
+        sentences = [random_sentence(rnd, rnd.choice([None, None, '<loc>Москва</loc>', '<loc>Крым</loc>']))
+                     for _ in range(rnd.randint(1, 30))]
+        utterances.append(f'<sp who="#a"><p>{" ".join(sentences)}</p></sp>')
+    return (
+        '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader/><text><body>'
+        + ''.join(utterances)
+        + '</body></text></TEI>'
+    )
+
+
+def test_get_contexts_matches_notebook(tmp_path, monkeypatch):
+    rnd = random.Random(1)
+    nlp = load_sentence_nlp('rus', fast=True)
+    segmenter = SentenceSegmenter(fast=True, cache_path=str(tmp_path / 'sentences.json'))
+    for _ in range(5):
+        record = parse_play(make_play(rnd).encode('utf-8'))
+        texts = get_single_location_texts(record)
+        expected = [notebook_cut_context(text, notebook_sentence_split(nlp, text)) for text in texts]
+        assert get_contexts([('rus', 'play', record)], segmenter) == {'play': expected}
+
+    # sentence boundaries are taken from the saved cache
+    monkeypatch.setattr(genre_context, 'load_sentence_nlp', None)
+    cached = SentenceSegmenter(fast=True, cache_path=str(tmp_path / 'sentences.json'))
+    assert get_contexts([('rus', 'play', record)], cached) == {'play': expected}
@@ -0,0 +1,70 @@
+from genre_inference import GenreLinker, make_batches, open_cache
+from genre_trie import SequenceTrie
+
+
+class Tokens(list):
+    def tolist(self):
+        return list(self)
+
+
+class ReorderingModel:
+    """
+    Greedy decoding of the first allowed token, with inputs reordered by length
+    like in fairseq's hub `generate`; the title is its token sequence.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def sample(self, texts, beam, prefix_allowed_tokens_fn):
+        self.calls.append(list(texts))
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        outputs = [None] * len(texts)
+        for batch_id, i in enumerate(order):
+            sent = Tokens()
+            while True:
+                allowed = prefix_allowed_tokens_fn(batch_id, sent)
+                if not allowed:
+                    break
+                sent.append(allowed[0])
+            outputs[i] = [{'text': ' '.join(map(str, sent)), 'score': -1}]
+        return outputs
+
+
+def default_tokens(batch_id, sent):
+    return [0] if not sent else []
+
+
+def test_make_batches_share_constraint():
+    items = [('a' * n, name) for n in range(10) for name in ['x', None, 'y']]
+    batches = make_batches(items, batch_size=4)
+    assert sorted((item for batch in batches for item in batch), key=str) == sorted(items, key=str)
+    for batch in batches:
+        assert len({name for _, name in batch}) == 1
+        assert [len(text) for text, _ in batch] == sorted(len(text) for text, _ in batch)
+        assert len(batch) <= 4
+
+
+def test_link_uses_trie_of_each_text():
+    model = ReorderingModel()
+    linker = GenreLinker(model, default_tokens, batch_size=4)
+    tries = {name: SequenceTrie([[2, i, 2]]) for i, name in enumerate(['x', 'y', 'z'], start=1)}
+    texts = ['[START] loc [END]' + ' ' * n for n in range(6)]
+    names = ['x', 'y', None, 'z', 'x', 'y']
+    constraints = [(name, tries[name]) if name else None for name in names]
+
+    results = linker.link(texts, constraints)
+    expected = {'x': '2 1 2', 'y': '2 2 2', 'z': '2 3 2', None: '0'}
+    assert [locs[0]['text'] for _, locs in results] == [expected[name] for name in names]
+    assert [text for text, _ in results] == texts
+    assert len(model.calls) == 4
+
+
+def test_link_decodes_unique_texts_once(tmp_path):
+    model = ReorderingModel()
+    linker = GenreLinker(model, default_tokens, cache=open_cache(str(tmp_path / 'cache.sqlite')))
+    results = linker.link(['b', 'a', 'b'])
+    assert [locs[0]['text'] for _, locs in results] == ['0'] * 3
+    assert model.calls == [['b', 'a']]
+
+    assert linker.link(['a', 'b']) == results[1:]
+    assert len(model.calls) == 1
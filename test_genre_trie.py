@@ -0,0 +1,55 @@
+import random
+
+import marisa_trie
+
+from genre_trie import SequenceTrie, build_lang_trie, encode_sequence, load_lang_trie, token_to_char
+
+
+LANG_SUFFIXES = {'ru': [17, 250001, 2], 'es': [17, 250004, 2]}
+OTHER_SUFFIX = [17, 250010, 2]
+
+
+class FullTrie:
+    """The parts of `genre.trie.MarisaTrie` used by `build_lang_trie`."""
+    def __init__(self, sequences, max_token_id=256001):
+        self.int2char = [token_to_char(i) for i in range(max_token_id)]
+        self.trie = marisa_trie.Trie(encode_sequence(sequence) for sequence in sequences)
+
+
+def next_tokens(sequences, prefix):
+    return {s[len(prefix)] for s in sequences if len(s) > len(prefix) and s[:len(prefix)] == prefix}
+
+
+def make_sequences(rnd, suffixes, n=300):
+    tokens = [3, 4, 5, 54999, 55000, 60000, 250000]
+    return [
+        [2] + [rnd.choice(tokens) for _ in range(rnd.randint(1, 5))] + rnd.choice(suffixes)
+        for _ in range(n)
+    ]
+
+
+def test_sequence_trie():
+    rnd = random.Random(0)
+    sequences = make_sequences(rnd, list(LANG_SUFFIXES.values()))
+    trie = SequenceTrie(sequences)
+    for sequence in sequences[:50]:
+        for i in range(len(sequence) + 1):
+            assert set(trie.get(sequence[:i])) == next_tokens(sequences, sequence[:i])
+    assert trie.get([2, 1]) == []
+
+
+def test_lang_trie(tmp_path):
+    rnd = random.Random(1)
+    lang_sequences = make_sequences(rnd, list(LANG_SUFFIXES.values()))
+    other_sequences = make_sequences(rnd, [OTHER_SUFFIX])
+    path = str(tmp_path / 'titles.marisa')
+
+    build_lang_trie(FullTrie(lang_sequences + other_sequences), LANG_SUFFIXES, path)
+    trie = load_lang_trie(path)
+
+    unique_sequences = {tuple(s) for s in lang_sequences}
+    assert len(trie) == len(unique_sequences)
+    assert {tuple(s) for s in trie} == unique_sequences
+    for sequence in lang_sequences[:50] + other_sequences[:10]:
+        for i in range(len(sequence) + 1):
+            assert set(trie.get(sequence[:i])) == next_tokens(lang_sequences, sequence[:i])
@@ -0,0 +1,43 @@
+import os
+import re
+
+from owlready2 import World
+
+import ontology
+
+
+def load_world(path):
+    world = World()
+    onto = world.get_ontology(f'file://{os.path.abspath(path)}').load()
+    return world, onto
+
+
+def decode_iri(iri):
+    """Undo \\uXXXX escapes (owlready2 keeps them in IRIs read from N-Triples)."""
+    return re.sub(r'\\u([0-9A-F]{4})', lambda m: chr(int(m.group(1), 16)), iri)
+
+
+def test_entity_iri():
+    base_iri = ontology.onto.base_iri
+    assert ontology.entity_iri('NULL_Новый Свет') == f'<{base_iri}NULL_Новый\\u0020Свет>'
+    assert ontology.entity_iri('#mention_#beg_x_Крым') == f'<{base_iri}#mention_#beg_x_Крым>'
+    assert ontology.entity_iri('a<b>"\\') == f'<{base_iri}a\\u003Cb\\u003E\\u0022\\u005C>'
+
+
+def test_bulk_ontology_loads_with_same_triples(ontology_files):
+    owl_path, nt_path = ontology_files
+    owl_world, owl_onto = load_world(owl_path)
+    nt_world, nt_onto = load_world(nt_path)
+
+    assert len(list(nt_world.get_triples())) == len(list(owl_world.get_triples()))
+    for cls in ['Language', 'Play', 'Speaker', 'Location', 'NMentions']:
+        owl_instances = list(getattr(owl_onto, cls).instances())
+        nt_instances = list(getattr(nt_onto, cls).instances())
+        assert len(nt_instances) == len(owl_instances) > 0
+
+    owl_iris = {entity.iri for entity in owl_world.individuals()}
+    assert {decode_iri(entity.iri) for entity in nt_world.individuals()} == owl_iris
+    assert f'{owl_onto.base_iri}#mention_#bulgakov-beg_serafima_Новый Свет' in owl_iris
+
+    null_location = [loc for loc in nt_onto.Location.instances() if 'Новый Свет' in loc.location_name]
+    assert len(null_location) == 1 and null_location[0].wikidata_id == []
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+from ontology_query import OntologyIndex, get_name, load_index_data, scan_ontology
+
+
+DATA = {
+    'plays': {
+        'beg': {'title': 'Бег', 'lang': 'rus'},
+        'luces': {'title': 'Luces de bohemia', 'lang': 'span'}
+    },
+    'locations': {
+        'Q90': {'names': ['Париж', 'París'], 'wikidata_ids': ['Q90']},
+        'Q7835': {'names': ['Крым'], 'wikidata_ids': ['Q7835']},
+        'Q2807': {'names': ['Madrid'], 'wikidata_ids': ['Q2807']}
+    },
+    'speakers': {
+        'beg_golubkov': {'name': 'Голубков', 'play': 'beg'},
+        'beg_serafima': {'name': 'Серафима', 'play': 'beg'},
+        'luces_max': {'name': 'Max Estrella', 'play': 'luces'}
+    },
+    'mentions': [
+        ['beg_golubkov', 'Q90', 1],
+        ['beg_golubkov', 'Q7835', 6],
+        ['beg_serafima', 'Q7835', 2],
+        ['luces_max', 'Q90', 3],
+        ['luces_max', 'Q2807', 4]
+    ]
+}
+
+
+Entity = namedtuple('Entity', ['iri', 'name'])
+
+
+def test_get_name_keeps_names_as_they_are():
+    base_iri = 'http://test.org/onto#'
+    entity = Entity(base_iri + '#mention_#beg_x_100%25 Крым', '#mention_#beg_x_100%25 Крым')
+    assert get_name(entity, base_iri) == 'mention_#beg_x_100%25 Крым'
+    escaped = Entity(base_iri + 'NULL_Новый\\u0020Свет', 'NULL_Новый\\u0020Свет')
+    assert get_name(escaped, base_iri, escaped=True) == 'NULL_Новый Свет'
+
+
+def test_queries():
+    index = OntologyIndex(DATA)
+    assert index.plays_mentioning('Q90') == [('luces', 3), ('beg', 1)]
+    assert index.plays_mentioning('Париж') == index.plays_mentioning('Q90')
+    assert index.speakers_mentioning('Крым') == [('beg_golubkov', 6), ('beg_serafima', 2)]
+    assert index.locations_of_play('beg') == [('Q7835', 8), ('Q90', 1)]
+    assert index.locations_of_language('span') == [('Q2807', 4), ('Q90', 3)]
+    assert index.shared_locations() == ['Q90']
+    assert index.shared_locations(('rus',)) == ['Q7835', 'Q90']
+    assert index.top_speakers(2) == [('beg_golubkov', 2), ('luces_max', 2)]
+    assert index.top_speakers(1, ('Q90',)) == [('beg_golubkov', 1)]
+    assert index.plays_mentioning('Лондон') == []
+
+
+def test_shared_locations_without_languages():
+    index = OntologyIndex({'plays': {}, 'locations': {}, 'speakers': {}, 'mentions': []})
+    assert index.shared_locations() == []
+
+
+def test_results_are_cached_per_index():
+    index = OntologyIndex(DATA)
+    other = OntologyIndex(DATA)
+    assert index.plays_mentioning('Q90') is index.plays_mentioning('Q90')
+    assert ('plays', 'Q90') in index.results
+    assert other.results == {}
+
+
+def test_scan_bulk_ontology(ontology_files):
+    """The .nt written by `ontology.py --bulk` gives the same index as the .owl."""
+    owl_path, nt_path = ontology_files
+    owl_data = scan_ontology(owl_path)
+    nt_data = scan_ontology(nt_path)
+    assert nt_data == owl_data
+    assert 'NULL_Новый Свет' in nt_data['locations']
+    assert ['bulgakov-beg_serafima', 'NULL_Новый Свет', 1] in nt_data['mentions']
+
+
+def test_index_file(ontology_files, tmp_path):
+    _, nt_path = ontology_files
+    index_path = str(tmp_path / 'index.json')
+    data = load_index_data(nt_path, index_path)
+    assert load_index_data(nt_path, index_path) == data
+    assert OntologyIndex(data).plays_mentioning('Q7835') == [('bulgakov-beg', 8)]
@@ -0,0 +1,146 @@
+import os
+import re
+from io import BytesIO
+
+from lxml import etree
+
+import parse_ner
+from corpus_index import NAMESPACE, UTTERANCE_XPATH, TEXT_XPATH
+from parse_ner import (
+    Location,
+    compile_relevant_text,
+    find_all_locations,
+    flatten_parts,
+    get_text_parts,
+    group_locations_by_relevant_parts,
+    parse_ner_in_plays,
+    write_play
+)
+
+
+PLAY = '''<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+  <text><body><div>
+    <sp who="#golubkov">
+      <speaker>Голубков</speaker>
+      <p>Поедем в Крым, <stage>(смотрит на Серафиму)</stage> потом
+        в Париж. <rs>Константинополь</rs> далеко.</p>
+      <p>Нет.</p>
+    </sp>
+    <sp who="#serafima"><p>  </p><p>Ah, Madrid y Sevilla.</p></sp>
+  </div></body></text>
+</TEI>
+'''
+LOC_TAG = f'{{{NAMESPACE["ns"]}}}loc'  # written as <loc>, parsed back in the TEI namespace
+CAPITALIZED_REGEX = re.compile(r'(?<=\s)[A-ZА-Я]\w+')
+
+
+def fake_ner(text):
+    """Deterministic stand-in for Stanza: capitalized words not at the start."""
+    return [Location(m.group(), m.start(), m.end()) for m in CAPITALIZED_REGEX.finditer(text)]
+
+
+def notebook_create_elems_from_locations(location_lst, part_text, part_start):
+    """create_elems_from_locations of NER.ipynb, with <loc> built by fromstring."""
+    parsed_elems = []
+    prev_end_idx = 0
+    for ent in location_lst:
+        loc_elem = etree.fromstring(f'<loc>{ent.text}</loc>')
+        starting_text = part_text[prev_end_idx:ent.start_char - part_start]
+        if not parsed_elems:
+            parsed_elems.append(starting_text)
+        else:
+            parsed_elems[-1].tail = starting_text
+        parsed_elems.append(loc_elem)
+        prev_end_idx = ent.end_char - part_start
+    if parsed_elems:
+        parsed_elems[-1].tail = part_text[prev_end_idx:]
+    else:
+        parsed_elems = [part_text]
+    return parsed_elems
+
+
+def notebook_parse_ner_in_play(xml_text):
+    """NER.ipynb: one NER call per <p> tag, <p> rebuilt right away."""
+    tree = etree.parse(BytesIO(xml_text.encode('utf-8')))
+    for utterance in tree.xpath(UTTERANCE_XPATH, namespaces=NAMESPACE):
+        for p_tag in utterance.xpath(TEXT_XPATH, namespaces=NAMESPACE):
+            all_parts = get_text_parts(p_tag)
+            text, selected_part_idxs, selected_char_idxs = compile_relevant_text(all_parts)
+            if not text:
+                continue
+            locations = fake_ner(text)
+            locations_by_part = group_locations_by_relevant_parts(locations, selected_char_idxs)
+            for location_lst, (part_start, part_end), part_idx in zip(
+                    locations_by_part, selected_char_idxs, selected_part_idxs):
+                all_parts[part_idx] = notebook_create_elems_from_locations(
+                    location_lst, text[part_start:part_end], part_start
+                )
+            parsed_elems = flatten_parts(all_parts)
+            for child in list(p_tag):
+                p_tag.remove(child)
+            p_tag.text = ''
+            for i, elem in enumerate(parsed_elems):
+                if not i and isinstance(elem, str):
+                    p_tag.text = elem
+                else:
+                    p_tag.append(elem)
+    return tree
+
+
+def fake_find_all_locations(texts, batch_size, jobs, use_gpu):
+    return [fake_ner(text) for _, text in texts]
+
+
+def test_matches_notebook_per_p(monkeypatch, tmp_path):
+    playtexts = {'rus': {'beg': PLAY}}
+    corpus_path = os.path.join(parse_ner.AUTO_CORPUS_FOLDER, 'rus', 'bulgakov-beg.xml')
+    if os.path.exists(corpus_path):
+        tree = etree.parse(corpus_path)
+        etree.strip_tags(tree, LOC_TAG)
+        playtexts['rus']['bulgakov-beg'] = etree.tostring(tree, encoding='unicode')
+
+    monkeypatch.setattr(parse_ner, 'find_all_locations', fake_find_all_locations)
+    parse_ner_in_plays(playtexts, output_folder=str(tmp_path / 'batched'))
+
+    for playname, xml_text in playtexts['rus'].items():
+        expected_path = str(tmp_path / f'{playname}.xml')
+        write_play(notebook_parse_ner_in_play(xml_text), expected_path)
+        with open(expected_path, 'rb') as f:
+            expected = f.read()
+        with open(tmp_path / 'batched' / 'rus' / f'{playname}.xml', 'rb') as f:
+            assert f.read() == expected
+
+    tree = etree.parse(str(tmp_path / 'batched' / 'rus' / 'beg.xml'))
+    assert [loc.text for loc in tree.iter(LOC_TAG)] == ['Крым', 'Париж', 'Madrid', 'Sevilla']
+
+
+def test_loc_with_special_characters(monkeypatch, tmp_path):
+    play = PLAY.replace('Madrid y Sevilla', 'Sevilla &amp; Madrid')
+    entity = 'Sevilla & Madrid'
+
+    def find_all_locations(texts, *args):
+        return [
+            [Location(entity, text.index(entity), text.index(entity) + len(entity))] if entity in text else []
+            for _, text in texts
+        ]
+
+    monkeypatch.setattr(parse_ner, 'find_all_locations', find_all_locations)
+    parse_ner_in_plays({'span': {'luces': play}}, output_folder=str(tmp_path))
+    tree = etree.parse(str(tmp_path / 'span' / 'luces.xml'))
+    assert [loc.text for loc in tree.iter(LOC_TAG)] == ['Sevilla & Madrid']
+
+
+def test_find_all_locations_batches_by_language(monkeypatch):
+    calls = []
+
+    def find_locations(lang, texts):
+        calls.append((lang, texts))
+        return [[Location(text, 0, len(text))] for text in texts]
+
+    monkeypatch.setattr(parse_ner, 'find_locations', find_locations)
+    texts = [('rus', 'а'), ('span', 'b'), ('rus', 'в'), ('rus', 'г'), ('span', 'd')]
+    locations = find_all_locations(texts, batch_size=2, use_gpu=False)
+
+    assert calls == [('span', ['b', 'd']), ('rus', ['а', 'в']), ('rus', ['г'])]
+    assert [[loc.text for loc in locs] for locs in locations] == [[text] for _, text in texts]
@@ -0,0 +1,44 @@
+import pipeline
+
+
+def make_stage(name, inputs, outputs, optional_inputs=()):
+    script = f'{name}.py'
+    return {
+        'name': name,
+        'command': [script],
+        'code': [script],
+        'inputs': list(inputs),
+        'optional_inputs': list(optional_inputs),
+        'outputs': list(outputs)
+    }
+
+
+def test_optional_input(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'intermediate_data_files').mkdir()
+    (tmp_path / 'links.py').write_text(
+        'import os\n'
+        'open("links.csv", "w").write(str(os.path.exists("genre.json")))\n'
+    )
+    (tmp_path / 'kwic.csv').write_text('kwic')
+    stage = make_stage('links', ['kwic.csv'], ['links.csv'], optional_inputs=['genre.json'])
+    monkeypatch.setattr(pipeline, 'STAGES', [stage])
+
+    assert pipeline.run_pipeline() == set()
+    assert (tmp_path / 'links.csv').read_text() == 'False'
+
+    (tmp_path / 'links.csv').write_text('')
+    assert pipeline.run_pipeline() == set()
+    assert (tmp_path / 'links.csv').read_text() == ''
+
+    (tmp_path / 'genre.json').write_text('{}')
+    assert pipeline.run_pipeline() == set()
+    assert (tmp_path / 'links.csv').read_text() == 'True'
+
+
+def test_missing_required_input(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'intermediate_data_files').mkdir()
+    (tmp_path / 'links.py').write_text('')
+    monkeypatch.setattr(pipeline, 'STAGES', [make_stage('links', ['kwic.csv'], ['links.csv'])])
+    assert pipeline.run_pipeline() == {'links'}
@@ -0,0 +1,54 @@
+import json
+import random
+
+from find_coefficients import COEFS_GRID, DEFAULT
+from ranking import STAT_KEYS, build_features, score_candidates, score_features
+
+
+def make_info(rnd, n_locs=30, n_entities=40):
+    """Random candidates and stats in the format of `wikidata_locations_info.json`."""
+    names = [f'loc{i}' for i in range(n_locs)]
+    candidates = {}
+    stats = {}
+    for lang in ['ru', 'es']:
+        lang_stats = {}
+        for i in range(n_entities):
+            if rnd.random() < 0.1:
+                continue  # a candidate without stats (no Wikipedia page)
+            info = {key: rnd.choice([0, 1, 2, 3, 7, 100, 2500]) for key in STAT_KEYS}
+            info['label'] = rnd.choice(names)
+            info['aliases'] = rnd.sample(names, rnd.randint(0, 3))
+            info['wikipedia_url'] = f'https://{lang}.wikipedia.org/wiki/Q{i}'
+            lang_stats[f'Q{i}'] = info
+        stats[lang] = lang_stats
+        candidates[lang] = {
+            name: rnd.sample([f'Q{i}' for i in range(n_entities)], rnd.randint(0, 8))
+            for name in names
+        }
+    return candidates, stats
+
+
+def random_coefs(rnd):
+    return {key: rnd.choice(values) for key, values in COEFS_GRID}
+
+
+def test_score_features_matches_score_candidates():
+    rnd = random.Random(0)
+    candidates, stats = make_info(rnd)
+    features = build_features(candidates, stats)
+    for coefs in [DEFAULT] + [random_coefs(rnd) for _ in range(300)]:
+        # compared as json to tell int scores from float ones
+        expected = json.dumps(score_candidates(candidates, stats, coefs))
+        assert json.dumps(score_features(features, coefs)) == expected
+
+
+def test_score_features_top():
+    rnd = random.Random(1)
+    candidates, stats = make_info(rnd)
+    features = build_features(candidates, stats)
+    for coefs in [DEFAULT] + [random_coefs(rnd) for _ in range(20)]:
+        full = score_features(features, coefs)
+        top = score_features(features, coefs, top=3)
+        for lang, locs in full.items():
+            for loc, ranking in locs.items():
+                assert top[lang][loc] == ranking[:3]
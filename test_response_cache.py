@@ -0,0 +1,39 @@
+import pytest
+
+from response_cache import MISSING, CacheMiss, ResponseCache, make_key
+
+
+def test_make_key_normalizes_request():
+    key, _ = make_key('sparql', {'query': 'SELECT  ?x\n WHERE {}', 'format': 'json'})
+    assert make_key('sparql', {'format': 'json', 'query': 'SELECT ?x WHERE {}', 'key': 'secret'})[0] == key
+
+
+def test_cached_null_is_a_hit(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with ResponseCache(path) as cache:
+        assert cache.get('api', {'id': 1}) is None
+        assert cache.get('api', {'id': 1}, MISSING) is MISSING
+        cache.set('api', {'id': 1}, None)
+        assert cache.get('api', {'id': 1}, MISSING) is None
+
+        calls = []
+        assert cache.fetch('api', {'id': 1}, lambda: calls.append(1)) is None
+        assert calls == []
+
+    with ResponseCache(path, offline=True) as cache:
+        assert cache.get('api', {'id': 1}, MISSING) is None
+        assert cache.fetch('api', {'id': 1}, lambda: 1 / 0) is None
+        with pytest.raises(CacheMiss):
+            cache.get('api', {'id': 2}, MISSING)
+
+
+def test_expired_and_evicted(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=-1) as cache:
+        cache.set('api', {'id': 1}, [1])
+        assert cache.get('api', {'id': 1}, MISSING) is MISSING
+
+    with ResponseCache(str(tmp_path / 'lru.sqlite'), max_entries=2) as cache:
+        for i in range(3):
+            cache.set('api', {'id': i}, i)
+        assert cache.n_entries == 2
+        assert [cache.get('api', {'id': i}, MISSING) for i in range(3)] == [MISSING, 1, 2]
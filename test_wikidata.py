@@ -0,0 +1,144 @@
+import re
+import asyncio
+
+from wikidata import (
+    ENTITIES_BATCH_SIZE,
+    LINKS_BATCH_SIZE,
+    LINKS_BATCH_WEIGHT,
+    get_candidates_stats,
+    get_entities,
+    get_links_counts,
+    make_links_batches
+)
+
+
+N_LINKS = {f'Q{i}': i % 7 for i in range(1, 200)}  # Q7, Q14, ... have no links
+
+
+class FakeClient:
+    """Answers links queries from N_LINKS; batch queries of more than `max_batch` entities time out."""
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self.queries = []
+
+    async def get_json(self, url, params=None, timeout=-1, retry_timeouts=True):
+        query = params['query']
+        self.queries.append(query)
+        values = re.search(r'VALUES \?target \{(.*?)\}', query)
+        if values is None:
+            entity_id = re.search(r'wd:(Q\d+) \.', query).group(1)
+            return {'results': {'bindings': [{'entityCount': {'value': str(N_LINKS[entity_id])}}]}}
+
+        entity_ids = re.findall(r'wd:(Q\d+)', values.group(1))
+        if len(entity_ids) > self.max_batch:
+            assert not retry_timeouts
+            raise asyncio.TimeoutError
+        return {'results': {'bindings': [
+            {
+                'target': {'value': f'http://www.wikidata.org/entity/{entity_id}'},
+                'entityCount': {'value': str(N_LINKS[entity_id])}
+            }
+            for entity_id in entity_ids if N_LINKS[entity_id]
+        ]}}
+
+
+def test_make_links_batches():
+    entity_ids = [f'Q{i}' for i in range(1, 200)]
+    weights = {'Q3': 600, 'Q5': 300, 'Q6': 300}
+    batches = make_links_batches(entity_ids, weights)
+
+    assert [entity_id for batch in batches for entity_id in batch] == entity_ids
+    assert ['Q3'] in batches  # heavier than a batch, alone
+    for batch in batches:
+        assert len(batch) <= LINKS_BATCH_SIZE
+        assert len(batch) == 1 or sum(weights.get(e, 1) for e in batch) <= LINKS_BATCH_WEIGHT
+    assert make_links_batches([], weights) == []
+
+
+def test_get_links_counts_splits_timed_out_batches():
+    entity_ids = sorted(N_LINKS)
+    weights = {entity_id: 1 for entity_id in entity_ids}
+
+    client = FakeClient(max_batch=LINKS_BATCH_SIZE)
+    assert asyncio.run(get_links_counts(client, entity_ids, weights)) == N_LINKS
+    assert len(client.queries) == 4
+
+    client = FakeClient(max_batch=10)
+    assert asyncio.run(get_links_counts(client, entity_ids, weights)) == N_LINKS
+    assert len(client.queries) > 4
+
+    client = FakeClient(max_batch=0)
+    assert asyncio.run(get_links_counts(client, entity_ids[:5], weights)) == {
+        entity_id: N_LINKS[entity_id] for entity_id in entity_ids[:5]
+    }
+
+
+class FakeEntityClient:
+    """wbgetentities of ENTITIES (Q10 redirects to Q11, Q99 is missing) and links queries."""
+    ENTITIES = {
+        'Q1': {'sitelinks': {'ruwiki': {}, 'eswiki': {}}},
+        'Q2': {'sitelinks': {'eswiki': {}}},
+        'Q11': {'sitelinks': {'ruwiki': {}}}
+    }
+
+    def __init__(self):
+        self.requested_ids = []
+
+    async def get_json(self, url, params=None, timeout=-1, retry_timeouts=True):
+        if 'query' in params:
+            entity_ids = re.findall(r'wd:(Q\d+)', params['query'])
+            return {'results': {'bindings': [
+                {'target': {'value': f'http://www.wikidata.org/entity/{e}'}, 'entityCount': {'value': '5'}}
+                for e in entity_ids
+            ]}}
+
+        entity_ids = params['ids'].split('|')
+        assert len(entity_ids) <= ENTITIES_BATCH_SIZE
+        self.requested_ids += entity_ids
+        entities = {}
+        for entity_id in entity_ids:
+            if entity_id == 'Q10':
+                entities['Q11'] = self.make_entity('Q11', redirects={'from': 'Q10', 'to': 'Q11'})
+            elif entity_id in self.ENTITIES:
+                entities[entity_id] = self.make_entity(entity_id)
+            else:
+                entities[entity_id] = {'id': entity_id, 'missing': ''}
+        return {'entities': entities}
+
+    def make_entity(self, entity_id, **extra):
+        sitelinks = {
+            site: {'site': site, 'url': f'https://{site[:2]}.wikipedia.org/wiki/{entity_id}'}
+            for site in self.ENTITIES[entity_id]['sitelinks']
+        }
+        return {
+            'id': entity_id,
+            'labels': {'ru': {'value': entity_id}},
+            'descriptions': {},
+            'aliases': {},
+            'claims': {},
+            'sitelinks': sitelinks,
+            **extra
+        }
+
+
+def test_get_candidates_stats():
+    client = FakeEntityClient()
+    unique_candidates = {'ru': {'Q1', 'Q2', 'Q10', 'Q99'}, 'es': {'Q1', 'Q2'}}
+    stats = asyncio.run(get_candidates_stats(client, unique_candidates))
+
+    # each entity is requested once for both languages
+    assert sorted(client.requested_ids) == ['Q1', 'Q10', 'Q2', 'Q99']
+    # entities without a Wikipedia page in the language and missing ones are dropped,
+    # a redirected entity is kept under the requested id
+    assert {lang: sorted(lang_stats) for lang, lang_stats in stats.items()} == {
+        'ru': ['Q1', 'Q10'], 'es': ['Q1', 'Q2']
+    }
+    assert stats['ru']['Q10']['wikipedia_url'] == 'https://ru.wikipedia.org/wiki/Q11'
+    assert stats['es']['Q2']['n_links'] == 5
+
+
+def test_get_entities_in_batches():
+    client = FakeEntityClient()
+    entity_ids = [f'Q{i}' for i in range(100, 100 + 2 * ENTITIES_BATCH_SIZE + 1)]
+    assert asyncio.run(get_entities(client, entity_ids)) == {}
+    assert client.requested_ids == entity_ids
@@ -0,0 +1,77 @@
+import asyncio
+from time import monotonic
+
+import pytest
+from aiohttp import web
+
+from response_cache import ResponseCache
+from wikidata_client import TIMEOUT_MARKER, TokenBucket, WikidataClient, get_retry_delay
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_get_retry_delay():
+    assert get_retry_delay(0, Response({'Retry-After': '3'})) == 3
+    assert get_retry_delay(0, Response({'Retry-After': '600'})) == 60
+    for attempt in range(10):
+        delay = min(2 ** attempt, 60)
+        assert delay / 2 <= get_retry_delay(attempt, Response({})) <= delay
+
+
+def test_token_bucket_rate():
+    async def acquire_all(bucket, n):
+        start = monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return monotonic() - start
+
+    assert asyncio.run(acquire_all(TokenBucket(rate=50, capacity=5), 5)) < 0.05
+    assert asyncio.run(acquire_all(TokenBucket(rate=50, capacity=5), 15)) >= 10 / 50 * 0.9
+
+
+async def run_with_server(handler, func, method='GET'):
+    app = web.Application()
+    app.router.add_route(method, '/api', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await func(f'http://127.0.0.1:{port}/api')
+    finally:
+        await runner.cleanup()
+
+
+def test_retries_and_cache(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(dict(request.query))
+        if request.query['id'] == 'busy' and len(requests) < 3:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        if request.query['id'] == 'slow':
+            await asyncio.sleep(0.5)
+        return web.json_response(None if request.query['id'] == 'null' else {'id': request.query['id']})
+
+    async def get_all(url):
+        cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+        async with WikidataClient(rate=100, timeout=0.1, max_retries=3, cache=cache) as client:
+            busy = await client.get_json(url, {'id': 'busy'})
+            null = await client.get_json(url, {'id': 'null'})
+            for _ in range(2):  # the second timeout is replayed from the cache
+                with pytest.raises(asyncio.TimeoutError):
+                    await client.get_json(url, {'id': 'slow'}, retry_timeouts=False)
+            slow = cache.get(url, {'id': 'slow'})
+
+            # replayed from the cache
+            assert await client.get_json(url, {'id': 'busy'}) == busy
+            assert await client.get_json(url, {'id': 'null'}) is None
+        return busy, null, slow
+
+    busy, null, slow = asyncio.run(run_with_server(handler, get_all))
+    assert busy == {'id': 'busy'} and null is None and slow == TIMEOUT_MARKER
+    assert [r['id'] for r in requests] == ['busy', 'busy', 'busy', 'null', 'slow']
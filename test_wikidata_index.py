@@ -0,0 +1,102 @@
+import gzip
+import json
+
+import pytest
+
+from wikidata_index import build_index, collect_stats, get_truthy_values
+from wikidata_stats import get_entity_info
+
+
+def item_claim(prop, target, rank='normal', **extra):
+    return {
+        'mainsnak': {
+            'snaktype': 'value',
+            'property': prop,
+            'datavalue': {'type': 'wikibase-entityid', 'value': {'id': target}}
+        },
+        'rank': rank,
+        **extra
+    }
+
+
+def entity(entity_id, claims=(), labels=None, aliases=None, sitelinks=None):
+    data = {
+        'id': entity_id,
+        'labels': {lang: {'language': lang, 'value': value} for lang, value in (labels or {}).items()},
+        'descriptions': {},
+        'aliases': {
+            lang: [{'language': lang, 'value': value} for value in values]
+            for lang, values in (aliases or {}).items()
+        },
+        'claims': {},
+        'sitelinks': {f'{lang}wiki': {'site': f'{lang}wiki', 'title': title} for lang, title in (sitelinks or {}).items()}
+    }
+    for claim in claims:
+        data['claims'].setdefault(claim['mainsnak']['property'], []).append(claim)
+    return data
+
+
+MOSCOW = entity(
+    'Q649',
+    [item_claim('P31', 'Q515', qualifiers={'P580': []}, references=[{}, {}]), item_claim('P17', 'Q159')],
+    labels={'ru': 'Москва', 'es': 'Moscú', 'en': 'Moscow'},
+    aliases={'ru': ['Первопрестольная', 'Мск']},
+    sitelinks={'ru': 'Москва', 'es': 'Moscú'}
+)
+ENTITIES = [
+    entity('Q515', [item_claim('P279', 'Q82794')], labels={'ru': 'город'}),
+    entity('Q4022', [item_claim('P279', 'Q2221906')], labels={'ru': 'река'}),
+    MOSCOW,
+    entity('Q175117', [item_claim('P31', 'Q4022')], labels={'ru': 'Москва (река)'}, sitelinks={'ru': 'Москва (река)'}),
+    entity('Q2', [item_claim('P31', 'Q515', rank='deprecated')], labels={'ru': 'Москва'}),
+    entity('Q3', [item_claim('P31', 'Q4022')], labels={'ru': 'Яуза'}),
+    entity('Q5000', [
+        item_claim('P19', 'Q649'), item_claim('P19', 'Q649'), item_claim('P20', 'Q649'),
+        item_claim('P551', 'Q175117', rank='deprecated')
+    ])
+]
+
+
+def write_dump(path, entities):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('[\n' + ',\n'.join(json.dumps(e, ensure_ascii=False) for e in entities) + '\n]\n')
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    dump_path = str(tmp_path / 'dump.json.gz')
+    write_dump(dump_path, ENTITIES)
+    path = str(tmp_path / 'index.sqlite')
+    build_index(dump_path, path)
+    return path
+
+
+def test_get_truthy_values():
+    claims = [item_claim('P31', 'Q1'), item_claim('P31', 'Q2', rank='preferred'), item_claim('P31', 'Q3', rank='deprecated')]
+    assert get_truthy_values(entity('Q0', claims), 'P31') == ['Q2']
+    assert get_truthy_values(entity('Q0', claims[:1] + claims[2:]), 'P31') == ['Q1']
+    assert get_truthy_values(entity('Q0'), 'P31') == []
+
+
+def test_collect_stats(index_path):
+    unique_locations = {'ru': {'Москва', 'мск', 'Яуза', 'Лондон'}, 'es': {'Moscú'}}
+    location_candidates, candidates_stats = collect_stats(unique_locations, index_path)
+
+    # regions are preferred; the river is found by its name without the qualifier
+    assert location_candidates['ru'] == {'Москва': ['Q649'], 'мск': ['Q649'], 'Яуза': ['Q3'], 'Лондон': []}
+    assert location_candidates['es'] == {'Moscú': ['Q649']}
+
+    # the same stats as get_entity_info on the API entity with 2 links (P19 and P20)
+    for lang in ['ru', 'es']:
+        api_entity = json.loads(json.dumps(MOSCOW))
+        for wikilang, title in [('ru', '%D0%9C%D0%BE%D1%81%D0%BA%D0%B2%D0%B0'), ('es', 'Mosc%C3%BA')]:
+            api_entity['sitelinks'][f'{wikilang}wiki']['url'] = f'https://{wikilang}.wikipedia.org/wiki/{title}'
+        assert candidates_stats[lang]['Q649'] == get_entity_info(lang, api_entity, 2)
+    # no Wikipedia page
+    assert 'Q3' not in candidates_stats['ru']
+
+
+def test_river_candidates(index_path):
+    location_candidates, candidates_stats = collect_stats({'ru': {'Москва (река)'}}, index_path)
+    assert location_candidates['ru'] == {'Москва (река)': ['Q175117']}
+    assert candidates_stats['ru']['Q175117']['n_links'] == 0
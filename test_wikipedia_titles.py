@@ -0,0 +1,64 @@
+import gzip
+
+from response_cache import ResponseCache
+from wikipedia_titles import DUMP_FILENAME, TitleMap, build_title_map, iter_sql_rows
+
+
+def write_dump(folder, lang, table, lines):
+    path = folder / (DUMP_FILENAME % (lang, table))
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(f'-- MySQL dump of {table}\n')
+        f.write(''.join(line + '\n' for line in lines))
+    return str(path)
+
+
+def test_iter_sql_rows(tmp_path):
+    path = write_dump(tmp_path, 'ru', 'page', [
+        "CREATE TABLE `page` (\n  `page_id` int(8)\n);",
+        "INSERT INTO `page` VALUES (1,0,'Москва','',0.5,NULL),(2,0,'O\\'Higgins_(ciudad), Chile','a\\\\b',1,'x');",
+        "INSERT INTO `page_props` VALUES (1,'wikibase_item','Q649',NULL);",
+        "INSERT INTO `page` VALUES (3,14,'Line\\nbreak','()',2,NULL);"
+    ])
+    assert list(iter_sql_rows(path, 'page')) == [
+        ['1', '0', 'Москва', '', '0.5', None],
+        ['2', '0', "O'Higgins_(ciudad), Chile", 'a\\b', '1', 'x'],
+        ['3', '14', 'Line\nbreak', '()', '2', None]
+    ]
+
+
+def test_title_map(tmp_path):
+    write_dump(tmp_path, 'ru', 'page', [
+        "INSERT INTO `page` VALUES (1,0,'Москва'),(2,0,'Мск'),(3,1,'Москва'),(4,0,'Нет_ссылки');"
+    ])
+    write_dump(tmp_path, 'ru', 'page_props', [
+        "INSERT INTO `page_props` VALUES (1,'wikibase_item','Q649',NULL),(3,'wikibase_item','Q1',NULL);"
+    ])
+    write_dump(tmp_path, 'ru', 'redirect', [
+        "INSERT INTO `redirect` VALUES (2,0,'Москва','',''),(4,0,'Москва','en','');"
+    ])
+    for table in ['page', 'page_props', 'redirect']:
+        write_dump(tmp_path, 'es', table, [])
+
+    cache_path = str(tmp_path / 'cache.sqlite')
+    with ResponseCache(cache_path) as cache:
+        cache.set('https://es.wikipedia.org/w/api.php', {'titles': 'madrid'}, {'query': {
+            'normalized': [{'from': 'madrid', 'to': 'Madrid'}],
+            'pages': {'41188': {
+                'title': 'Madrid',
+                'fullurl': 'https://es.wikipedia.org/wiki/Madrid',
+                'pageprops': {'wikibase_item': 'Q2807'}
+            }, '-1': {'title': 'Nowhere', 'missing': ''}}
+        }})
+        cache.set('https://www.wikidata.org/w/api.php', {'ids': 'Q1'}, None)
+
+    path = str(tmp_path / 'titles.marisa')
+    build_title_map(str(tmp_path), cache_path, path)
+    title_map = TitleMap(path)
+
+    moscow = {'wikidata_id': 'Q649', 'url': 'https://ru.wikipedia.org/wiki/%D0%9C%D0%BE%D1%81%D0%BA%D0%B2%D0%B0'}
+    assert title_map.get(('Москва', 'ru')) == moscow
+    assert title_map.get(('мск', 'ru')) == moscow
+    assert title_map.get(('Нет ссылки', 'ru')) is None
+    assert title_map.get(('Москва', 'es')) is None
+    assert title_map.get(('madrid', 'es')) == {'wikidata_id': 'Q2807', 'url': 'https://es.wikipedia.org/wiki/Madrid'}
+    assert title_map.get(('Nowhere', 'es'), {}) == {}
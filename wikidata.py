@@ -1,23 +1,23 @@
 import re
-import os
-import json
-import requests
-from time import sleep
-from math import log
+import asyncio
+import argparse
 from collections import defaultdict
 
-from secrets import EMAIL
+from ranking import get_ranking
+from response_cache import TTL, ResponseCache
+from wikidata_client import MAX_CONCURRENCY, RATE, WikidataClient
+from wikidata_stats import (
+    GEO_LOC,
+    GEO_REGION,
+    get_entity_info,
+    load_unique_locations,
+    save_stats
+)
 
 
-DATA_DIR = 'intermediate_data_files'
-LOC_INFO_FILENAME = os.path.join(DATA_DIR, 'wikidata_locations_info.json')
-RANKING_FILENAME = os.path.join(DATA_DIR, 'wikidata_ranking.json')
-NORM_LOC_FILENAME = os.path.join(DATA_DIR, 'locations_normalized.json')
-COEFS_FILENAME = 'coefficients.json'
-
 SPARQL_URL = 'https://query.wikidata.org/sparql'  # for SPARQL queries
-ENTITY_URL = 'https://www.wikidata.org/wiki/Special:EntityData/%s.json'  # for retrieving entities by ID
-USER_AGENT = {'User-Agent': f'Location extractor ({EMAIL})'}  # to avoid ban
+API_URL = 'https://www.wikidata.org/w/api.php'  # for retrieving entities by ID (wbgetentities)
+HEAVY_QUERY_TIMEOUT = 60  # seconds
 
 
 # limit entities to subclasses of
@@ -29,9 +29,6 @@ USER_AGENT = {'User-Agent': f'Location extractor ({EMAIL})'}  # to avoid ban
 # limit search and output to relevant language;
 # output id, primary label, and all aliases.
 
-GEO_REGION = 'Q82794'
-GEO_LOC = 'Q2221906'
-
 HEAVY_CANDIDATE_QUERY = """
 SELECT DISTINCT ?locId ?label ?altLabel WHERE {
   ?loc wdt:P31/wdt:P279* wd:%s .
@@ -80,6 +77,33 @@ SELECT DISTINCT (COUNT(?entity) AS ?entityCount) WHERE {
 """
 
 
+# the same for many entities at once;
+# entities without links are missing from the output
+
+BATCH_LINKS_QUERY = """
+SELECT ?target (COUNT(?entity) AS ?entityCount) WHERE {
+  VALUES ?target { %s }
+  ?entity ?property ?target .
+  ?prop wikibase:directClaim ?property .
+}
+GROUP BY ?target
+"""
+
+# Batches of entities for BATCH_LINKS_QUERY are limited by the number of entities
+# and by the total number of their sitelinks: popular entities have many links
+# and are slow to count, so they go in smaller batches.
+# A batch that times out is split in two.
+LINKS_BATCH_SIZE = 50
+LINKS_BATCH_WEIGHT = 500
+LINKS_QUERY_TIMEOUT = 60  # seconds
+
+# wbgetentities returns up to 50 entities per request;
+# only parts of the entity used in `get_entity_info` are requested
+# (all languages, since labels, descriptions and aliases are counted in all of them).
+ENTITIES_BATCH_SIZE = 50
+ENTITY_PROPS = 'labels|descriptions|aliases|claims|sitelinks/urls'
+
+
 def create_loc_regexes(loc):
     """
     Create regexes for general and bracketed locations.
@@ -89,7 +113,7 @@ def create_loc_regexes(loc):
     return loc_regex, loc_regex_brackets
 
 
-def get_candidates(ancestor_id, loc_name, lang, loc_regex, loc_regex_brackets):
+async def get_candidates(client, ancestor_id, loc_name, lang, loc_regex, loc_regex_brackets):
     """
     Query Wikidata by location name and language.
     Filter and reformat results.
@@ -98,25 +122,25 @@ def get_candidates(ancestor_id, loc_name, lang, loc_regex, loc_regex_brackets):
     light_query = LIGHT_CANDIDATE_QUERY % (ancestor_id, loc_name, lang, lang)
 
     try:
-        r = requests.get(
+        r = await client.get_json(
             SPARQL_URL,
             params={'format': 'json', 'query': heavy_query},
-            headers=USER_AGENT,
-            timeout=60
+            timeout=HEAVY_QUERY_TIMEOUT,
+            retry_timeouts=False
         )
 
     # If heavy query timeouts (too many objects to retrieve),
     # the entity is large and famous (e.g. capital or country),
     # so run lighter exact match query.
-    except requests.exceptions.Timeout:
+    except asyncio.TimeoutError:
         print(f'Heavy query timeout: {loc_name}, {lang}. Trying exact query')
-        r = requests.get(
+        r = await client.get_json(
             SPARQL_URL,
             params={'format': 'json', 'query': light_query},
-            headers=USER_AGENT
+            timeout=None
         )
 
-    candidates = r.json()['results']['bindings']
+    candidates = r['results']['bindings']
     candidates = [
         c['locId']['value'] for c in candidates
         if not is_bracketed(c, loc_regex, loc_regex_brackets)
@@ -136,189 +160,257 @@ def is_bracketed(data, loc_regex, loc_regex_brackets):
     return n_locs == n_locs_brackets
 
 
-def get_entity(entity_id):
+async def get_entities_batch(client, entity_ids):
     """
-    Retrieve Wikidata entity by id.
+    Retrieve up to ENTITIES_BATCH_SIZE Wikidata entities by ids with one request.
+    Missing entities are skipped; redirected ones are returned by the requested id.
     """
-    data = requests.get(
-        ENTITY_URL % entity_id,
-        headers=USER_AGENT
-    ).json()['entities'][entity_id]
-    return data
+    data = await client.get_json(
+        API_URL,
+        params={
+            'action': 'wbgetentities',
+            'ids': '|'.join(entity_ids),
+            'props': ENTITY_PROPS,
+            'format': 'json'
+        }
+    )
+
+    entities = {}
+    for entity_id, entity in data['entities'].items():
+        if 'missing' in entity:
+            continue
+        entity_id = entity.get('redirects', {}).get('from', entity_id)
+        entities[entity_id] = entity
+    return entities
+
+
+async def get_entities(client, entity_ids):
+    """Retrieve Wikidata entities by ids in batches."""
+    batches = [
+        entity_ids[i:i + ENTITIES_BATCH_SIZE]
+        for i in range(0, len(entity_ids), ENTITIES_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*[
+        get_entities_batch(client, batch) for batch in batches
+    ])
+    return {
+        entity_id: entity
+        for batch_entities in results
+        for entity_id, entity in batch_entities.items()
+    }
 
 
-def get_n_links(entity_id):
+async def get_n_links(client, entity_id):
     """
     Get number of links TO the entity.
     """
     l_query = LINKS_QUERY % entity_id
-    l_r = requests.get(
+    l_r = await client.get_json(
         SPARQL_URL,
-        params={'format': 'json', 'query': l_query},
-        headers=USER_AGENT
-    ).json()
+        params={'format': 'json', 'query': l_query}
+    )
     n_links = int(l_r['results']['bindings'][0]['entityCount']['value'])
     return n_links
 
 
-def get_entity_info(lang, data, entity_id):
+async def get_location_candidates(client, loc, lang):
     """
-    Get all numbers characterizing entity "importance" and
-    and other details for later processing from full entity data.
+    Search candidates among geographic regions,
+    then among all geographic locations if nothing was found.
     """
-    info = {
-        'n_labels': len(data['labels']),
-        'n_descriptions': len(data['descriptions']),
-        'n_sitelinks': len(data['sitelinks']),
-        'n_aliases': sum(len(a) for a in data['aliases'].values()),
-        'n_statements': sum(len(s) for s in data['claims'].values()),
-        'n_qualifiers': sum(
-            len(claim.get('qualifiers', []))
-            for claims in data['claims'].values()
-            for claim in claims
-        ),
-        'n_references': sum(
-            len(claim.get('references', []))
-            for claims in data['claims'].values()
-            for claim in claims
-        ),
-        'n_links': get_n_links(entity_id),
-        'label': data['labels'].get(lang, {}).get('value'),
-        'aliases': [x['value'] for x in data['aliases'].get(lang, [])],
-        'wikipedia_url': data['sitelinks'].get(f'{lang}wiki', {}).get('url')
-    }
+    loc_regex, loc_regex_brackets = create_loc_regexes(loc)
+
+    candidates = await get_candidates(client, GEO_REGION, loc, lang, loc_regex, loc_regex_brackets)
+    if not candidates:
+        candidates = await get_candidates(client, GEO_LOC, loc, lang, loc_regex, loc_regex_brackets)
 
-    return info
+    print(loc)
+    return candidates
 
 
-def collect_candidates(unique_locations):
+async def collect_candidates(client, unique_locations):
     location_candidates = defaultdict(dict)
     unique_candidates = defaultdict(set)
 
     for lang, locs in unique_locations.items():
         print(f'Getting candidates for {lang}: {len(locs)} unique locations')
-        for i, loc in enumerate(locs):
-            print(loc)
-            if not i % 50:
-                sleep(2)
-
-            loc_regex, loc_regex_brackets = create_loc_regexes(loc)
-
-            candidates = get_candidates(GEO_REGION, loc, lang, loc_regex, loc_regex_brackets)
-            if not candidates:
-                candidates = get_candidates(GEO_LOC, loc, lang, loc_regex, loc_regex_brackets)
+        locs = sorted(locs)
+        all_candidates = await asyncio.gather(*[
+            get_location_candidates(client, loc, lang) for loc in locs
+        ])
 
+        for loc, candidates in zip(locs, all_candidates):
             location_candidates[lang][loc] = candidates
             unique_candidates[lang] |= set(candidates)
 
     return location_candidates, unique_candidates
 
 
-def get_candidates_stats(unique_candidates):
-    entities_data = defaultdict(dict)
-    for lang, entity_set in unique_candidates.items():
-        print(f'Getting stats for {lang}: {len(entity_set)} unique entities')
-        for i, entity_id in enumerate(entity_set):
-            if not i % 50:
-                sleep(2)
-
-            entity = get_entity(entity_id)
-            if entity is None:
-                continue
-
-            info = get_entity_info(lang, entity, entity_id)
-            if info['wikipedia_url'] is None:
-                continue
-
-            entities_data[lang][entity_id] = info
-
-    return entities_data
-
-
-def calculate_score(query, entity_info, coefs):
+def make_links_batches(entity_ids, weights):
     """
-    Calculate score based on entity stats
-    and optimal coefficients.
+    Split entities into batches for counting links,
+    limited by LINKS_BATCH_SIZE entities and LINKS_BATCH_WEIGHT total weight.
     """
-    if query == entity_info['label']:
-        coef = coefs['label']
-    elif query in entity_info['aliases']:
-        coef = coefs['aliases']
-    else:
-        coef = 1
-
-    stat_sum = 0
-    for key, value in coefs.items():
-        if key in ['label', 'aliases']:
-            continue
-
-        stat = entity_info[key]
-        stat = log(stat + 1) if value == 'log' else stat * value
-        stat_sum += stat
-
-    score = coef * stat_sum
-    return round(score, 3)
+    batches = []
+    batch = []
+    batch_weight = 0
+    for entity_id in entity_ids:
+        weight = weights.get(entity_id, 1)
+        if batch and (len(batch) == LINKS_BATCH_SIZE or batch_weight + weight > LINKS_BATCH_WEIGHT):
+            batches.append(batch)
+            batch = []
+            batch_weight = 0
+        batch.append(entity_id)
+        batch_weight += weight
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def get_n_links_batch(client, entity_ids):
+    """
+    Get numbers of links TO the entities with one query.
+    If the query times out, split the batch in two.
+    """
+    if len(entity_ids) == 1:
+        return {entity_ids[0]: await get_n_links(client, entity_ids[0])}
 
+    query = BATCH_LINKS_QUERY % ' '.join(f'wd:{entity_id}' for entity_id in entity_ids)
+    try:
+        r = await client.get_json(
+            SPARQL_URL,
+            params={'format': 'json', 'query': query},
+            timeout=LINKS_QUERY_TIMEOUT,
+            retry_timeouts=False
+        )
+    except asyncio.TimeoutError:
+        middle = len(entity_ids) // 2
+        left, right = await asyncio.gather(
+            get_n_links_batch(client, entity_ids[:middle]),
+            get_n_links_batch(client, entity_ids[middle:])
+        )
+        return {**left, **right}
 
-def score_candidates(location_candidates, candidates_stats, coefs):
-    scores = defaultdict(dict)
-    for lang, locs in location_candidates.items():
-        for loc, candidates in locs.items():
-            loc_scores = []
+    n_links = {entity_id: 0 for entity_id in entity_ids}
+    for row in r['results']['bindings']:
+        entity_id = row['target']['value'].rsplit('/', 1)[-1]
+        n_links[entity_id] = int(row['entityCount']['value'])
+    return n_links
 
-            for candidate_id in candidates:
-                candidate_info = candidates_stats[lang].get(candidate_id)
-                if candidate_info is None:
-                    continue
 
-                score = calculate_score(loc, candidate_info, coefs)
-                loc_scores.append([
-                    candidate_id,
-                    score,
-                    candidate_info['wikipedia_url']
-                ])
+async def get_links_counts(client, entity_ids, weights):
+    """Get numbers of links TO all entities in batches."""
+    batches = make_links_batches(entity_ids, weights)
+    print(f'Counting links: {len(entity_ids)} entities in {len(batches)} batches')
+    results = await asyncio.gather(*[
+        get_n_links_batch(client, batch) for batch in batches
+    ])
+    return {
+        entity_id: n_links
+        for batch_n_links in results
+        for entity_id, n_links in batch_n_links.items()
+    }
 
-            scores[lang][loc] = sorted(loc_scores, key=lambda x: x[1], reverse=True)
 
-    return scores
+async def get_candidates_stats(client, unique_candidates):
+    """
+    Get entity data for candidates in all languages at once,
+    then count links for entities with Wikipedia pages.
+    """
+    for lang, entity_set in unique_candidates.items():
+        print(f'Getting stats for {lang}: {len(entity_set)} unique entities')
 
+    all_entity_ids = sorted(set.union(set(), *unique_candidates.values()))
+    all_entities = await get_entities(client, all_entity_ids)
 
-def get_stats():
-    with open(NORM_LOC_FILENAME) as f:
-        unique_locations = {
-            lang: set(locs.values())
-            for lang, locs in json.load(f).items()
+    # entities without Wikipedia page are not used
+    entities = {
+        lang: {
+            entity_id: all_entities[entity_id]
+            for entity_id in sorted(entity_set)
+            if entity_id in all_entities
+            and f'{lang}wiki' in all_entities[entity_id]['sitelinks']
         }
+        for lang, entity_set in unique_candidates.items()
+    }
 
-    location_candidates, unique_candidates = collect_candidates(unique_locations)
-    candidates_stats = get_candidates_stats(unique_candidates)
-
-    with open(LOC_INFO_FILENAME, 'w') as f:
-        json.dump(
-            {
-                'candidates': location_candidates,
-                'stats': candidates_stats
-            },
-            f,
-            ensure_ascii=False
-        )
-
+    weights = {}
+    for lang_entities in entities.values():
+        for entity_id, entity in lang_entities.items():
+            weights[entity_id] = len(entity['sitelinks']) + 1
+    n_links = await get_links_counts(client, sorted(weights), weights)
 
-def get_ranking():
-    with open(LOC_INFO_FILENAME) as f:
-        info = json.load(f)
+    entities_data = defaultdict(dict)
+    for lang, lang_entities in entities.items():
+        for entity_id, entity in lang_entities.items():
+            info = get_entity_info(lang, entity, n_links[entity_id])
+            if info['wikipedia_url'] is None:
+                continue
 
-    with open(COEFS_FILENAME) as f:
-        coefs = json.load(f)
+            entities_data[lang][entity_id] = info
 
-    scores = score_candidates(info['candidates'], info['stats'], coefs)
+    return entities_data
 
-    with open(RANKING_FILENAME, 'w') as f:
-        json.dump(scores, f, indent=2, ensure_ascii=False)
 
-    return scores
+def get_user_agent():
+    """User agent with the contact email from `secrets.py`, to avoid ban."""
+    from secrets import EMAIL
+    return {'User-Agent': f'Location extractor ({EMAIL})'}
+
+
+async def collect_stats(unique_locations, concurrency=MAX_CONCURRENCY, rate=RATE, cache=None):
+    async with WikidataClient(get_user_agent(), concurrency, rate, cache=cache) as client:
+        location_candidates, unique_candidates = await collect_candidates(client, unique_locations)
+        candidates_stats = await get_candidates_stats(client, unique_candidates)
+    return location_candidates, candidates_stats
+
+
+def get_stats(concurrency=MAX_CONCURRENCY, rate=RATE, cache=None):
+    unique_locations = load_unique_locations()
+    location_candidates, candidates_stats = asyncio.run(
+        collect_stats(unique_locations, concurrency, rate, cache)
+    )
+    save_stats(location_candidates, candidates_stats)
+
+
+def main(argv=None):
+    global SPARQL_URL, API_URL
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'step',
+        nargs='?',
+        choices=['stats', 'ranking'],
+        help='run only one step: collect candidates with stats or rank them'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=MAX_CONCURRENCY,
+        help='max simultaneous requests to Wikidata'
+    )
+    parser.add_argument('--rate', type=float, default=RATE, help='max requests per second')
+    parser.add_argument('--sparql-url', default=SPARQL_URL, help='SPARQL endpoint (e.g. a local stand-in)')
+    parser.add_argument('--api-url', default=API_URL, help='Wikibase API endpoint (e.g. a local stand-in)')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the response cache')
+    parser.add_argument('--cache-ttl', type=float, default=TTL, help='max age of cached responses, in seconds')
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='only replay cached responses; fail on cache misses'
+    )
+    args = parser.parse_args(argv)
+
+    SPARQL_URL = args.sparql_url
+    API_URL = args.api_url
+
+    if args.step != 'ranking':
+        cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl, offline=args.offline)
+        get_stats(args.concurrency, args.rate, cache)
+    if args.step != 'stats':
+        get_ranking()
 
 
 if __name__ == '__main__':
-    get_stats()
-    get_ranking()
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import random
+from time import monotonic
+
+import aiohttp
+
+from response_cache import MISSING
+
+
+# Asynchronous HTTP client for Wikidata (SPARQL endpoint and Wikibase API):
+# one pooled session, limited number of simultaneous requests,
+# token-bucket rate limit shared by all requests,
+# retries with exponential backoff on 429/5xx, connection errors and timeouts.
+# Endpoint URLs are passed by the caller, so the client can be pointed
+# to a local stand-in server.
+# With a ResponseCache, responses are replayed from disk when possible.
+
+
+MAX_CONCURRENCY = 5  # WDQS allows 5 parallel queries per IP
+RATE = 5  # requests per second
+BURST = 5  # requests that can be sent at once after a pause
+TIMEOUT = 60  # seconds
+MAX_RETRIES = 5
+BACKOFF = 1  # seconds before the first retry, doubled after each one
+MAX_BACKOFF = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# cached instead of a response when a request without timeout retries
+# timed out, so that the timeout (and the fallback) is replayed
+TIMEOUT_MARKER = {'__timeout__': True}
+
+
+class TokenBucket:
+    """
+    Allow `rate` acquisitions per second on average
+    and at most `capacity` at once.
+    """
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def get_retry_delay(attempt, response=None):
+    """
+    Delay before retry number `attempt` (from 0):
+    `Retry-After` of the response if given, else exponential backoff with jitter.
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(int(retry_after), MAX_BACKOFF)
+    delay = min(BACKOFF * 2 ** attempt, MAX_BACKOFF)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class WikidataClient:
+    """
+    Usage:
+        async with WikidataClient(headers) as client:
+            data = await client.get_json(url, params)
+    """
+    def __init__(
+            self,
+            headers=None,
+            concurrency=MAX_CONCURRENCY,
+            rate=RATE,
+            timeout=TIMEOUT,
+            max_retries=MAX_RETRIES,
+            cache=None
+    ):
+        self.headers = headers or {}
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, max(1, min(BURST, concurrency)))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=self.concurrency)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def get_json(self, url, params=None, timeout=-1, retry_timeouts=True):
+        """
+        GET `url` and decode JSON response.
+        `timeout` overrides the default timeout (None for no timeout).
+        If `retry_timeouts` is False, asyncio.TimeoutError is raised
+        on the first timeout (e.g. to fall back to a lighter query).
+        """
+        if self.cache is not None:
+            response = self.cache.get(url, params, MISSING)
+            if response == TIMEOUT_MARKER:
+                raise asyncio.TimeoutError
+            if response is not MISSING:
+                return response
+
+        response = await self.request_json(url, params, timeout, retry_timeouts)
+        if self.cache is not None:
+            self.cache.set(url, params, response)
+        return response
+
+    async def request_json(self, url, params=None, timeout=-1, retry_timeouts=True):
+        """Send the request with rate limit and retries."""
+        timeout = aiohttp.ClientTimeout(total=self.timeout if timeout == -1 else timeout)
+
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            await self.bucket.acquire()
+            async with self.semaphore:
+                try:
+                    async with self.session.get(url, params=params, timeout=timeout) as r:
+                        if r.status in RETRY_STATUSES and not is_last:
+                            delay = get_retry_delay(attempt, r)
+                        else:
+                            r.raise_for_status()
+                            return await r.json(content_type=None)
+                except asyncio.TimeoutError:
+                    if not retry_timeouts and self.cache is not None:
+                        self.cache.set(url, params, TIMEOUT_MARKER)
+                    if not retry_timeouts or is_last:
+                        raise
+                    delay = get_retry_delay(attempt)
+                except aiohttp.ClientConnectionError:
+                    if is_last:
+                        raise
+                    delay = get_retry_delay(attempt)
+
+            # sleep outside the semaphore to let other requests go
+            await asyncio.sleep(delay)
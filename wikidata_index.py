@@ -0,0 +1,289 @@
+import re
+import os
+import bz2
+import gzip
+import json
+import sqlite3
+import argparse
+from urllib.parse import quote
+from collections import defaultdict
+
+from wikidata_stats import (
+    DATA_DIR,
+    GEO_LOC,
+    GEO_REGION,
+    get_entity_info,
+    load_unique_locations,
+    save_stats
+)
+
+
+# Offline alternative to SPARQL / Wikibase API for `wikidata.py stats`.
+# `build` streams a Wikidata JSON dump (or a filtered subset of it; .bz2, .gz or plain),
+# keeps geographic entities (P31/P279* of GEO_REGION or GEO_LOC)
+# and writes a SQLite index: ru/es labels and aliases -> entity ids,
+# and `get_entity_info` stats of entities with Wikipedia pages.
+# `stats` collects candidates and their stats from the index.
+#
+# The dump is read in three passes:
+# 1) subclass tree (P279) to find all geographic classes;
+# 2) geographic entities (P31 of these classes) with names and stats;
+# 3) incoming links to geographic entities (as LINKS_QUERY: truthy statements).
+#
+# Candidate search is approximated: a location matches a label or an alias
+# equal to it case-insensitively, also ignoring parenthesized qualifiers
+# (`Москва (река)` matches `Москва`). Fulltext search of HEAVY_CANDIDATE_QUERY
+# may also find labels where the location is only a part of the name.
+
+
+INDEX_FILENAME = os.path.join(DATA_DIR, 'wikidata_index.sqlite')
+WIKILANGS = ['ru', 'es']
+WIKIPEDIA_URL = 'https://%s.wikipedia.org/wiki/%s'
+
+SPACE_REGEX = re.compile(r'\s+')
+QUALIFIER_REGEX = re.compile(r'\s*\([^)]*\)')
+
+
+def open_dump(path):
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def iter_dump(path, marker=None):
+    """
+    Iterate over entities of a JSON dump (one entity per line inside a JSON array).
+    Lines without `marker` substring are skipped without parsing.
+    """
+    with open_dump(path) as f:
+        for line in f:
+            line = line.rstrip().rstrip(',')
+            if line in ['[', ']', '']:
+                continue
+            if marker is not None and marker not in line:
+                continue
+            yield json.loads(line)
+
+
+def get_truthy_values(entity, prop):
+    """
+    Ids of entities that are values of truthy statements of the property
+    (statements of the best non-deprecated rank), as `wdt:` in SPARQL.
+    """
+    claims = entity.get('claims', {}).get(prop, [])
+    ranks = {claim.get('rank', 'normal') for claim in claims}
+    best_rank = 'preferred' if 'preferred' in ranks else 'normal'
+
+    values = []
+    for claim in claims:
+        if claim.get('rank', 'normal') != best_rank:
+            continue
+        snak = claim['mainsnak']
+        if snak.get('snaktype') != 'value' or snak['datavalue']['type'] != 'wikibase-entityid':
+            continue
+        values.append(snak['datavalue']['value']['id'])
+    return values
+
+
+def get_subclasses(subclass_tree, root):
+    """All subclasses of the root (including itself)."""
+    subclasses = {root}
+    to_visit = [root]
+    while to_visit:
+        for child in subclass_tree.get(to_visit.pop(), []):
+            if child not in subclasses:
+                subclasses.add(child)
+                to_visit.append(child)
+    return subclasses
+
+
+def get_geo_classes(dump_path):
+    """Pass 1: subclasses of geographic region and geographic location."""
+    subclass_tree = defaultdict(list)
+    for entity in iter_dump(dump_path, marker='"P279"'):
+        for parent in get_truthy_values(entity, 'P279'):
+            subclass_tree[parent].append(entity['id'])
+
+    return get_subclasses(subclass_tree, GEO_REGION), get_subclasses(subclass_tree, GEO_LOC)
+
+
+def normalize_name(name):
+    return SPACE_REGEX.sub(' ', name).strip().lower()
+
+
+def get_name_keys(name):
+    """Keys to find the entity by its label or alias."""
+    name = normalize_name(name)
+    keys = {name, normalize_name(QUALIFIER_REGEX.sub('', name))}
+    return keys - {''}
+
+
+def add_sitelink_urls(entity):
+    """Add Wikipedia URLs to sitelinks (the dump has only titles)."""
+    for lang in WIKILANGS:
+        sitelink = entity.get('sitelinks', {}).get(f'{lang}wiki')
+        if sitelink is not None and 'url' not in sitelink:
+            sitelink['url'] = WIKIPEDIA_URL % (lang, quote(sitelink['title'].replace(' ', '_')))
+
+
+def create_tables(conn):
+    conn.executescript('''
+        DROP TABLE IF EXISTS names;
+        DROP TABLE IF EXISTS entities;
+        DROP TABLE IF EXISTS links;
+        CREATE TABLE names (lang TEXT, name TEXT, entity_id TEXT, is_region INTEGER);
+        CREATE TABLE entities (entity_id TEXT, lang TEXT, info TEXT, PRIMARY KEY (entity_id, lang));
+        CREATE TABLE links (entity_id TEXT PRIMARY KEY, n_links INTEGER);
+    ''')
+
+
+def index_entities(conn, dump_path, region_classes, location_classes):
+    """
+    Pass 2: write names and stats (without links) of geographic entities.
+    Return ids of geographic entities.
+    """
+    geo_ids = set()
+    for entity in iter_dump(dump_path, marker='"P31"'):
+        classes = set(get_truthy_values(entity, 'P31'))
+        is_region = bool(classes & region_classes)
+        if not is_region and not classes & location_classes:
+            continue
+
+        entity_id = entity['id']
+        geo_ids.add(entity_id)
+
+        names = []
+        for lang in WIKILANGS:
+            lang_names = [entity.get('labels', {}).get(lang, {}).get('value')]
+            lang_names += [a['value'] for a in entity.get('aliases', {}).get(lang, [])]
+            keys = {key for name in lang_names if name for key in get_name_keys(name)}
+            names += [(lang, key, entity_id, is_region) for key in keys]
+        conn.executemany('INSERT INTO names VALUES (?, ?, ?, ?)', names)
+
+        add_sitelink_urls(entity)
+        for lang in WIKILANGS:
+            if f'{lang}wiki' not in entity.get('sitelinks', {}):
+                continue
+            info = get_entity_info(lang, entity, None)
+            conn.execute(
+                'INSERT OR REPLACE INTO entities VALUES (?, ?, ?)',
+                (entity_id, lang, json.dumps(info, ensure_ascii=False))
+            )
+
+    return geo_ids
+
+
+def index_links(conn, dump_path, geo_ids):
+    """
+    Pass 3: count links to geographic entities:
+    distinct (entity, property) pairs with a truthy statement pointing to it.
+    """
+    n_links = defaultdict(int)
+    for entity in iter_dump(dump_path):
+        for prop in entity.get('claims', {}):
+            for target in set(get_truthy_values(entity, prop)):
+                if target in geo_ids:
+                    n_links[target] += 1
+
+    conn.executemany('INSERT INTO links VALUES (?, ?)', n_links.items())
+
+
+def build_index(dump_path, index_path=INDEX_FILENAME):
+    region_classes, location_classes = get_geo_classes(dump_path)
+    print(f'{len(region_classes)} region classes, {len(location_classes)} location classes')
+
+    conn = sqlite3.connect(index_path)
+    create_tables(conn)
+
+    geo_ids = index_entities(conn, dump_path, region_classes, location_classes)
+    print(f'{len(geo_ids)} geographic entities')
+    index_links(conn, dump_path, geo_ids)
+
+    conn.execute('CREATE INDEX names_idx ON names (lang, name)')
+    conn.commit()
+    conn.close()
+
+
+def entity_sort_key(entity_id):
+    return int(entity_id[1:]) if entity_id[1:].isdigit() else entity_id
+
+
+def find_candidates(conn, loc, lang):
+    """
+    Candidates among geographic regions,
+    or among all geographic locations if nothing was found
+    (as in `wikidata.get_location_candidates`).
+    """
+    rows = conn.execute(
+        'SELECT entity_id, is_region FROM names WHERE lang = ? AND name = ?',
+        (lang, normalize_name(loc))
+    ).fetchall()
+
+    candidates = {entity_id for entity_id, is_region in rows if is_region}
+    if not candidates:
+        candidates = {entity_id for entity_id, _ in rows}
+    return sorted(candidates, key=entity_sort_key)
+
+
+def get_entity_stats(conn, entity_id, lang):
+    """Stats of the entity as in `wikidata_stats.get_entity_info`, or None."""
+    row = conn.execute(
+        'SELECT info, n_links FROM entities LEFT JOIN links USING (entity_id) '
+        'WHERE entity_id = ? AND lang = ?',
+        (entity_id, lang)
+    ).fetchone()
+    if row is None:
+        return None
+
+    info = json.loads(row[0])
+    info['n_links'] = row[1] or 0
+    return info
+
+
+def collect_stats(unique_locations, index_path=INDEX_FILENAME):
+    """Offline version of `wikidata.collect_stats`."""
+    conn = sqlite3.connect(index_path)
+
+    location_candidates = defaultdict(dict)
+    candidates_stats = defaultdict(dict)
+    for lang, locs in unique_locations.items():
+        print(f'Getting candidates for {lang}: {len(locs)} unique locations')
+        for loc in sorted(locs):
+            candidates = find_candidates(conn, loc, lang)
+            location_candidates[lang][loc] = candidates
+
+            for entity_id in candidates:
+                if entity_id in candidates_stats[lang]:
+                    continue
+                info = get_entity_stats(conn, entity_id, lang)
+                if info is not None and info['wikipedia_url'] is not None:
+                    candidates_stats[lang][entity_id] = info
+
+    conn.close()
+    return location_candidates, candidates_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'command',
+        choices=['build', 'stats'],
+        help='build the index from a dump or collect candidates with stats from the index'
+    )
+    parser.add_argument('dump', nargs='?', help='Wikidata JSON dump (.json, .json.gz or .json.bz2) for `build`')
+    parser.add_argument('--index', default=INDEX_FILENAME, help='path to the index')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        if args.dump is None:
+            parser.error('dump is required for build')
+        build_index(args.dump, args.index)
+    else:
+        location_candidates, candidates_stats = collect_stats(load_unique_locations(), args.index)
+        save_stats(location_candidates, candidates_stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import os
+import json
+
+from ranking import DATA_DIR, LOC_INFO_FILENAME
+
+
+# Parts of the `stats` step shared by `wikidata.py` (Wikidata endpoints)
+# and `wikidata_index.py` (offline dump index): geographic classes
+# of candidates, stats of an entity, and input / output files.
+# Importing it needs no network configuration (`secrets.py`).
+
+
+NORM_LOC_FILENAME = os.path.join(DATA_DIR, 'locations_normalized.json')
+
+# wd:Q82794 - `geographic region`, wd:Q2221906 - `geographic location`
+GEO_REGION = 'Q82794'
+GEO_LOC = 'Q2221906'
+
+
+def get_entity_info(lang, data, n_links):
+    """
+    Get all numbers characterizing entity "importance" and
+    and other details for later processing from full entity data.
+    """
+    info = {
+        'n_labels': len(data['labels']),
+        'n_descriptions': len(data['descriptions']),
+        'n_sitelinks': len(data['sitelinks']),
+        'n_aliases': sum(len(a) for a in data['aliases'].values()),
+        'n_statements': sum(len(s) for s in data['claims'].values()),
+        'n_qualifiers': sum(
+            len(claim.get('qualifiers', []))
+            for claims in data['claims'].values()
+            for claim in claims
+        ),
+        'n_references': sum(
+            len(claim.get('references', []))
+            for claims in data['claims'].values()
+            for claim in claims
+        ),
+        'n_links': n_links,
+        'label': data['labels'].get(lang, {}).get('value'),
+        'aliases': [x['value'] for x in data['aliases'].get(lang, [])],
+        'wikipedia_url': data['sitelinks'].get(f'{lang}wiki', {}).get('url')
+    }
+
+    return info
+
+
+def load_unique_locations():
+    with open(NORM_LOC_FILENAME) as f:
+        unique_locations = {
+            lang: set(locs.values())
+            for lang, locs in json.load(f).items()
+        }
+    return unique_locations
+
+
+def save_stats(location_candidates, candidates_stats):
+    with open(LOC_INFO_FILENAME, 'w') as f:
+        json.dump(
+            {
+                'candidates': location_candidates,
+                'stats': candidates_stats
+            },
+            f,
+            ensure_ascii=False
+        )
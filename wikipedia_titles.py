@@ -0,0 +1,178 @@
+import os
+import re
+import gzip
+import json
+import sqlite3
+import argparse
+from urllib.parse import quote
+
+import marisa_trie
+
+
+# Offline map of ru/es Wikipedia titles (with redirects) to Wikidata IDs and URLs,
+# to resolve mGENRE titles in `GENRE.ipynb` without Wikipedia API.
+# The map is built from Wikipedia SQL dumps (`page`, `page_props`, `redirect` tables)
+# and / or from Wikipedia API responses in the response cache (`response_cache.py`),
+# saved in marisa format and memory-mapped on load.
+
+
+TITLE_MAP_FILENAME = os.path.join('intermediate_data_files', 'wikipedia_titles.marisa')
+WIKILANGS = ['ru', 'es']
+DUMP_FILENAME = '%swiki-latest-%s.sql.gz'  # (lang, table)
+
+WIKIPEDIA_URL = 'https://%s.wikipedia.org/wiki/%s'
+URL_SAFE_CHARS = ';@$!*(),/~:'  # not escaped in Wikipedia URLs
+API_URL_REGEX = re.compile(r'^https://(\w+)\.wikipedia\.org/w/api\.php$')
+
+SQL_TOKEN_REGEX = re.compile(r"\(|\)|,|'(?:[^'\\]|\\.)*'|[^,()']+")
+SQL_ESCAPE_REGEX = re.compile(r'\\(.)')
+SQL_ESCAPES = {'0': '\0', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+
+def normalize_title(title):
+    """Title as Wikipedia shows it: spaces instead of underscores, first letter capitalized."""
+    title = title.replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+def get_url(lang, title):
+    return WIKIPEDIA_URL % (lang, quote(title.replace(' ', '_'), safe=URL_SAFE_CHARS))
+
+
+def parse_sql_value(token):
+    if token.startswith("'"):
+        return SQL_ESCAPE_REGEX.sub(lambda m: SQL_ESCAPES.get(m.group(1), m.group(1)), token[1:-1])
+    return None if token == 'NULL' else token
+
+
+def iter_sql_rows(path, table):
+    """Yield rows (tuples of strings / None) of INSERT statements of a SQL dump."""
+    prefix = f'INSERT INTO `{table}` VALUES '
+    with gzip.open(path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not line.startswith(prefix):
+                continue
+            row = None
+            for token in SQL_TOKEN_REGEX.findall(line, len(prefix)):
+                if token == '(':
+                    row = []
+                elif token == ')':
+                    yield row
+                    row = None
+                elif row is not None and token != ',':
+                    row.append(parse_sql_value(token))
+
+
+def iter_dump_titles(lang, dump_dir):
+    """Yield (title, (wikidata_id, url)) of articles and redirects to them from dumps."""
+    dump_path = lambda table: os.path.join(dump_dir, DUMP_FILENAME % (lang, table))
+
+    titles = {}  # page id -> title of articles and redirects (main namespace)
+    for row in iter_sql_rows(dump_path('page'), 'page'):
+        if row[1] == '0':
+            titles[row[0]] = normalize_title(row[2])
+
+    links = {}
+    for row in iter_sql_rows(dump_path('page_props'), 'page_props'):
+        if row[1] == 'wikibase_item' and row[0] in titles:
+            title = titles[row[0]]
+            links[title] = (row[2], get_url(lang, title))
+
+    redirects = {}
+    for row in iter_sql_rows(dump_path('redirect'), 'redirect'):
+        if row[1] == '0' and row[0] in titles and not row[3]:
+            target = normalize_title(row[2])
+            if target in links:
+                redirects[titles[row[0]]] = links[target]
+
+    yield from links.items()
+    yield from redirects.items()
+
+
+def iter_cached_titles(cache_path):
+    """
+    Yield (lang, title, (wikidata_id, url)) from cached responses
+    of Wikipedia API `prop=pageprops|info` queries (see `GENRE.ipynb`),
+    including normalized and redirected titles of the requests.
+    """
+    conn = sqlite3.connect(cache_path)
+    for request, response in conn.execute('SELECT request, response FROM responses'):
+        endpoint = json.loads(request)[0]
+        match = API_URL_REGEX.match(endpoint)
+        query = json.loads(response).get('query', {}) if match else {}
+        if 'pages' not in query:
+            continue
+
+        lang = match.group(1)
+        links = {}
+        for page_id, page in query['pages'].items():
+            wikidata_id = page.get('pageprops', {}).get('wikibase_item')
+            if not page_id.startswith('-') and wikidata_id is not None:
+                links[page['title']] = (wikidata_id, page['fullurl'])
+
+        # request title -> normalized title -> redirect target
+        for key in ['redirects', 'normalized']:
+            for item in query.get(key, []):
+                if item['to'] in links:
+                    links[item['from']] = links[item['to']]
+
+        for title, link in links.items():
+            yield lang, title, link
+    conn.close()
+
+
+def build_title_map(dump_dir=None, cache_path=None, path=TITLE_MAP_FILENAME):
+    """Save the map from dumps and / or cached responses (dumps take precedence)."""
+    links = {}
+    if cache_path is not None:
+        for lang, title, link in iter_cached_titles(cache_path):
+            if lang in WIKILANGS:
+                links[(lang, normalize_title(title))] = link
+    if dump_dir is not None:
+        for lang in WIKILANGS:
+            for title, link in iter_dump_titles(lang, dump_dir):
+                links[(lang, title)] = link
+
+    trie = marisa_trie.BytesTrie(
+        (f'{lang}:{title}', '\t'.join(link).encode('utf-8'))
+        for (lang, title), link in links.items()
+    )
+    trie.save(path)
+    print(f'{len(links)} titles saved to {path}')
+
+
+class TitleMap:
+    """
+    Memory-mapped map built by `build_title_map`.
+    `get((title, lang))` returns {'wikidata_id': ..., 'url': ...} or None.
+    """
+    def __init__(self, path=TITLE_MAP_FILENAME):
+        self.trie = marisa_trie.BytesTrie()
+        self.trie.mmap(path)
+
+    def get(self, key, default=None):
+        title, lang = key
+        values = self.trie.get(f'{lang}:{normalize_title(title)}')
+        if not values:
+            return default
+        wikidata_id, url = values[0].decode('utf-8').split('\t')
+        return {'wikidata_id': wikidata_id, 'url': url}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build offline map of Wikipedia titles to Wikidata IDs')
+    parser.add_argument(
+        '--dump-dir',
+        help=f'folder with {DUMP_FILENAME % ("{ru,es}", "{page,page_props,redirect}")} dumps'
+    )
+    parser.add_argument('--cache', help='response cache with Wikipedia API responses (GENRE.ipynb)')
+    parser.add_argument('--output', default=TITLE_MAP_FILENAME)
+    args = parser.parse_args(argv)
+
+    if args.dump_dir is None and args.cache is None:
+        parser.error('--dump-dir or --cache is required')
+    build_title_map(args.dump_dir, args.cache, args.output)
+
+
+if __name__ == '__main__':
+    main()